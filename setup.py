@@ -41,4 +41,5 @@ setup(name="ecdsa",
           "Programming Language :: Python :: 3.8",
       ],
       install_requires=['six'],
+      extras_require={'gmpy2': ['gmpy2']},
       )
@@ -5,6 +5,28 @@ import sys
 from six import integer_types
 
 
+def slots_getstate(obj):
+    """
+    Return the values of all the __slots__ of the object, for pickling.
+
+    Classes that use __slots__ don't have a __dict__, so without a
+    __getstate__() method they can't be pickled with protocols 0 and 1
+    (or with any protocol on Python 2).
+    """
+    state = {}
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            if name != "__weakref__" and hasattr(obj, name):
+                state[name] = getattr(obj, name)
+    return state
+
+
+def slots_setstate(obj, state):
+    """Restore the object from the value of :func:`slots_getstate`."""
+    for name, value in state.items():
+        setattr(obj, name, value)
+
+
 def str_idx_as_int(string, index):
     """Take index'th byte from string, return as integer"""
     val = string[index]
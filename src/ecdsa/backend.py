@@ -0,0 +1,91 @@
+"""
+Selection of the implementation of the big integer arithmetic.
+
+By default the library uses the Python integers. If the gmpy2_ package
+is installed, the modular inversions, exponentiations, Jacobi symbols and
+point multiplications use its ``mpz`` integers instead, which is several
+times faster for the sizes of numbers used by elliptic curves. The
+results, and the types of values returned by the library, are the same
+with either backend.
+
+The backend is selected when the library is imported, by the
+``ECDSA_BACKEND`` environment variable: "auto" (the default) uses gmpy2
+if it is installed, "gmpy2" or "python" select the backend explicitly.
+It can be changed later with :func:`set_backend`::
+
+    from ecdsa import backend
+
+    backend.set_backend("python")
+
+.. _gmpy2: https://pypi.org/project/gmpy2/
+"""
+
+import os
+import warnings
+
+try:
+    import gmpy2
+except ImportError:  # pragma: no cover
+    gmpy2 = None
+
+
+__all__ = ["BACKENDS", "ENV_VAR", "available_backends", "get_backend",
+           "set_backend"]
+
+
+BACKENDS = ("python", "gmpy2")
+"""Names of all the supported backends."""
+
+ENV_VAR = "ECDSA_BACKEND"
+"""Name of the environment variable selecting the backend on import."""
+
+GMPY = False
+"""True if the gmpy2 backend is in use; checked by the hot paths."""
+
+if gmpy2 is not None:
+    mpz = gmpy2.mpz
+    mpz_type = type(gmpy2.mpz(0))
+    invert = gmpy2.invert
+    jacobi = gmpy2.jacobi
+else:  # pragma: no cover
+    mpz = mpz_type = invert = jacobi = None
+
+
+def available_backends():
+    """Return the names of the backends that can be used."""
+    if gmpy2 is None:  # pragma: no cover
+        return ("python",)
+    return BACKENDS
+
+
+def get_backend():
+    """Return the name of the backend in use."""
+    return "gmpy2" if GMPY else "python"
+
+
+def set_backend(name="auto"):
+    """
+    Select the implementation of the big integer arithmetic.
+
+    :param str name: "python", "gmpy2" or "auto" to use gmpy2 if it's
+        available
+
+    :raises ValueError: if the backend is unknown or not available
+    """
+    global GMPY
+
+    if name == "auto":
+        name = available_backends()[-1]
+    if name not in BACKENDS:
+        raise ValueError("Unknown backend: {0!r}, supported backends: {1}"
+                         .format(name, ", ".join(BACKENDS)))
+    if name not in available_backends():  # pragma: no cover
+        raise ValueError("Backend {0!r} is not available, install the {0} "
+                         "package".format(name))
+    GMPY = name == "gmpy2"
+
+
+try:
+    set_backend(os.environ.get(ENV_VAR, "auto"))
+except ValueError as e:  # pragma: no cover
+    warnings.warn("Ignoring {0}: {1}".format(ENV_VAR, e), RuntimeWarning)
@@ -0,0 +1,665 @@
+"""
+Benchmarks of the public API of the library.
+
+Run with::
+
+    python -m ecdsa.bench [--curves NIST256p,SECP256k1] [--ops sign,verify]
+                          [--json results.json] [--baseline old.json]
+                          [--memory | --memory-only] [--cold-start]
+                          [--no-speed]
+
+Every operation is timed in a number of repeated runs; the reported speed
+is the mean number of operations per second, together with the 95%
+confidence interval of the mean. Results can be saved as JSON and
+compared against previously saved results, the program then exits with
+a non-zero status if any operation got significantly slower.
+
+With ``--memory`` (or ``--memory-only``, which skips the speed
+measurements) the memory allocated by loading and generating keys is
+measured too, with ``tracemalloc``; an increase of the retained or peak
+memory over the baseline also makes the program exit with a non-zero
+status.
+
+With ``--cold-start`` the time of ``import ecdsa`` and of the first
+signature and verification is measured in fresh interpreters, together
+with the import time of individual modules (as reported by
+``python -X importtime``, so Python 3.7 or later is needed for the
+breakdown). The results include the library version, so saved results
+can be used to track the start-up cost over releases; differences from
+the baseline are only reported, as the start-up time is too noisy to fail
+on.
+"""
+
+from __future__ import division, print_function
+
+import hashlib
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import timeit
+
+from .curves import curves
+from .numbertheory import inverse_mod_implementations
+from .keys import SigningKey, VerifyingKey
+from .precompute import PointTable
+from .util import sigencode_der, sigdecode_der
+from ._version import get_versions
+
+
+__all__ = ["operations", "measure", "memory_usage", "cold_start",
+           "inverse_mod_speed", "run", "compare", "compare_memory",
+           "compare_cold_start", "main"]
+
+
+_DATA = b"some data to sign"
+
+# two-sided 95% critical values of Student's t distribution, by degrees
+# of freedom
+_T_95 = [None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306,
+         2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110,
+         2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056,
+         2.052, 2.048, 2.045, 2.042]
+
+
+def _clear_encodings(key):
+    """Drop the memoised encodings so that they are calculated again."""
+    key._encodings = None
+    return key
+
+
+def operations(curve):
+    """
+    Return the benchmarked operations for a curve.
+
+    :return: pairs of operation names and callables performing the
+        operation once
+    :rtype: list of tuples
+    """
+    sk = SigningKey.generate(curve)
+    vk = sk.verifying_key
+    sig = sk.sign(_DATA)
+    sig_der = sk.sign(_DATA, sigencode=sigencode_der)
+    digest = hashlib.sha1(_DATA).digest()
+
+    ops = [
+        ("keygen", lambda: SigningKey.generate(curve)),
+        ("sign", lambda: sk.sign(_DATA)),
+        ("sign_deterministic", lambda: sk.sign_deterministic(_DATA)),
+        ("sign_digest", lambda: sk.sign_digest(digest)),
+        ("verify", lambda: vk.verify(sig, _DATA)),
+        ("verify_der", lambda: vk.verify(sig_der, _DATA,
+                                         sigdecode=sigdecode_der)),
+        ("verify_digest", lambda: vk.verify_digest(sig, digest)),
+        ("recover", lambda: VerifyingKey.from_public_key_recovery(
+            sig, _DATA, curve)),
+    ]
+
+    def encoding_ops(encoding):
+        encoded = vk.to_string(encoding)
+        return [
+            ("vk_to_string_" + encoding,
+             lambda: _clear_encodings(vk).to_string(encoding)),
+            ("vk_from_string_" + encoding,
+             lambda: VerifyingKey.from_string(encoded, curve))]
+    for encoding in ("raw", "uncompressed", "compressed", "hybrid"):
+        ops.extend(encoding_ops(encoding))
+
+    vk_der = vk.to_der()
+    vk_pem = vk.to_pem()
+    sk_string = sk.to_string()
+    sk_der = sk.to_der()
+    sk_pem = sk.to_pem()
+    ops.extend([
+        ("vk_to_der", lambda: _clear_encodings(vk).to_der()),
+        ("vk_from_der", lambda: VerifyingKey.from_der(vk_der)),
+        ("vk_to_pem", lambda: _clear_encodings(vk).to_pem()),
+        ("vk_from_pem", lambda: VerifyingKey.from_pem(vk_pem)),
+        ("sk_to_string", lambda: sk.to_string()),
+        ("sk_from_string", lambda: SigningKey.from_string(sk_string,
+                                                          curve)),
+        ("sk_to_der", lambda: _clear_encodings(sk).to_der()),
+        ("sk_from_der", lambda: SigningKey.from_der(sk_der)),
+        ("sk_to_pem", lambda: _clear_encodings(sk).to_pem()),
+        ("sk_from_pem", lambda: SigningKey.from_pem(sk_pem)),
+        ("point_table", lambda: PointTable.build(curve)),
+    ])
+    return ops
+
+
+def measure(func, repeat=5, min_time=0.2):
+    """
+    Measure the speed of a function.
+
+    The number of calls in a single run is selected so that the run takes
+    at least `min_time` seconds, the run is then repeated `repeat` times.
+
+    :return: dictionary with the mean number of calls per second
+        (``ops_per_sec``), the bounds of its 95% confidence interval
+        (``ci_low`` and ``ci_high``), number of calls in a run (``number``)
+        and the number of runs (``repeat``)
+    :rtype: dict
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        # aim a bit higher to not end up just under the limit
+        number = max(number * 2,
+                     int(number * min_time * 1.2 / max(elapsed, 1e-9)))
+    speeds = [number / elapsed]
+    speeds.extend(number / timer.timeit(number)
+                  for _ in range(repeat - 1))
+
+    mean = sum(speeds) / len(speeds)
+    if len(speeds) > 1:
+        variance = sum((i - mean) ** 2 for i in speeds) / (len(speeds) - 1)
+        dof = len(speeds) - 1
+        t_val = _T_95[dof] if dof < len(_T_95) else 1.96
+        delta = t_val * math.sqrt(variance / len(speeds))
+    else:
+        delta = float("inf")
+    return {"ops_per_sec": mean, "ci_low": mean - delta,
+            "ci_high": mean + delta, "number": number,
+            "repeat": len(speeds)}
+
+
+def _traced(func):
+    """
+    Call `func` and measure the memory it allocated.
+
+    :return: the value returned by `func`, the peak number of bytes
+        allocated during the call and the number of bytes still allocated
+        after it returned
+    :rtype: tuple
+    """
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        value = func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return value, peak - start, current - start
+
+
+def memory_usage(curve, count=10):
+    """
+    Measure the memory used by loading and generating `count` keys.
+
+    Reported operations are generation of signing keys
+    (``sk_generate``), loading of keys with ``from_string()``,
+    ``from_der()`` and ``from_pem()`` (``vk_from_string``,
+    ``sk_from_der``, etc.), storing of the public keys in a
+    :class:`~ecdsa.keystore.PublicKeyStore` (``keystore``) and building of
+    a single :class:`~ecdsa.precompute.PointTable` for the generator
+    (``point_table``).
+
+    Requires the tracemalloc module (Python 3.4 or later). Tracing of
+    allocations makes the operations more than ten times slower, but the
+    memory used by a key doesn't depend on the key, so a small `count` is
+    sufficient.
+
+    :return: list of dictionaries with the curve name (``curve``),
+        operation name (``operation``), number of keys (``count``), the
+        peak number of bytes allocated during the operation
+        (``peak_bytes``) and the number of bytes retained by the created
+        objects (``retained_bytes``)
+    :rtype: list
+    """
+    from .keystore import PublicKeyStore
+
+    results = []
+
+    def record(name, func, number=count):
+        value, peak, retained = _traced(func)
+        results.append({"curve": curve.name, "operation": name,
+                        "count": number, "peak_bytes": peak,
+                        "retained_bytes": retained})
+        return value
+
+    sks = record("sk_generate",
+                 lambda: [SigningKey.generate(curve) for _ in range(count)])
+    vks = [i.verifying_key for i in sks]
+
+    for name, cls, keys in (("vk", VerifyingKey, vks), ("sk", SigningKey, sks)):
+        strings = [i.to_string() for i in keys]
+        ders = [i.to_der() for i in keys]
+        pems = [i.to_pem() for i in keys]
+        record(name + "_from_string",
+               lambda: [cls.from_string(i, curve) for i in strings])
+        record(name + "_from_der", lambda: [cls.from_der(i) for i in ders])
+        record(name + "_from_pem", lambda: [cls.from_pem(i) for i in pems])
+
+    compressed = [i.to_string("compressed") for i in vks]
+
+    def fill_store():
+        store = PublicKeyStore(curve, encoding="compressed")
+        store.extend(compressed)
+        return store
+    record("keystore", fill_store)
+    record("point_table", lambda: PointTable.build(curve), 1)
+    return results
+
+
+def compare_memory(results, baseline, threshold=0.05):
+    """
+    Compare memory usage with a baseline.
+
+    :return: list of tuples with the curve name, operation name, ratio of
+        the new retained memory to the baseline, ratio of the new peak
+        memory to the baseline, and True if either grew by more than
+        `threshold` (a fraction)
+    :rtype: list
+    """
+    old = {}
+    for i in baseline.get("memory", []):
+        old[(i["curve"], i["operation"])] = i
+    changes = []
+    for new in results.get("memory", []):
+        base = old.get((new["curve"], new["operation"]))
+        if base is None:
+            continue
+        retained = new["retained_bytes"] / max(base["retained_bytes"], 1)
+        peak = new["peak_bytes"] / max(base["peak_bytes"], 1)
+        changes.append((new["curve"], new["operation"], retained, peak,
+                        retained > 1 + threshold or peak > 1 + threshold))
+    return changes
+
+
+def inverse_mod_speed(curve_names=None, repeat=5, min_time=0.2, values=64):
+    """
+    Measure the speed of the modular inversion implementations.
+
+    Every available implementation (see
+    :func:`~ecdsa.numbertheory.inverse_mod_implementations`) is measured
+    with the field prime and the order of every curve as the modulus, on
+    the same pseudo-random operands.
+
+    :param int values: number of different operands in a run
+
+    :return: list of dictionaries with the curve name (``curve``), the
+        modulus (``modulus``, "p" or "order"), its size (``bits``), the
+        implementation name (``implementation``) and the speed in
+        inversions per second (``ops_per_sec``, ``ci_low`` and
+        ``ci_high``)
+    :rtype: list
+    """
+    gen = random.Random(42)
+    results = []
+    for curve in curves:
+        if curve_names and curve.name not in curve_names:
+            continue
+        for name, modulus in (("p", curve.curve.p()), ("order", curve.order)):
+            operands = [gen.randrange(1, modulus) for _ in range(values)]
+            for impl_name, impl in inverse_mod_implementations():
+                result = measure(lambda: [impl(a, modulus) for a in operands],
+                                 repeat, min_time)
+                for key in ("ops_per_sec", "ci_low", "ci_high"):
+                    result[key] *= values
+                result.update(curve=curve.name, modulus=name,
+                              bits=modulus.bit_length(),
+                              implementation=impl_name)
+                results.append(result)
+    return results
+
+
+# executed with "python -X importtime -c", the name of the curve is the
+# first argument
+_COLD_START_SCRIPT = """
+import json, sys, time
+timer = getattr(time, "perf_counter", time.time)
+start = timer()
+import ecdsa
+imported = timer()
+from ecdsa.curves import find_curve_by_name
+sk = ecdsa.SigningKey.from_secret_exponent(12345,
+                                           find_curve_by_name(sys.argv[1]))
+sig = sk.sign_deterministic(b"data")
+signed = timer()
+sk.verifying_key.verify(sig, b"data")
+verified = timer()
+print(json.dumps({"import_s": imported - start,
+                  "first_sign_s": signed - imported,
+                  "first_verify_s": verified - signed}))
+"""
+
+
+def _parse_importtime(output, package="ecdsa"):
+    """
+    Extract the import times of `package` and the modules it imported.
+
+    :param str output: the standard error output of ``python -X importtime``
+    :return: dictionary with module names as keys and pairs of their
+        self and cumulative import times, in microseconds, as values
+    :rtype: dict
+    """
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # the header line
+            continue
+        name = fields[2].rstrip()
+        module = name.strip()
+        if len(name) - len(module) == 1:
+            # top level import, the modules listed so far belong to it
+            if module == package:
+                modules[module] = (int(fields[0]), int(fields[1]))
+                return modules
+            modules = {}
+            continue
+        modules[module] = (int(fields[0]), int(fields[1]))
+    return {}
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def cold_start(curve_names=None, runs=5):
+    """
+    Measure the start-up cost of the library in fresh interpreters.
+
+    For every curve, `runs` new interpreters are started and each imports
+    the library, creates a signing key, signs and verifies a message. All
+    reported times are medians over the runs.
+
+    :param curve_names: names of curves to measure, all if not specified
+    :param int runs: number of interpreters started for every curve
+
+    :return: dictionary with the time to start the interpreter and run
+        the whole test (``process_s``), time of ``import ecdsa``
+        (``import_s``), the self and cumulative import time in
+        microseconds of ``ecdsa`` and all modules it imported
+        (``modules``, a list of dictionaries with ``module``, ``self_us``
+        and ``cumulative_us`` keys, sorted by cumulative time), and, in
+        ``curves``, a list of dictionaries with the time to create a key
+        and make the first signature (``first_sign_s``) and of the first
+        verification (``first_verify_s``) for every curve
+    :rtype: dict
+    """
+    # make sure the interpreters import this copy of the library
+    env = dict(os.environ)
+    path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(
+        [path] + [i for i in [env.get("PYTHONPATH")] if i])
+    cmd = [sys.executable, "-X", "importtime", "-c", _COLD_START_SCRIPT]
+
+    process_times = []
+    import_times = []
+    module_times = {}
+    curve_results = []
+    for curve in curves:
+        if curve_names and curve.name not in curve_names:
+            continue
+        sign_times = []
+        verify_times = []
+        for _ in range(runs):
+            start = timeit.default_timer()
+            proc = subprocess.Popen(cmd + [curve.name], env=env,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE,
+                                    universal_newlines=True)
+            out, err = proc.communicate()
+            process_times.append(timeit.default_timer() - start)
+            if proc.returncode:
+                raise RuntimeError("Cold start measurement failed: {0}"
+                                   .format(err))
+            times = json.loads(out)
+            import_times.append(times["import_s"])
+            sign_times.append(times["first_sign_s"])
+            verify_times.append(times["first_verify_s"])
+            for module, value in _parse_importtime(err).items():
+                module_times.setdefault(module, []).append(value)
+        curve_results.append({"curve": curve.name,
+                              "first_sign_s": _median(sign_times),
+                              "first_verify_s": _median(verify_times)})
+
+    modules = [{"module": module,
+                "self_us": _median([i[0] for i in values]),
+                "cumulative_us": _median([i[1] for i in values])}
+               for module, values in module_times.items()]
+    modules.sort(key=lambda i: i["cumulative_us"], reverse=True)
+    return {"runs": runs,
+            "process_s": _median(process_times) if process_times else None,
+            "import_s": _median(import_times) if import_times else None,
+            "modules": modules,
+            "curves": curve_results}
+
+
+def run(curve_names=None, op_names=None, repeat=5, min_time=0.2,
+        out=None):
+    """
+    Run the benchmarks.
+
+    :param curve_names: names of curves to benchmark, all if not specified
+    :param op_names: names of operations to benchmark, all if not specified
+    :param out: file to print the progress to, nothing is printed by
+        default
+
+    :return: the results, in the format saved as JSON
+    :rtype: dict
+    """
+    results = []
+    for curve in curves:
+        if curve_names and curve.name not in curve_names:
+            continue
+        for name, func in operations(curve):
+            if op_names and name not in op_names:
+                continue
+            result = measure(func, repeat, min_time)
+            result["curve"] = curve.name
+            result["operation"] = name
+            results.append(result)
+            if out is not None:
+                print("{0:>16} {1:>24}: {2:>12.2f} ops/s +- {3:.1f}%".format(
+                      curve.name, name, result["ops_per_sec"],
+                      _ci_percent(result)), file=out)
+    return {"version": get_versions()["version"],
+            "python": _python_version(),
+            "results": results}
+
+
+def _python_version():
+    """Return the name and version of the Python interpreter."""
+    return "{0} {1}".format(platform.python_implementation(),
+                            platform.python_version())
+
+
+def _ci_percent(result):
+    """Return the half-width of the confidence interval in percent."""
+    return 100 * (result["ci_high"] - result["ops_per_sec"]) / \
+        result["ops_per_sec"]
+
+
+def compare(results, baseline, threshold=0.05):
+    """
+    Compare results with a baseline.
+
+    An operation is considered significantly slower or faster if its
+    speed differs by more than `threshold` (a fraction) and the
+    confidence intervals of the two measurements don't overlap.
+
+    :return: list of tuples with the curve name, operation name, ratio of
+        the new speed to the baseline speed, and -1, 0 or 1 when the
+        operation got significantly slower, didn't change, or got
+        significantly faster
+    :rtype: list
+    """
+    old = {}
+    for i in baseline["results"]:
+        old[(i["curve"], i["operation"])] = i
+    changes = []
+    for new in results["results"]:
+        base = old.get((new["curve"], new["operation"]))
+        if base is None:
+            continue
+        ratio = new["ops_per_sec"] / base["ops_per_sec"]
+        if ratio < 1 - threshold and new["ci_high"] < base["ci_low"]:
+            change = -1
+        elif ratio > 1 + threshold and new["ci_low"] > base["ci_high"]:
+            change = 1
+        else:
+            change = 0
+        changes.append((new["curve"], new["operation"], ratio, change))
+    return changes
+
+
+def compare_cold_start(results, baseline):
+    """
+    Compare start-up times with a baseline.
+
+    :return: list of tuples with the name of the measurement (``import`` or
+        the curve name and ``first_sign``/``first_verify``) and the ratio
+        of the new time to the baseline time
+    :rtype: list
+    """
+    new = results.get("cold_start")
+    old = baseline.get("cold_start")
+    if not new or not old:
+        return []
+    changes = []
+    if new["import_s"] and old["import_s"]:
+        changes.append(("import", new["import_s"] / old["import_s"]))
+    old_curves = dict((i["curve"], i) for i in old["curves"])
+    for i in new["curves"]:
+        base = old_curves.get(i["curve"])
+        if base is None:
+            continue
+        for name in ("first_sign", "first_verify"):
+            changes.append(("{0} {1}".format(i["curve"], name),
+                            i[name + "_s"] / base[name + "_s"]))
+    return changes
+
+
+def main(argv=None):
+    """Run the benchmarks from the command line."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m ecdsa.bench",
+        description="Benchmark the python-ecdsa operations.")
+    parser.add_argument("--curves", help="comma separated curve names")
+    parser.add_argument("--ops", help="comma separated operation names")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of runs of every operation")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="minimal duration of a run, in seconds")
+    parser.add_argument("--json", help="file to save the results to")
+    parser.add_argument("--baseline",
+                        help="file with saved results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.05,
+                        help="relative change considered significant")
+    parser.add_argument("--memory", action="store_true",
+                        help="also report memory used by loading and "
+                             "generating keys")
+    parser.add_argument("--memory-only", action="store_true",
+                        help="report only the memory usage")
+    parser.add_argument("--memory-keys", type=int, default=10,
+                        help="number of keys loaded in memory measurements")
+    parser.add_argument("--cold-start", action="store_true",
+                        help="also report the import time and the time to "
+                             "the first signature in a new interpreter")
+    parser.add_argument("--cold-start-runs", type=int, default=5,
+                        help="number of interpreters started for every "
+                             "curve")
+    parser.add_argument("--inverse", action="store_true",
+                        help="also compare the modular inversion "
+                             "implementations")
+    parser.add_argument("--no-speed", action="store_true",
+                        help="skip the speed benchmarks")
+    args = parser.parse_args(argv)
+
+    curve_names = args.curves and args.curves.split(",")
+    if args.memory_only or args.no_speed:
+        results = {"version": get_versions()["version"],
+                   "python": _python_version(),
+                   "results": []}
+    else:
+        results = run(curve_names, args.ops and args.ops.split(","),
+                      args.repeat, args.min_time, sys.stdout)
+
+    if args.memory or args.memory_only:
+        results["memory"] = []
+        for curve in curves:
+            if curve_names and curve.name not in curve_names:
+                continue
+            for usage in memory_usage(curve, args.memory_keys):
+                results["memory"].append(usage)
+                print("{0:>16} {1:>24}: {2:>8} bytes retained, {3:>8} "
+                      "bytes peak per key".format(
+                          curve.name, usage["operation"],
+                          usage["retained_bytes"] // usage["count"],
+                          usage["peak_bytes"] // usage["count"]))
+
+    if args.inverse:
+        results["inverse_mod"] = inverse_mod_speed(curve_names, args.repeat,
+                                                   args.min_time)
+        print("")
+        for i in results["inverse_mod"]:
+            print("{0:>16} {1:>5} ({2:>3} bits) {3:>6}: {4:>12.2f} "
+                  "inversions/s".format(i["curve"], i["modulus"], i["bits"],
+                                        i["implementation"],
+                                        i["ops_per_sec"]))
+
+    if args.cold_start:
+        results["cold_start"] = usage = cold_start(curve_names,
+                                                   args.cold_start_runs)
+        print("")
+        print("import ecdsa: {0:.1f} ms (interpreter total {1:.1f} ms)"
+              .format(usage["import_s"] * 1000, usage["process_s"] * 1000))
+        for i in usage["modules"][:10]:
+            print("{0:>24}: {1:>8} us self, {2:>8} us cumulative".format(
+                  i["module"], i["self_us"], i["cumulative_us"]))
+        for i in usage["curves"]:
+            print("{0:>16}: first sign {1:.1f} ms, first verify {2:.1f} ms"
+                  .format(i["curve"], i["first_sign_s"] * 1000,
+                          i["first_verify_s"] * 1000))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    print("")
+    print("Compared to {0} ({1}):".format(baseline.get("version"),
+                                          baseline.get("python")))
+    status = 0
+    for curve, operation, ratio, change in compare(results, baseline,
+                                                   args.threshold):
+        mark = {-1: "slower", 0: "", 1: "faster"}[change]
+        print("{0:>16} {1:>24}: {2:>7.1%} {3}".format(
+              curve, operation, ratio, mark))
+        if change < 0:
+            status = 1
+    for curve, operation, retained, peak, grew in compare_memory(
+            results, baseline, args.threshold):
+        print("{0:>16} {1:>24}: {2:>7.1%} retained, {3:>7.1%} peak {4}"
+              .format(curve, operation, retained, peak,
+                      "bigger" if grew else ""))
+        if grew:
+            status = 1
+    for name, ratio in compare_cold_start(results, baseline):
+        print("{0:>41}: {1:>7.1%}".format(name, ratio))
+    return status
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
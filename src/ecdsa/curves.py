@@ -1,15 +1,21 @@
 from __future__ import division
 
+from collections import namedtuple
 from . import der, ecdsa
-from .util import orderlen
+from .util import orderlen, bit_length
 
 
 # orderlen was defined in this module previously, so keep it in __all__,
 # will need to mark it as deprecated later
-__all__ = ["UnknownCurveError", "orderlen", "Curve", "NIST192p",
-           "NIST224p", "NIST256p", "NIST384p", "NIST521p", "curves",
-           "find_curve", "SECP256k1", "BRAINPOOLP160r1", "BRAINPOOLP192r1",
-           "BRAINPOOLP224r1", "BRAINPOOLP256r1" "BRAINPOOLP320r1",
+__all__ = ["UnknownCurveError", "orderlen", "Curve", "CurveContext",
+           "NIST192p", "NIST224p", "NIST256p", "NIST384p", "NIST521p",
+           "curves", "find_curve", "find_curve_by_encoded_oid",
+           "find_curve_by_name", "register_curve", "unregister_curve",
+           "set_table_budget",
+           "get_table_budget", "choose_window", "table_size",
+           "table_memory_usage", "SECP256k1", "BRAINPOOLP160r1",
+           "BRAINPOOLP192r1", "BRAINPOOLP224r1", "BRAINPOOLP256r1",
+           "BRAINPOOLP320r1",
            "BRAINPOOLP384r1", "BRAINPOOLP512r1"]
 
 
@@ -17,6 +23,41 @@ class UnknownCurveError(Exception):
     pass
 
 
+class CurveContext(namedtuple("CurveContext", [
+        "p", "a", "b", "order", "baselen", "order_bits", "p_len",
+        "p_mod_4_is_3", "sqrt_exponent"])):
+    """
+    Constants derived from the curve parameters.
+
+    :ivar int p: the prime of the field the curve is defined over
+    :ivar int a: the `a` parameter of the curve equation
+    :ivar int b: the `b` parameter of the curve equation
+    :ivar int order: the order of the generator
+    :ivar int baselen: length of the order in bytes
+    :ivar int order_bits: length of the order in bits
+    :ivar int p_len: length of the field prime in bytes
+    :ivar bool p_mod_4_is_3: True if square roots in the field can be
+        calculated with a single exponentiation
+    :ivar sqrt_exponent: the `(p + 1) // 4` exponent for calculating square
+        roots if `p_mod_4_is_3` is True, None otherwise
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_curve(cls, curve, order):
+        """Calculate the constants for the curve and generator order."""
+        p = curve.p()
+        p_mod_4_is_3 = p % 4 == 3
+        return cls(
+            p=p, a=curve.a(), b=curve.b(), order=order,
+            baselen=orderlen(order),
+            order_bits=bit_length(order),
+            p_len=orderlen(p),
+            p_mod_4_is_3=p_mod_4_is_3,
+            sqrt_exponent=(p + 1) // 4 if p_mod_4_is_3 else None)
+
+
 class Curve:
     def __init__(self, name, curve, generator, oid, openssl_name=None):
         self.name = name
@@ -25,14 +66,42 @@ class Curve:
         self.generator = generator
         self.order = generator.order()
         self.baselen = orderlen(self.order)
+        if curve is not None:
+            self.ctx = CurveContext.from_curve(curve, self.order)
+        else:
+            self.ctx = None
         self.verifying_key_length = 2*self.baselen
         self.signature_length = 2*self.baselen
         self.oid = oid
         self.encoded_oid = der.encode_oid(*oid)
+        # memory limit for precomputed tables, see set_table_budget()
+        self.table_budget = None
 
     def __repr__(self):
         return self.name
 
+    def precompute(self, window=None, lazy=False):
+        """
+        Speed up multiplications of the generator with a precomputed table.
+
+        Makes key generation and signing, and to a lesser degree
+        verification, faster for all keys on the curve. Safe to call
+        multiple times and from multiple threads, the table is built only
+        once.
+
+        :param int window: the window width of the table, see
+            :meth:`ecdsa.precompute.PointTable.build`, selected by
+            :func:`choose_window` if not specified
+        :param bool lazy: if True, the table is built on the first use,
+            otherwise immediately
+
+        :return: the table, or None if no table fits in the memory budget
+        :rtype: ecdsa.precompute.PointTable or ecdsa.precompute.LazyTable
+        """
+        # ecdsa.precompute uses this module
+        from .precompute import precompute
+        return precompute(self, window=window, lazy=lazy)
+
 
 # the NIST curves
 NIST192p = Curve("NIST192p", ecdsa.curve_192,
@@ -100,15 +169,240 @@ BRAINPOOLP512r1 = Curve("BRAINPOOLP512r1",
                         "brainpoolP512r1")
 
 
-curves = [NIST192p, NIST224p, NIST256p, NIST384p, NIST521p, SECP256k1,
-          BRAINPOOLP160r1, BRAINPOOLP192r1,  BRAINPOOLP224r1, BRAINPOOLP256r1,
-          BRAINPOOLP320r1, BRAINPOOLP384r1, BRAINPOOLP512r1]
+curves = []
+"""List of all the known curves, in order of registration."""
+
+_curves_by_oid = {}
+_curves_by_encoded_oid = {}
+_curves_by_name = {}
+_curves_by_openssl_name = {}
+
+
+def register_curve(curve):
+    """
+    Add a curve to the list of curves known to the library.
+
+    Registered curves can be found by :func:`find_curve` and are
+    recognised when parsing :term:`DER` and :term:`PEM` encoded keys.
+
+    :param curve: the curve to register
+    :type curve: ecdsa.curves.Curve
+
+    :raises ValueError: if a different curve with the same OID, name or
+        OpenSSL name is already registered
+    """
+    for index, key in ((_curves_by_oid, curve.oid),
+                       (_curves_by_name, curve.name),
+                       (_curves_by_openssl_name, curve.openssl_name)):
+        if key is not None and index.get(key, curve) is not curve:
+            raise ValueError("Curve {0!r} conflicts with already registered "
+                             "curve {1!r}".format(curve, index[key]))
+    if curve.oid in _curves_by_oid:
+        return
+    curves.append(curve)
+    _curves_by_oid[curve.oid] = curve
+    _curves_by_encoded_oid[curve.encoded_oid] = curve
+    _curves_by_name[curve.name] = curve
+    if curve.openssl_name is not None:
+        _curves_by_openssl_name[curve.openssl_name] = curve
+
+
+def unregister_curve(curve):
+    """
+    Remove a curve from the list of curves known to the library.
+
+    Does nothing if the curve isn't registered.
+
+    :param curve: the curve to remove
+    :type curve: ecdsa.curves.Curve
+    """
+    if _curves_by_oid.get(curve.oid) is not curve:
+        return
+    curves.remove(curve)
+    for index, key in ((_curves_by_oid, curve.oid),
+                       (_curves_by_encoded_oid, curve.encoded_oid),
+                       (_curves_by_name, curve.name),
+                       (_curves_by_openssl_name, curve.openssl_name)):
+        if index.get(key) is curve:
+            del index[key]
+
+
+for _curve in [NIST192p, NIST224p, NIST256p, NIST384p, NIST521p, SECP256k1,
+               BRAINPOOLP160r1, BRAINPOOLP192r1, BRAINPOOLP224r1,
+               BRAINPOOLP256r1, BRAINPOOLP320r1, BRAINPOOLP384r1,
+               BRAINPOOLP512r1]:
+    register_curve(_curve)
+del _curve
 
 
 def find_curve(oid_curve):
-    for c in curves:
-        if c.oid == oid_curve:
-            return c
-    raise UnknownCurveError("I don't know about the curve with oid %s."
-                            "I only know about these: %s" %
-                            (oid_curve, [c.name for c in curves]))
+    """
+    Select the curve with the given object identifier.
+
+    :param oid_curve: the object identifier of the curve
+    :type oid_curve: tuple of ints
+
+    :raises UnknownCurveError: if no curve with the given OID is registered
+
+    :rtype: ecdsa.curves.Curve
+    """
+    try:
+        return _curves_by_oid[tuple(oid_curve)]
+    except KeyError:
+        raise UnknownCurveError("I don't know about the curve with oid %s."
+                                "I only know about these: %s" %
+                                (oid_curve, [c.name for c in curves]))
+
+
+def find_curve_by_encoded_oid(encoded_oid):
+    """
+    Select the curve with the given :term:`DER` encoded object identifier.
+
+    The lookup is performed on the raw encoding (including the tag and
+    length octets), so the object identifier doesn't have to be decoded.
+
+    :param encoded_oid: the encoding of the object identifier
+    :type encoded_oid: bytes
+
+    :return: the curve or None if no curve with that OID is registered
+    :rtype: ecdsa.curves.Curve
+    """
+    return _curves_by_encoded_oid.get(encoded_oid)
+
+
+def find_curve_by_name(name):
+    """
+    Select the curve with the given name or OpenSSL name.
+
+    :param str name: name of the curve, like "NIST256p", or the name used
+        by OpenSSL, like "prime256v1"
+
+    :raises UnknownCurveError: if no curve with the given name is registered
+
+    :rtype: ecdsa.curves.Curve
+    """
+    curve = _curves_by_name.get(name)
+    if curve is None:
+        curve = _curves_by_openssl_name.get(name)
+    if curve is None:
+        raise UnknownCurveError("I don't know about the curve named %s. "
+                                "I only know about these: %s" %
+                                (name, [c.name for c in curves]))
+    return curve
+
+
+_table_budget = None
+
+# the default window width for tables if there's no memory budget
+_DEFAULT_WINDOW = 4
+# the widest supported window
+_MAX_WINDOW = 8
+# the share of the memory budget a table of the generator or of a single
+# key can use
+_GENERATOR_SHARE = 2
+_KEY_SHARE = 16
+
+
+def set_table_budget(budget, curve=None):
+    """
+    Limit the memory used by precomputed tables.
+
+    The budget selects the window widths of new tables (see
+    :func:`choose_window`): a table of the curve generator can use up to
+    half of it, a table of a single public key 1/16 of it. When the
+    tables use more than the budget, the least recently used tables of
+    public keys are removed; tables of the generators are never removed.
+
+    The global budget applies to the tables of all curves together, a
+    per-curve budget only to tables on the given curve. Both apply if
+    both are set.
+
+    :param int budget: the limit in bytes, None for no limit (the default)
+    :param curve: the curve the budget applies to, all curves if not
+        specified
+    :type curve: ecdsa.curves.Curve
+    """
+    global _table_budget
+
+    if budget is not None and budget < 0:
+        raise ValueError("Budget can't be negative")
+    if curve is None:
+        _table_budget = budget
+    else:
+        curve.table_budget = budget
+    # ecdsa.precompute uses this module
+    from .precompute import enforce_budget
+    enforce_budget()
+
+
+def get_table_budget(curve=None):
+    """
+    Return the memory budget for precomputed tables.
+
+    :param curve: return the budget that applies to this curve: the
+        smaller of the global budget and the budget of the curve
+    :return: the budget in bytes, None if unlimited
+    :rtype: int
+    """
+    if curve is None or curve.table_budget is None:
+        return _table_budget
+    if _table_budget is None:
+        return curve.table_budget
+    return min(_table_budget, curve.table_budget)
+
+
+def table_size(curve, window, windows=None):
+    """
+    Return the size in bytes of the points of a precomputed table.
+
+    Used both for checking the memory budget and for the sizes of the
+    tables in :mod:`ecdsa.precompute`.
+
+    :param int window: the window width of the table, in bits
+    :param int windows: the number of windows, by default the number
+        needed to cover the order of the curve
+    :rtype: int
+    """
+    ctx = curve.ctx
+    if windows is None:
+        windows = (ctx.order_bits + window - 1) // window
+    return windows * ((1 << window) - 1) * 2 * ctx.p_len
+
+
+def choose_window(curve, per_key=False):
+    """
+    Select the window width of a new table from the memory budget.
+
+    :param bool per_key: True for a table of a public key, False for
+        the table of the curve generator
+
+    :return: the widest window that fits in the share of the budget, 4 if
+        there is no budget, or None if not even the smallest table fits
+    :rtype: int
+    """
+    budget = get_table_budget(curve)
+    if budget is None:
+        return _DEFAULT_WINDOW
+    share = budget // (_KEY_SHARE if per_key else _GENERATOR_SHARE)
+    window = None
+    for i in range(1, _MAX_WINDOW + 1):
+        if table_size(curve, i) <= share:
+            window = i
+    return window
+
+
+def table_memory_usage(curve=None):
+    """
+    Return the memory used by registered precomputed tables.
+
+    Tables that are built lazily are counted with their full size, also
+    before they are built. Tables loaded from shared memory or
+    memory-mapped files are counted too, even if their memory is shared
+    with other processes.
+
+    :param curve: count only tables on this curve
+    :return: the size in bytes
+    :rtype: int
+    """
+    from .precompute import table_memory
+    return table_memory(curve)
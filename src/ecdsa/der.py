@@ -186,6 +186,32 @@ def remove_object(string):
     return tuple(numbers), rest
 
 
+def remove_encoded_object(string):
+    """
+    Split the encoding of an object identifier from the rest of the string.
+
+    Only the tag and length octets are checked, the identifier itself is
+    not decoded; that allows comparing it with known encodings directly.
+
+    :return: tuple with the complete encoding of the object identifier
+        (including tag and length octets) and the remaining data
+    """
+    if not string:
+        raise UnexpectedDER(
+            "Empty string does not encode an object identifier")
+    if string[:1] != b"\x06":
+        n = str_idx_as_int(string, 0)
+        raise UnexpectedDER("wanted type 'object' (0x06), got 0x%02x" % n)
+    length, lengthlength = read_length(string[1:])
+    if not length:
+        raise UnexpectedDER("Empty object identifier")
+    end = 1 + lengthlength + length
+    if end > len(string):
+        raise UnexpectedDER(
+            "Length of object identifier longer than the provided buffer")
+    return string[:end], string[end:]
+
+
 def remove_integer(string):
     if not string:
         raise UnexpectedDER("Empty string is an invalid encoding of an "
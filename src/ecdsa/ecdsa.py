@@ -56,7 +56,9 @@ Written in 2005 by Peter Pearson and placed in the public domain.
 from six import int2byte, b
 from . import ellipticcurve
 from . import numbertheory
+from . import instrument
 from .util import bit_length
+from ._compat import slots_getstate, slots_setstate
 
 
 class RSZeroError(RuntimeError):
@@ -66,10 +68,18 @@ class RSZeroError(RuntimeError):
 class Signature(object):
   """ECDSA signature.
   """
+  __slots__ = ("r", "s", "__weakref__")
+
   def __init__(self, r, s):
     self.r = r
     self.s = s
 
+  def __getstate__(self):
+    return slots_getstate(self)
+
+  def __setstate__(self, state):
+    slots_setstate(self, state)
+
   def recover_public_keys(self, hash, generator):
     """Returns two public keys for which the signature is valid
     hash is signed hash
@@ -83,9 +93,10 @@ class Signature(object):
     x = r
 
     # Compute the curve point with x as x-coordinate
-    alpha = (pow(x, 3, curve.p()) + (curve.a() * x) + curve.b()) % curve.p()
-    beta = numbertheory.square_root_mod_prime(alpha, curve.p())
-    y = beta if beta % 2 == 0 else curve.p() - beta
+    p = curve.p()
+    alpha = (pow(x, 3, p) + (curve.a() * x) + curve.b()) % p
+    beta = numbertheory.square_root_mod_prime(alpha, p)
+    y = beta if beta % 2 == 0 else p - beta
 
     # Compute the public key
     R1 = ellipticcurve.Point(curve, x, y, n)
@@ -102,6 +113,7 @@ class Signature(object):
 class Public_key(object):
   """Public key for ECDSA.
   """
+  __slots__ = ("curve", "generator", "point", "order", "__weakref__")
 
   def __init__(self, generator, point):
     """generator is the Point that generates the group,
@@ -119,6 +131,12 @@ class Public_key(object):
     if point.x() < 0 or n <= point.x() or point.y() < 0 or n <= point.y():
       raise RuntimeError("Generator point has x or y out of range.")
 
+  def __getstate__(self):
+    return slots_getstate(self)
+
+  def __setstate__(self, state):
+    slots_setstate(self, state)
+
   def verifies(self, hash, signature):
     """Verify that signature is a valid signature of hash.
     Return True if the signature is valid.
@@ -126,6 +144,9 @@ class Public_key(object):
 
     # From X9.62 J.3.1.
 
+    if instrument.ENABLED:
+      instrument.record("verifies")
+
     G = self.generator
     n = G.order()
     r = signature.r
@@ -145,6 +166,8 @@ class Public_key(object):
 class Private_key(object):
   """Private key for ECDSA.
   """
+  __slots__ = ("public_key", "secret_multiplier", "order", "_order_bits",
+               "__weakref__")
 
   def __init__(self, public_key, secret_multiplier):
     """public_key is of class Public_key;
@@ -153,6 +176,14 @@ class Private_key(object):
 
     self.public_key = public_key
     self.secret_multiplier = secret_multiplier
+    # bit length of the order, used by every sign() call
+    self._order_bits = bit_length(public_key.generator.order())
+
+  def __getstate__(self):
+    return slots_getstate(self)
+
+  def __setstate__(self, state):
+    slots_setstate(self, state)
 
   def sign(self, hash, random_k):
     """Return a signature for the provided hash, using the provided
@@ -177,7 +208,7 @@ class Private_key(object):
     # This does not change that ks = k mod n
     ks = k + n
     kt = ks + n
-    if bit_length(ks) == bit_length(n):
+    if bit_length(ks) == self._order_bits:
       p1 = kt * G
     else:
       p1 = ks * G
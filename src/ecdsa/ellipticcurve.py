@@ -36,58 +36,82 @@ from __future__ import division
 
 from six import python_2_unicode_compatible
 from . import numbertheory
+from . import instrument
+from . import backend
+from ._compat import slots_getstate, slots_setstate
+
+# tables of multiples of points, by the curve parameters (p, a, b) and
+# the point coordinates, see ecdsa.precompute
+_precomputed = {}
+
 
 @python_2_unicode_compatible
 class CurveFp(object):
   """Elliptic Curve over the field of integers modulo a prime."""
+  __slots__ = ("_p", "_a", "_b", "__weakref__")
+
   def __init__(self, p, a, b):
     """The curve of points satisfying y^2 = x^3 + a*x + b (mod p)."""
-    self.__p = p
-    self.__a = a
-    self.__b = b
+    self._p = p
+    self._a = a
+    self._b = b
+
+  def __getstate__(self):
+    return slots_getstate(self)
+
+  def __setstate__(self, state):
+    slots_setstate(self, state)
 
   def p(self):
-    return self.__p
+    return self._p
 
   def a(self):
-    return self.__a
+    return self._a
 
   def b(self):
-    return self.__b
+    return self._b
 
   def contains_point(self, x, y):
     """Is the point (x,y) on this curve?"""
-    return (y * y - (x * x * x + self.__a * x + self.__b)) % self.__p == 0
+    return (y * y - (x * x * x + self._a * x + self._b)) % self._p == 0
 
   def __str__(self):
-    return "CurveFp(p=%d, a=%d, b=%d)" % (self.__p, self.__a, self.__b)
+    return "CurveFp(p=%d, a=%d, b=%d)" % (self._p, self._a, self._b)
 
 class Point(object):
   """A point on an elliptic curve. Altering x and y is forbidding,
      but they can be read by the x() and y() methods."""
+  __slots__ = ("_curve", "_x", "_y", "_order", "__weakref__")
+
   def __init__(self, curve, x, y, order=None):
     """curve, x, y, order; order (optional) is the order of this point."""
-    self.__curve = curve
-    self.__x = x
-    self.__y = y
-    self.__order = order
+    self._curve = curve
+    self._x = x
+    self._y = y
+    self._order = order
     # self.curve is allowed to be None only for INFINITY:
-    if self.__curve:
-      assert self.__curve.contains_point(x, y)
+    if self._curve:
+      assert self._curve.contains_point(x, y)
     if order:
       assert self * order == INFINITY
 
+  def __getstate__(self):
+    return slots_getstate(self)
+
+  def __setstate__(self, state):
+    slots_setstate(self, state)
+
   def __eq__(self, other):
     """Return True if the points are identical, False otherwise."""
-    if self.__curve == other.__curve \
-       and self.__x == other.__x \
-       and self.__y == other.__y:
+    if self._curve == other._curve \
+       and self._x == other._x \
+       and self._y == other._y:
       return True
     else:
       return False
 
   def __neg__(self):
-    return Point(self.__curve, self.__x, self.__curve.p() - self.__y)
+    return Point(self._curve, self._x, self._curve._p - self._y)
 
   def __add__(self, other):
     """Add one point to another point."""
@@ -98,22 +122,25 @@ class Point(object):
       return self
     if self == INFINITY:
       return other
-    assert self.__curve == other.__curve
-    if self.__x == other.__x:
-      if (self.__y + other.__y) % self.__curve.p() == 0:
+    assert self._curve == other._curve
+    if self._x == other._x:
+      if (self._y + other._y) % self._curve._p == 0:
         return INFINITY
       else:
         return self.double()
 
-    p = self.__curve.p()
+    p = self._curve._p
+    if instrument.ENABLED:
+      instrument.record("point_add")
+      instrument.record("field_mul", 3)
 
-    l = ((other.__y - self.__y) * \
-         numbertheory.inverse_mod(other.__x - self.__x, p)) % p
+    l = ((other._y - self._y) * \
+         numbertheory.inverse_mod(other._x - self._x, p)) % p
 
-    x3 = (l * l - self.__x - other.__x) % p
-    y3 = (l * (self.__x - x3) - self.__y) % p
+    x3 = (l * l - self._x - other._x) % p
+    y3 = (l * (self._x - x3) - self._y) % p
 
-    return Point(self.__curve, x3, y3)
+    return Point(self._curve, x3, y3)
 
   def __mul__(self, other):
     """Multiply a point by an integer."""
@@ -126,17 +153,37 @@ class Point(object):
       return result // 2
 
     e = other
-    if e == 0 or (self.__order and e % self.__order == 0):
+    if e == 0 or (self._order and e % self._order == 0):
       return INFINITY
     if self == INFINITY:
       return INFINITY
+    if _precomputed:
+      curve = self._curve
+      table = _precomputed.get((curve._p, curve._a, curve._b,
+                                self._x, self._y))
+      if table is not None:
+        result = table.multiply(e)
+        # lazily built tables return None while another thread builds them
+        if result is not None:
+          return result
     if e < 0:
       return (-self) * (-e)
 
+    if backend.GMPY and type(self._x) is not backend.mpz_type:
+      # do the calculation on gmpy2 integers, but return Python ints
+      result = Point(self._curve, backend.mpz(self._x),
+                     backend.mpz(self._y)) * e
+      if result == INFINITY:
+        return INFINITY
+      return Point(self._curve, int(result._x), int(result._y))
+
+    if instrument.ENABLED:
+      instrument.record("point_mul")
+
     # From X9.62 D.3.2:
 
     e3 = 3 * e
-    negative_self = Point(self.__curve, self.__x, -self.__y, self.__order)
+    negative_self = Point(self._curve, self._x, -self._y, self._order)
     i = leftmost_bit(e3) // 2
     result = self
     # print_("Multiplying %s by %d (e3 = %d):" % (self, other, e3))
@@ -159,7 +206,7 @@ class Point(object):
   def __str__(self):
     if self == INFINITY:
       return "infinity"
-    return "(%d,%d)" % (self.__x, self.__y)
+    return "(%d,%d)" % (self._x, self._y)
 
   def double(self):
     """Return a new point that is twice the old."""
@@ -169,28 +216,31 @@ class Point(object):
 
     # X9.62 B.3:
 
-    p = self.__curve.p()
-    a = self.__curve.a()
+    p = self._curve._p
+    a = self._curve._a
+    if instrument.ENABLED:
+      instrument.record("point_double")
+      instrument.record("field_mul", 4)
 
-    l = ((3 * self.__x * self.__x + a) * \
-         numbertheory.inverse_mod(2 * self.__y, p)) % p
+    l = ((3 * self._x * self._x + a) * \
+         numbertheory.inverse_mod(2 * self._y, p)) % p
 
-    x3 = (l * l - 2 * self.__x) % p
-    y3 = (l * (self.__x - x3) - self.__y) % p
+    x3 = (l * l - 2 * self._x) % p
+    y3 = (l * (self._x - x3) - self._y) % p
 
-    return Point(self.__curve, x3, y3)
+    return Point(self._curve, x3, y3)
 
   def x(self):
-    return self.__x
+    return self._x
 
   def y(self):
-    return self.__y
+    return self._y
 
   def curve(self):
-    return self.__curve
+    return self._curve
 
   def order(self):
-    return self.__order
+    return self._order
 
 
 # This one point is the Point At Infinity for all purposes:
@@ -0,0 +1,98 @@
+"""
+Counting of the arithmetic operations performed by the library.
+
+The counting is disabled by default, it is enabled only while a
+:func:`count` context manager is active::
+
+    from ecdsa import instrument
+
+    with instrument.count() as counters:
+        vk.verify(signature, data)
+    print(counters["inverse_mod"], counters["point_add"])
+
+Recorded counters:
+
+* ``point_add``, ``point_double``: additions and doublings of elliptic
+  curve points (not counting the trivial cases with point at infinity)
+* ``point_mul``: multiplications of points by a scalar
+* ``field_mul``: multiplications of field elements done in the point
+  addition and doubling formulas (multiplications by small constants are
+  not counted)
+* ``inverse_mod``: modular inversions
+* ``square_root_mod_prime``: modular square roots
+* ``verifies``: signature verifications in :class:`ecdsa.ecdsa.Public_key`
+
+Only the operations performed by the thread that entered the context
+manager are counted. When no context manager is active, the cost of the
+instrumentation is a check of a single module-level flag per operation.
+"""
+
+import threading
+from contextlib import contextmanager
+
+
+__all__ = ["count", "Counters"]
+
+
+ENABLED = False
+"""True if any thread is counting operations; checked by the hot paths."""
+
+_local = threading.local()
+_lock = threading.Lock()
+_active = 0
+
+
+class Counters(object):
+    """
+    Numbers of performed operations.
+
+    Counters can be read by indexing, operations that weren't performed
+    read as 0.
+    """
+
+    def __init__(self):
+        self.counts = {}
+
+    def __getitem__(self, name):
+        return self.counts.get(name, 0)
+
+    def __repr__(self):
+        return "Counters({0!r})".format(self.counts)
+
+
+def record(name, amount=1):
+    """Add `amount` operations `name` to the active counters."""
+    stack = getattr(_local, "stack", None)
+    if stack:
+        for counters in stack:
+            counts = counters.counts
+            counts[name] = counts.get(name, 0) + amount
+
+
+@contextmanager
+def count():
+    """
+    Count operations performed by the current thread inside the block.
+
+    Context managers can be nested, the outer ones include the operations
+    counted by the inner ones.
+
+    :return: context manager returning the :class:`Counters` object
+    """
+    global ENABLED, _active
+
+    counters = Counters()
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(counters)
+    with _lock:
+        _active += 1
+        ENABLED = True
+    try:
+        yield counters
+    finally:
+        stack.remove(counters)
+        with _lock:
+            _active -= 1
+            ENABLED = _active > 0
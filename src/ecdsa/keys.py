@@ -66,24 +66,307 @@ Primary classes for performing signing and verification operations.
         little-endian system and vice-versa.
 """
 
+import base64
 import binascii
+import bisect
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from hashlib import sha1
 from six import PY3, b
 from . import ecdsa
 from . import der
 from . import rfc6979
 from . import ellipticcurve
-from .curves import NIST192p, find_curve
+from . import instrument
+from . import backend
+from .curves import NIST192p, find_curve, find_curve_by_encoded_oid
+from .precompute import precompute
 from .numbertheory import square_root_mod_prime, SquareRootError
 from .ecdsa import RSZeroError
 from .util import string_to_number, number_to_string, randrange
 from .util import sigencode_string, sigdecode_string
-from .util import oid_ecPublicKey, encoded_oid_ecPublicKey, MalformedSignature
-from ._compat import normalise_bytes
+from .util import encoded_oid_ecPublicKey, MalformedSignature
+from ._compat import normalise_bytes, slots_getstate, slots_setstate
 
 
 __all__ = ["BadSignatureError", "BadDigestError", "VerifyingKey", "SigningKey",
-           "MalformedPointError"]
+           "MalformedPointError", "KeyIndex", "serialise_keys",
+           "VerificationCache", "add_hook", "remove_hook",
+           "LatencyHistogram"]
+
+
+def _find_curve_by_encoded_oid(encoded_oid):
+    """Find the curve by the encoding of its OID, decode it only if needed."""
+    curve = find_curve_by_encoded_oid(bytes(encoded_oid))
+    if curve is None:
+        oid, _ = der.remove_object(encoded_oid)
+        # raises UnknownCurveError for unknown curves
+        curve = find_curve(oid)
+    return curve
+
+
+# guards the creation of the caches of encodings of keys
+_encodings_lock = threading.Lock()
+
+
+def _memoise_encoding(method):
+    """
+    Cache the result of an encoding method of a key.
+
+    The method must take a single argument, with a default value, that
+    selects the encoding of the point. The result is cached by the value
+    of that argument, so ``to_string()``, ``to_string("raw")`` and
+    ``to_string(encoding="raw")`` share one entry. Invalid encodings raise
+    an exception and are not cached. The key needs to be immutable.
+
+    The cache is created on the first encoding, so keys that are never
+    encoded don't pay for it. It then takes 64 bytes plus, for every
+    encoding used, the encoded bytes and a dict entry (64-bit CPython 3),
+    with at most four entries for :meth:`VerifyingKey.to_string` and three
+    for each of the DER and PEM methods.
+    """
+    name = method.__name__
+    arg_name = method.__code__.co_varnames[1]
+    default = method.__defaults__[0]
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not kwargs and len(args) <= 1:
+            arg = args[0] if args else default
+        elif not args and len(kwargs) == 1 and arg_name in kwargs:
+            arg = kwargs[arg_name]
+        else:
+            # let the method report the invalid call
+            return method(self, *args, **kwargs)
+        cache_key = (name, arg)
+        encodings = self._encodings
+        if encodings is None:
+            # check again under the lock, so that threads encoding a new
+            # key at the same time don't replace each other's caches
+            with _encodings_lock:
+                encodings = self._encodings
+                if encodings is None:
+                    encodings = self._encodings = {}
+        try:
+            return encodings[cache_key]
+        except KeyError:
+            pass
+        encoding = method(self, arg)
+        encodings[cache_key] = encoding
+        return encoding
+    return wrapper
+
+
+_before_hooks = []
+_after_hooks = []
+_hook_state = threading.local()
+_timer = getattr(time, "perf_counter", time.time)
+
+
+def add_hook(when, callback):
+    """
+    Register a callback called around signing, verification, parsing and
+    serialisation of keys.
+
+    The "before" callbacks are called with the curve, the operation name
+    and the encoding, as positional arguments. The "after" callbacks are
+    called with the curve, operation name, encoding, elapsed time in
+    seconds and the exception raised by the operation (None if it
+    succeeded).
+
+    Operations are "sign", "verify", "parse" and "serialise". The encoding
+    is the name of the signature encoding ("string", "der", ...) for
+    signing and verification, and the key encoding ("raw", "compressed",
+    "der", "pem", ...) for the key operations; "string" for keys parsed
+    with `from_string`. The curve is None in "before" callbacks of parse
+    operations where it's not known until the key is decoded.
+
+    Only the outermost operation is reported, for example
+    :func:`VerifyingKey.verify` calls :func:`VerifyingKey.verify_digest`,
+    but the callbacks are called once. Operations performed inside the
+    callbacks are not reported.
+
+    :param str when: "before" or "after"
+    :param callable callback: the function to call
+    """
+    if when == "before":
+        _before_hooks.append(callback)
+    elif when == "after":
+        _after_hooks.append(callback)
+    else:
+        raise ValueError("Hooks can be called only 'before' or 'after' "
+                         "the operation")
+
+
+def remove_hook(when, callback):
+    """Unregister a callback added with :func:`add_hook`."""
+    if when == "before":
+        _before_hooks.remove(callback)
+    elif when == "after":
+        _after_hooks.remove(callback)
+    else:
+        raise ValueError("Hooks can be called only 'before' or 'after' "
+                         "the operation")
+
+
+def _argument(args, kwargs, spec):
+    """Return value of argument specified as (name, position, default)."""
+    name, position, default = spec
+    if name in kwargs:
+        return kwargs[name]
+    if len(args) > position:
+        return args[position]
+    return default
+
+
+def _hooked(operation, encoding, encoding_arg=None, curve_arg=None):
+    """
+    Call the registered hooks around the decorated method.
+
+    :param str operation: name of the operation
+    :param str encoding: name of the encoding, if not specified by argument
+    :param tuple encoding_arg: the name, position (not counting `self`)
+        and default value of the argument that specifies the encoding, a
+        function name like "sigencode_der" is reported as "der"
+    :param tuple curve_arg: the name, position and default of the argument
+        with the curve, for class methods
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(first, *args, **kwargs):
+            if not _before_hooks and not _after_hooks or \
+                    getattr(_hook_state, "active", False):
+                return method(first, *args, **kwargs)
+
+            enc = encoding
+            if encoding_arg:
+                enc = _argument(args, kwargs, encoding_arg)
+                if callable(enc):
+                    enc = enc.__name__.split("_", 1)[-1]
+            if curve_arg:
+                curve = _argument(args, kwargs, curve_arg)
+            elif isinstance(first, type):
+                curve = None
+            else:
+                curve = first.curve
+
+            _hook_state.active = True
+            try:
+                for hook in _before_hooks:
+                    hook(curve, operation, enc)
+                start = _timer()
+                try:
+                    result = method(first, *args, **kwargs)
+                except Exception as e:
+                    elapsed = _timer() - start
+                    for hook in _after_hooks:
+                        hook(curve, operation, enc, elapsed, e)
+                    raise
+                elapsed = _timer() - start
+                if curve is None:
+                    curve = result.curve
+                for hook in _after_hooks:
+                    hook(curve, operation, enc, elapsed, None)
+                return result
+            finally:
+                _hook_state.active = False
+        return wrapper
+    return decorator
+
+
+class LatencyHistogram(object):
+    """
+    Histogram of durations of the operations, usable as an "after" hook.
+
+    Durations are counted in buckets with exponentially growing upper
+    bounds, separately for every combination of curve, operation and
+    encoding::
+
+        histogram = LatencyHistogram()
+        add_hook("after", histogram)
+        ...
+        print(histogram.percentile("NIST256p", "verify", "der", 0.99))
+
+    Failed operations are not counted. The object is thread-safe.
+    """
+
+    def __init__(self, bounds=None):
+        """
+        Create an empty histogram.
+
+        :param bounds: increasing upper bounds of the buckets, in seconds,
+            by default powers of two from 1 microsecond to about 16
+            seconds; durations above the last bound are counted in an extra
+            bucket
+        :type bounds: list of float
+        """
+        if bounds is None:
+            bounds = [1e-6 * 2 ** i for i in range(25)]
+        self.bounds = list(bounds)
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, curve, operation, encoding, elapsed, error=None):
+        """Record a single operation, signature matches the "after" hook."""
+        if error is not None:
+            return
+        key = (getattr(curve, "name", None), operation, encoding)
+        bucket = bisect.bisect_left(self.bounds, elapsed)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                entry = self._data[key] = [[0] * (len(self.bounds) + 1),
+                                           0, 0.0]
+            entry[0][bucket] += 1
+            entry[1] += 1
+            entry[2] += elapsed
+
+    def clear(self):
+        """Remove all recorded durations."""
+        with self._lock:
+            self._data.clear()
+
+    def snapshot(self):
+        """
+        Return the recorded data.
+
+        :return: dictionary indexed by tuples of curve name, operation and
+            encoding, with dictionaries with the number of operations
+            (``count``), their total duration (``total``) and the counts
+            in individual buckets (``buckets``, the last one is for
+            durations above the last bound) as values
+        :rtype: dict
+        """
+        with self._lock:
+            return dict((key, {"count": count, "total": total,
+                               "buckets": list(buckets)})
+                        for key, (buckets, count, total)
+                        in self._data.items())
+
+    def percentile(self, curve_name, operation, encoding, fraction):
+        """
+        Return the upper bound of the bucket with the given percentile.
+
+        :param float fraction: the percentile as a fraction, e.g. 0.99
+        :return: bound in seconds, infinity if the percentile is in the
+            overflow bucket, or None if no operations were recorded
+        :rtype: float
+        """
+        with self._lock:
+            entry = self._data.get((curve_name, operation, encoding))
+            if entry is None:
+                return None
+            buckets, count = entry[0], entry[1]
+        needed = fraction * count
+        seen = 0
+        for bound, number in zip(self.bounds, buckets):
+            seen += number
+            if seen >= needed:
+                return bound
+        return float("inf")
 
 
 class BadSignatureError(Exception):
@@ -124,8 +407,15 @@ class VerifyingKey(object):
     :vartype default_hashfunc: callable
     :ivar pubkey: the actual public key
     :vartype pubkey: ecdsa.ecdsa.Public_key
+
+    The encodings returned by :func:`to_string`, :func:`to_der` and
+    :func:`to_pem` are calculated once and cached, the fields of the
+    object must not be modified after it's created.
     """
 
+    __slots__ = ("curve", "default_hashfunc", "pubkey", "_encodings",
+                 "__weakref__")
+
     def __init__(self, _error__please_use_generate=None):
         """Unsupported, please use one of the classmethods to initialise."""
         if not _error__please_use_generate:
@@ -134,6 +424,16 @@ class VerifyingKey(object):
         self.curve = None
         self.default_hashfunc = None
         self.pubkey = None
+        self._encodings = None
+
+    def __getstate__(self):
+        state = slots_getstate(self)
+        # the memoised encodings are calculated again when needed
+        state["_encodings"] = None
+        return state
+
+    def __setstate__(self, state):
+        slots_setstate(self, state)
 
     def __repr__(self):
         pub_key = self.to_string("compressed")
@@ -167,6 +467,30 @@ class VerifyingKey(object):
         self.pubkey.order = curve.order
         return self
 
+    def precompute(self, window=None, lazy=False):
+        """
+        Speed up verification with a precomputed table for this key.
+
+        Useful for keys that verify many signatures: a table of
+        multiples of the public point, together with the table for the
+        curve generator (see :meth:`ecdsa.curves.Curve.precompute`), makes
+        verification a few times faster. A table for a NIST256p key
+        takes about 60 KiB with the default window width.
+
+        Safe to call multiple times and from multiple threads, the table
+        is built only once and shared by all keys with the same point.
+
+        :param int window: the window width of the table, see
+            :meth:`ecdsa.precompute.PointTable.build`, selected by
+            :func:`ecdsa.curves.choose_window` if not specified
+        :param bool lazy: if True, the table is built on the first
+            verification, otherwise immediately
+
+        :return: the table, or None if no table fits in the memory budget
+        :rtype: ecdsa.precompute.PointTable or ecdsa.precompute.LazyTable
+        """
+        return precompute(self.curve, self.pubkey.point, window, lazy)
+
     @staticmethod
     def _from_raw_encoding(string, curve, validate_point):
         """
@@ -199,21 +523,32 @@ class VerifyingKey(object):
 
         is_even = string[:1] == b('\x02')
         x = string_to_number(string[1:])
-        order = curve.order
-        p = curve.curve.p()
-        alpha = (pow(x, 3, p) + (curve.curve.a() * x) + curve.curve.b()) % p
-        try:
-            beta = square_root_mod_prime(alpha, p)
-        except SquareRootError as e:
-            raise MalformedPointError(
-                "Encoding does not correspond to a point on curve", e)
+        ctx = curve.ctx
+        p = ctx.p
+        alpha = (pow(x, 3, p) + (ctx.a * x) + ctx.b) % p
+        if ctx.p_mod_4_is_3:
+            if instrument.ENABLED:
+                instrument.record("square_root_mod_prime")
+            if backend.GMPY:
+                beta = int(pow(backend.mpz(alpha), ctx.sqrt_exponent, p))
+            else:
+                beta = pow(alpha, ctx.sqrt_exponent, p)
+            if beta * beta % p != alpha:
+                raise MalformedPointError(
+                    "Encoding does not correspond to a point on curve")
+        else:
+            try:
+                beta = square_root_mod_prime(alpha, p)
+            except SquareRootError as e:
+                raise MalformedPointError(
+                    "Encoding does not correspond to a point on curve", e)
         if is_even == bool(beta & 1):
             y = p - beta
         else:
             y = beta
         if validate_point and not ecdsa.point_is_valid(curve.generator, x, y):
             raise MalformedPointError("Point does not lie on curve")
-        return ellipticcurve.Point(curve.curve, x, y, order)
+        return ellipticcurve.Point(curve.curve, x, y, ctx.order)
 
     @classmethod
     def _from_hybrid(cls, string, curve, validate_point):
@@ -233,6 +568,7 @@ class VerifyingKey(object):
         return point
 
     @classmethod
+    @_hooked("parse", "string", curve_arg=("curve", 1, NIST192p))
     def from_string(cls, string, curve=NIST192p, hashfunc=sha1,
                     validate_point=True):
         """
@@ -283,6 +619,7 @@ class VerifyingKey(object):
         return cls.from_public_point(point, curve, hashfunc)
 
     @classmethod
+    @_hooked("parse", "pem")
     def from_pem(cls, string):
         """
         Initialise from public key stored in :term:`PEM` format.
@@ -304,6 +641,7 @@ class VerifyingKey(object):
         return cls.from_der(der.unpem(string))
 
     @classmethod
+    @_hooked("parse", "der")
     def from_der(cls, string):
         """
         Initialise the key stored in :term:`DER` format.
@@ -341,15 +679,18 @@ class VerifyingKey(object):
                                     binascii.hexlify(empty))
         s2, point_str_bitstring = der.remove_sequence(s1)
         # s2 = oid_ecPublicKey,oid_curve
-        oid_pk, rest = der.remove_object(s2)
-        oid_curve, empty = der.remove_object(rest)
+        # compare the encodings of the identifiers directly, decode them
+        # only when they don't match anything known
+        oid_pk, rest = der.remove_encoded_object(s2)
+        oid_curve, empty = der.remove_encoded_object(rest)
         if empty != b"":
             raise der.UnexpectedDER("trailing junk after DER pubkey objects: %s" %
                                     binascii.hexlify(empty))
-        if not oid_pk == oid_ecPublicKey:
+        if bytes(oid_pk) != encoded_oid_ecPublicKey:
+            oid_pk, _ = der.remove_object(oid_pk)
             raise der.UnexpectedDER("Unexpected object identifier in DER "
                                     "encoding: {0!r}".format(oid_pk))
-        curve = find_curve(oid_curve)
+        curve = _find_curve_by_encoded_oid(oid_curve)
         point_str, empty = der.remove_bitstring(point_str_bitstring, 0)
         if empty != b"":
             raise der.UnexpectedDER("trailing junk after pubkey pointstring: %s" %
@@ -426,7 +767,7 @@ class VerifyingKey(object):
         :rtype: VerifyingKey
         """
         generator = curve.generator
-        r, s = sigdecode(signature, generator.order())
+        r, s = sigdecode(signature, curve.order)
         sig = ecdsa.Signature(r, s)
 
         digest = normalise_bytes(digest)
@@ -462,6 +803,8 @@ class VerifyingKey(object):
         else:
             return b('\x06') + raw_enc
 
+    @_hooked("serialise", "raw", ("encoding", 0, "raw"))
+    @_memoise_encoding
     def to_string(self, encoding="raw"):
         """
         Convert the public key to a byte string.
@@ -492,6 +835,8 @@ class VerifyingKey(object):
         else:
             return self._compressed_encode()
 
+    @_hooked("serialise", "pem")
+    @_memoise_encoding
     def to_pem(self, point_encoding="uncompressed"):
         """
         Convert the public key to the :term:`PEM` format.
@@ -512,6 +857,8 @@ class VerifyingKey(object):
         """
         return der.topem(self.to_der(point_encoding), "PUBLIC KEY")
 
+    @_hooked("serialise", "der")
+    @_memoise_encoding
     def to_der(self, point_encoding="uncompressed"):
         """
         Convert the public key to the :term:`DER` format.
@@ -537,8 +884,9 @@ class VerifyingKey(object):
                                    # bit string
                                    der.encode_bitstring(point_str, 0))
 
+    @_hooked("verify", None, ("sigdecode", 3, sigdecode_string))
     def verify(self, signature, data, hashfunc=None,
-               sigdecode=sigdecode_string):
+               sigdecode=sigdecode_string, cache=None):
         """
         Verify a signature made over provided data.
 
@@ -564,6 +912,9 @@ class VerifyingKey(object):
             second one. See :func:`ecdsa.util.sigdecode_string` and
             :func:`ecdsa.util.sigdecode_der` for examples.
         :type sigdecode: callable
+        :param cache: cache of successful verifications to use, none by
+            default
+        :type cache: VerificationCache
 
         :raises BadSignatureError: if the signature is invalid or malformed
         :raises BadDigestError: if the provided hash is too big for the curve
@@ -578,9 +929,11 @@ class VerifyingKey(object):
 
         hashfunc = hashfunc or self.default_hashfunc
         digest = hashfunc(data).digest()
-        return self.verify_digest(signature, digest, sigdecode)
+        return self.verify_digest(signature, digest, sigdecode, cache)
 
-    def verify_digest(self, signature, digest, sigdecode=sigdecode_string):
+    @_hooked("verify", None, ("sigdecode", 2, sigdecode_string))
+    def verify_digest(self, signature, digest, sigdecode=sigdecode_string,
+                      cache=None):
         """
         Verify a signature made over provided hash value.
 
@@ -600,6 +953,9 @@ class VerifyingKey(object):
             second one. See :func:`ecdsa.util.sigdecode_string` and
             :func:`ecdsa.util.sigdecode_der` for examples.
         :type sigdecode: callable
+        :param cache: cache of successful verifications to use, none by
+            default
+        :type cache: VerificationCache
 
         :raises BadSignatureError: if the signature is invalid or malformed
         :raises BadDigestError: if the provided hash is too big for the curve
@@ -620,8 +976,15 @@ class VerifyingKey(object):
             r, s = sigdecode(signature, self.pubkey.order)
         except (der.UnexpectedDER, MalformedSignature) as e:
             raise BadSignatureError("Malformed formatting of signature", e)
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.cache_key(self, r, s, digest)
+            if cache_key is not None and cache.lookup(cache_key):
+                return True
         sig = ecdsa.Signature(r, s)
         if self.pubkey.verifies(number, sig):
+            if cache_key is not None:
+                cache.add(cache_key)
             return True
         raise BadSignatureError("Signature verification failed")
 
@@ -638,8 +1001,15 @@ class SigningKey(object):
     :ivar ecdsa.keys.VerifyingKey verifying_key: the public key
         associated with this private key
     :ivar ecdsa.ecdsa.Private_key privkey: the actual private key
+
+    The encodings returned by :func:`to_der` and :func:`to_pem` are
+    calculated once and cached, the fields of the object must not be
+    modified after it's created.
     """
 
+    __slots__ = ("curve", "default_hashfunc", "baselen", "verifying_key",
+                 "privkey", "_secexp_octets", "_encodings", "__weakref__")
+
     def __init__(self, _error__please_use_generate=None):
         """Unsupported, please use one of the classmethods to initialise."""
         if not _error__please_use_generate:
@@ -649,6 +1019,36 @@ class SigningKey(object):
         self.baselen = None
         self.verifying_key = None
         self.privkey = None
+        self._secexp_octets = None
+        self._encodings = None
+
+    def __getstate__(self):
+        state = slots_getstate(self)
+        # the memoised encodings are calculated again when needed
+        state["_encodings"] = None
+        return state
+
+    def __setstate__(self, state):
+        slots_setstate(self, state)
+
+    def precompute(self, window=None, lazy=False):
+        """
+        Speed up signing with a precomputed table for the curve generator.
+
+        The table is shared by all keys on the curve, it's the same as
+        calling :meth:`ecdsa.curves.Curve.precompute` and is built only
+        once, also when called from multiple threads.
+
+        :param int window: the window width of the table, see
+            :meth:`ecdsa.precompute.PointTable.build`, selected by
+            :func:`ecdsa.curves.choose_window` if not specified
+        :param bool lazy: if True, the table is built on the first use,
+            otherwise immediately
+
+        :return: the table, or None if no table fits in the memory budget
+        :rtype: ecdsa.precompute.PointTable or ecdsa.precompute.LazyTable
+        """
+        return self.curve.precompute(window, lazy)
 
     @classmethod
     def generate(cls, curve=NIST192p, entropy=None, hashfunc=sha1):
@@ -714,9 +1114,12 @@ class SigningKey(object):
         pubkey = self.verifying_key.pubkey
         self.privkey = ecdsa.Private_key(pubkey, secexp)
         self.privkey.order = n
+        # used both by to_string() and as the int2octets(x) value in RFC6979
+        self._secexp_octets = number_to_string(secexp, n)
         return self
 
     @classmethod
+    @_hooked("parse", "string", curve_arg=("curve", 1, NIST192p))
     def from_string(cls, string, curve=NIST192p, hashfunc=sha1):
         """
         Decode the private key from :term:`raw encoding`.
@@ -751,6 +1154,7 @@ class SigningKey(object):
         return cls.from_secret_exponent(secexp, curve, hashfunc)
 
     @classmethod
+    @_hooked("parse", "pem")
     def from_pem(cls, string, hashfunc=sha1):
         """
         Initialise from key stored in :term:`PEM` format.
@@ -792,6 +1196,7 @@ class SigningKey(object):
         return cls.from_der(der.unpem(privkey_pem), hashfunc)
 
     @classmethod
+    @_hooked("parse", "der")
     def from_der(cls, string, hashfunc=sha1):
         """
         Initialise from key stored in :term:`DER` format.
@@ -849,11 +1254,11 @@ class SigningKey(object):
         if tag != 0:
             raise der.UnexpectedDER("expected tag 0 in DER privkey,"
                                     " got %d" % tag)
-        curve_oid, empty = der.remove_object(curve_oid_str)
+        curve_oid, empty = der.remove_encoded_object(curve_oid_str)
         if empty != b(""):
             raise der.UnexpectedDER("trailing junk after DER privkey "
                                     "curve_oid: %s" % binascii.hexlify(empty))
-        curve = find_curve(curve_oid)
+        curve = _find_curve_by_encoded_oid(curve_oid)
 
         # we don't actually care about the following fields
         #
@@ -871,6 +1276,7 @@ class SigningKey(object):
             privkey_str = b("\x00") * (curve.baselen - len(privkey_str)) + privkey_str
         return cls.from_string(privkey_str, curve, hashfunc)
 
+    @_hooked("serialise", "raw")
     def to_string(self):
         """
         Convert the private key to :term:`raw encoding`.
@@ -882,10 +1288,10 @@ class SigningKey(object):
         :return: raw encoding of private key
         :rtype: bytes
         """
-        secexp = self.privkey.secret_multiplier
-        s = number_to_string(secexp, self.privkey.order)
-        return s
+        return self._secexp_octets
 
+    @_hooked("serialise", "pem")
+    @_memoise_encoding
     def to_pem(self, point_encoding="uncompressed"):
         """
         Convert the private key to the :term:`PEM` format.
@@ -905,6 +1311,8 @@ class SigningKey(object):
         # TODO: "BEGIN ECPARAMETERS"
         return der.topem(self.to_der(point_encoding), "EC PRIVATE KEY")
 
+    @_hooked("serialise", "der")
+    @_memoise_encoding
     def to_der(self, point_encoding="uncompressed"):
         """
         Convert the private key to the :term:`DER` format.
@@ -945,6 +1353,7 @@ class SigningKey(object):
         """
         return self.verifying_key
 
+    @_hooked("sign", None, ("sigencode", 2, sigencode_string))
     def sign_deterministic(self, data, hashfunc=None,
                            sigencode=sigencode_string,
                            extra_entropy=b''):
@@ -987,6 +1396,7 @@ class SigningKey(object):
             digest, hashfunc=hashfunc, sigencode=sigencode,
             extra_entropy=extra_entropy)
 
+    @_hooked("sign", None, ("sigencode", 2, sigencode_string))
     def sign_digest_deterministic(self, digest, hashfunc=None,
                                   sigencode=sigencode_string,
                                   extra_entropy=b''):
@@ -1033,8 +1443,10 @@ class SigningKey(object):
         retry_gen = 0
         while True:
             k = rfc6979.generate_k(
-                self.curve.generator.order(), secexp, hashfunc, digest,
-                retry_gen=retry_gen, extra_entropy=extra_entropy)
+                self.curve.order, secexp, hashfunc, digest,
+                retry_gen=retry_gen, extra_entropy=extra_entropy,
+                secexp_octets=self._secexp_octets,
+                qlen=self.curve.ctx.order_bits)
             try:
                 r, s, order = self.sign_digest(digest, sigencode=simple_r_s, k=k)
                 break
@@ -1043,6 +1455,7 @@ class SigningKey(object):
 
         return sigencode(r, s, order)
 
+    @_hooked("sign", None, ("sigencode", 3, sigencode_string))
     def sign(self, data, entropy=None, hashfunc=None,
              sigencode=sigencode_string, k=None):
         """
@@ -1093,6 +1506,7 @@ class SigningKey(object):
         h = hashfunc(data).digest()
         return self.sign_digest(h, entropy, sigencode, k)
 
+    @_hooked("sign", None, ("sigencode", 2, sigencode_string))
     def sign_digest(self, digest, entropy=None, sigencode=sigencode_string,
                     k=None):
         """
@@ -1168,3 +1582,328 @@ class SigningKey(object):
         assert 1 <= _k < order
         sig = self.privkey.sign(number, _k)
         return sig.r, sig.s
+
+
+def serialise_keys(keys, encoding="pem", point_encoding="uncompressed",
+                   out=None):
+    """
+    Write encodings of multiple keys into a single buffer.
+
+    :param keys: the keys to serialise, public or private
+    :type keys: iterable of VerifyingKey or SigningKey
+    :param str encoding: "pem" to output concatenated PEM blocks, "der"
+        to output concatenated DER structures
+    :param str point_encoding: encoding of the public points, see
+        :func:`VerifyingKey.to_der`
+    :param bytearray out: buffer to append the encodings to, a new one is
+        created if not specified
+
+    :return: the buffer with encoded keys
+    :rtype: bytearray
+    """
+    if encoding not in ("pem", "der"):
+        raise ValueError("Unsupported encoding: {0}".format(encoding))
+    if out is None:
+        out = bytearray()
+    for key in keys:
+        if encoding == "pem":
+            out += key.to_pem(point_encoding)
+        else:
+            out += key.to_der(point_encoding)
+    return out
+
+
+class VerificationCache(object):
+    """
+    Bounded cache of successful signature verifications.
+
+    Verifying the same signature of the same digest with the same key
+    again, with the cache passed to :func:`VerifyingKey.verify` or
+    :func:`VerifyingKey.verify_digest`, will be a dictionary lookup instead
+    of elliptic curve arithmetic. Failed verifications are never cached.
+
+    The entries are SHA-256 hashes of the curve, public key, the decoded
+    signature and the digest; when the cache is full, the least recently
+    used entry is evicted. The object can be shared between threads.
+
+    :ivar int max_size: maximum number of cached verifications
+    :ivar int hits: number of lookups that found a cached verification
+    :ivar int misses: number of lookups that didn't find one
+    """
+
+    def __init__(self, max_size=4096):
+        """
+        Create an empty cache.
+
+        :param int max_size: maximum number of cached verifications
+        """
+        if max_size < 1:
+            raise ValueError("Cache size must be positive")
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return number of cached verifications."""
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        """Fraction of lookups that found a cached verification."""
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return self.hits / float(lookups)
+
+    @staticmethod
+    def cache_key(verifying_key, r, s, digest):
+        """
+        Calculate the cache entry for given key, signature and digest.
+
+        :return: the entry, or None if the signature values are out of range
+            (such signatures are invalid)
+        :rtype: bytes
+        """
+        order = verifying_key.pubkey.order
+        if not 0 < r < order or not 0 < s < order:
+            return None
+        return hashlib.sha256(b"".join([
+            verifying_key.curve.encoded_oid,
+            verifying_key.to_string(),
+            number_to_string(r, order),
+            number_to_string(s, order),
+            bytes(digest)])).digest()
+
+    def lookup(self, key):
+        """Check if the entry is cached, update the hit rate counters."""
+        with self._lock:
+            try:
+                self._entries[key] = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return False
+            self.hits += 1
+            return True
+
+    def add(self, key):
+        """Add an entry for a successful verification."""
+        with self._lock:
+            entries = self._entries
+            entries.pop(key, None)
+            if len(entries) >= self.max_size:
+                entries.popitem(last=False)
+            entries[key] = True
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def _spki_sha256(key, point_str, spki):
+    return hashlib.sha256(spki).digest()
+
+
+def _rfc7093_id(hash_name):
+    def key_id(key, point_str, spki):
+        # RFC 7093 methods 1 to 3: leftmost 160 bits of the hash of the
+        # subjectPublicKey BIT STRING value
+        return hashlib.new(hash_name, point_str).digest()[:20]
+    return key_id
+
+
+def _compressed_point(key, point_str, spki):
+    return key.to_string("compressed")
+
+
+class KeyIndex(object):
+    """
+    Collection of public keys indexed by their key identifiers.
+
+    Supported types of key identifiers:
+
+    * ``spki_sha256``: SHA-256 of the :term:`DER` encoding of the public key
+      (the SubjectPublicKeyInfo structure), equal to RFC 7093 method 4
+    * ``rfc7093_sha256``, ``rfc7093_sha384``, ``rfc7093_sha512``: leftmost
+      160 bits of the hash of the encoded public point, as specified in
+      RFC 7093 methods 1, 2 and 3
+    * ``compressed_point``: the :term:`compressed` encoding of the public
+      point
+
+    The identifiers are calculated once, when the key is added. Keys
+    added multiple times (from different encodings, for example) are
+    represented by a single VerifyingKey object, the one that was added
+    first.
+
+    The object is not thread-safe, concurrent modifications need to be
+    serialised by the caller.
+    """
+
+    id_types = {"spki_sha256": _spki_sha256,
+                "rfc7093_sha256": _rfc7093_id("sha256"),
+                "rfc7093_sha384": _rfc7093_id("sha384"),
+                "rfc7093_sha512": _rfc7093_id("sha512"),
+                "compressed_point": _compressed_point}
+    """Functions calculating the supported types of key identifiers."""
+
+    def __init__(self, id_types=("spki_sha256",),
+                 point_encoding="uncompressed"):
+        """
+        Create an empty index.
+
+        :param id_types: the types of identifiers under which the keys
+            will be indexed
+        :type id_types: iterable of str
+        :param str point_encoding: the point encoding used in the public
+            key structure for calculating the SPKI and RFC 7093 identifiers,
+            "uncompressed" or "compressed"
+        """
+        id_types = tuple(id_types)
+        for i in id_types:
+            if i not in self.id_types:
+                raise ValueError("Unknown key identifier type: {0}"
+                                 .format(i))
+        if point_encoding not in ("uncompressed", "compressed"):
+            raise ValueError("Unsupported point encoding: {0}"
+                             .format(point_encoding))
+        self._id_funcs = tuple(self.id_types[i] for i in id_types)
+        self._id_types = id_types
+        self.point_encoding = point_encoding
+        self._by_id = {}
+        self._by_point = {}
+        self._ids = {}
+
+    def __len__(self):
+        """Return the number of distinct keys in the index."""
+        return len(self._by_point)
+
+    def __iter__(self):
+        """Iterate over the VerifyingKey objects in the index."""
+        return iter(self._by_point.values())
+
+    def __contains__(self, key_id):
+        """Check if a key with given identifier is in the index."""
+        return bytes(key_id) in self._by_id
+
+    def __getitem__(self, key_id):
+        """
+        Return the key with the given identifier.
+
+        :raises KeyError: if there's no key with such identifier
+        """
+        return self._by_id[bytes(key_id)]
+
+    def get(self, key_id, default=None):
+        """Return the key with the given identifier or the `default`."""
+        return self._by_id.get(bytes(key_id), default)
+
+    def key_ids(self, key):
+        """
+        Return identifiers of a key in the index.
+
+        :param key: key added to the index
+        :type key: VerifyingKey
+
+        :return: identifiers of the key, keyed by the identifier type
+        :rtype: dict
+        """
+        ids = self._ids[(key.curve.encoded_oid, key.to_string())]
+        return dict(zip(self._id_types, ids))
+
+    def add(self, key):
+        """
+        Add a public key to the index.
+
+        :param key: the key to add
+        :type key: VerifyingKey
+
+        :return: the key object stored in the index, the one that was added
+            previously if the index already includes the same public key
+        :rtype: VerifyingKey
+        """
+        point = (key.curve.encoded_oid, key.to_string())
+        try:
+            return self._by_point[point]
+        except KeyError:
+            pass
+        point_str = key.to_string(self.point_encoding)
+        spki = der.encode_sequence(
+            der.encode_sequence(encoded_oid_ecPublicKey,
+                                key.curve.encoded_oid),
+            der.encode_bitstring(point_str, 0))
+        ids = tuple(func(key, point_str, spki) for func in self._id_funcs)
+        self._by_point[point] = key
+        self._ids[point] = ids
+        for key_id in ids:
+            self._by_id.setdefault(key_id, key)
+        return key
+
+    def add_der(self, string, hashfunc=sha1):
+        """
+        Add a public key in the :term:`DER` format to the index.
+
+        If the encoding is the same as the one used for calculating the
+        identifiers, and the index includes the key already, the existing
+        key is returned without parsing the encoding.
+
+        :param string: DER encoding of the public key, see
+            :func:`VerifyingKey.from_der`
+        :type string: bytes-like object
+        :param hashfunc: default hash function of the created VerifyingKey
+
+        :rtype: VerifyingKey
+        """
+        if _spki_sha256 in self._id_funcs:
+            key = self._by_id.get(hashlib.sha256(string).digest())
+            if key is not None:
+                return key
+        key = VerifyingKey.from_der(string)
+        key.default_hashfunc = hashfunc
+        return self.add(key)
+
+    def add_pem(self, pem, hashfunc=sha1):
+        """
+        Add all public keys from a :term:`PEM` encoded string to the index.
+
+        The string can include any number of ``PUBLIC KEY`` blocks, blocks
+        of other types are ignored.
+
+        :param pem: concatenated PEM encoded keys
+        :type pem: str or bytes
+
+        :return: the keys stored in the index, in the order of the blocks
+        :rtype: list of VerifyingKey
+        """
+        if not isinstance(pem, bytes):
+            pem = pem.encode()
+        keys = []
+        body = None
+        for line in pem.splitlines():
+            line = line.strip()
+            if line == b"-----BEGIN PUBLIC KEY-----":
+                body = []
+            elif line == b"-----END PUBLIC KEY-----":
+                if body is not None:
+                    keys.append(self.add_der(
+                        base64.b64decode(b"".join(body)), hashfunc))
+                body = None
+            elif body is not None:
+                body.append(line)
+        return keys
+
+    def update(self, keys, hashfunc=sha1):
+        """
+        Add multiple keys to the index.
+
+        :param keys: VerifyingKey objects or DER encoded public keys
+        :type keys: iterable
+
+        :return: the keys stored in the index
+        :rtype: list of VerifyingKey
+        """
+        return [self.add(i) if isinstance(i, VerifyingKey)
+                else self.add_der(i, hashfunc) for i in keys]
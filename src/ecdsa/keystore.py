@@ -0,0 +1,350 @@
+"""
+Compact storage for large numbers of public keys.
+
+Keeping a :class:`~ecdsa.keys.VerifyingKey` object for every known public
+key is expensive when there are millions of them.
+:class:`PublicKeyStore` instead keeps the :term:`raw encoding` (or
+:term:`compressed`/:term:`uncompressed` encoding) of all keys for a
+single curve in one contiguous buffer and creates the
+:class:`~ecdsa.keys.VerifyingKey` objects only when they are needed.
+
+Example::
+
+    store = PublicKeyStore(NIST256p, encoding="compressed")
+    store.append(verifying_key, key_id=b"server-1")
+    store.save("keys.bin")
+
+    store = PublicKeyStore.load("keys.bin", use_mmap=True)
+    store.get(b"server-1").verify(signature, data)
+"""
+
+import mmap
+import struct
+from collections import OrderedDict
+from hashlib import sha1
+from .keys import VerifyingKey
+from .curves import find_curve_by_encoded_oid, UnknownCurveError
+from ._compat import normalise_bytes
+
+
+__all__ = ["PublicKeyStore", "MalformedKeyStoreError"]
+
+
+class MalformedKeyStoreError(ValueError):
+    """Raised when a saved key store can't be parsed."""
+
+    pass
+
+
+_MAGIC = b"ECDSA-KS"
+_VERSION = 1
+_ENCODINGS = ("raw", "uncompressed", "compressed", "hybrid")
+
+# magic, version, encoding, length of the encoded curve OID
+_HEADER = struct.Struct(">8sBBH")
+# number of keys, number of key ids
+_COUNTS = struct.Struct(">II")
+# index of the key, length of the key id
+_KEY_ID = struct.Struct(">IH")
+
+
+def _encoding_length(curve, encoding):
+    """Return the size of a single public key in the given encoding."""
+    if encoding == "raw":
+        return 2 * curve.baselen
+    if encoding == "compressed":
+        return curve.baselen + 1
+    # uncompressed and hybrid
+    return 2 * curve.baselen + 1
+
+
+class PublicKeyStore(object):
+    """
+    Array of public keys on a single curve.
+
+    The keys are stored in a single buffer as fixed width encodings, the
+    :class:`~ecdsa.keys.VerifyingKey` objects are created on access and
+    the most recently used ones are kept in a small LRU cache.
+
+    Keys can be looked up by their position in the store or by a key id
+    (a byte string) specified when the key was added.
+
+    The object is not thread-safe, concurrent access needs to be
+    serialised by the caller.
+
+    :ivar ecdsa.curves.Curve curve: curve of all the keys in the store
+    :ivar str encoding: encoding used for storing the keys
+    :ivar int key_length: length of a single encoded key, in bytes
+    """
+
+    def __init__(self, curve, encoding="compressed", hashfunc=sha1,
+                 cache_size=128):
+        """
+        Create an empty store.
+
+        :param curve: the curve of the stored keys
+        :type curve: ecdsa.curves.Curve
+        :param str encoding: the encoding used for storing the keys, one of
+            "raw", "uncompressed", "compressed" or "hybrid". "compressed" is
+            the smallest but requires a modular square root calculation
+            for every materialised key
+        :param hashfunc: the default hash function of materialised keys
+        :type hashfunc: callable
+        :param int cache_size: the number of materialised
+            :class:`~ecdsa.keys.VerifyingKey` objects to keep
+        """
+        if encoding not in _ENCODINGS:
+            raise ValueError("Unsupported encoding: {0}".format(encoding))
+        self.curve = curve
+        self.encoding = encoding
+        self.key_length = _encoding_length(curve, encoding)
+        self.default_hashfunc = hashfunc
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._data = bytearray()
+        self._count = 0
+        self._key_ids = {}
+        self._mmap = None
+
+    def __len__(self):
+        """Return number of keys in the store."""
+        return self._count
+
+    def __iter__(self):
+        """Iterate over the keys as VerifyingKey objects."""
+        for i in range(self._count):
+            yield self[i]
+
+    def __contains__(self, key_id):
+        """Check if key with given key id is in the store."""
+        return bytes(key_id) in self._key_ids
+
+    def append(self, key, key_id=None):
+        """
+        Add a public key to the store.
+
+        :param key: the key to add, either as a VerifyingKey or as a
+            string in the encoding used by the store
+        :type key: VerifyingKey or bytes-like object
+        :param bytes key_id: optional identifier of the key
+
+        :raises ValueError: if the key is on a different curve, has a
+            different encoding, the key id is already in use or the store
+            is read-only
+
+        :return: index of the added key
+        :rtype: int
+        """
+        if self._mmap is not None:
+            raise ValueError("Memory-mapped key store is read-only")
+        if isinstance(key, VerifyingKey):
+            if key.curve is not self.curve:
+                raise ValueError("Key on wrong curve: {0}, expected {1}"
+                                 .format(key.curve, self.curve))
+            encoded = key.to_string(self.encoding)
+        else:
+            encoded = normalise_bytes(key)
+            if len(encoded) != self.key_length:
+                raise ValueError("Key encoding has length {0}, expected {1}"
+                                 .format(len(encoded), self.key_length))
+        if key_id is not None:
+            key_id = bytes(key_id)
+            if key_id in self._key_ids:
+                raise ValueError("Duplicate key id: {0!r}".format(key_id))
+            self._key_ids[key_id] = self._count
+        self._data += encoded
+        self._count += 1
+        return self._count - 1
+
+    def extend(self, keys):
+        """
+        Add multiple keys to the store.
+
+        :param keys: the keys to add, either VerifyingKey objects, encoded
+            keys or tuples of a key and its key id
+        :type keys: iterable
+        """
+        for key in keys:
+            if isinstance(key, tuple):
+                self.append(*key)
+            else:
+                self.append(key)
+
+    def get_encoding(self, index):
+        """
+        Return the encoding of the key at the given position.
+
+        :param int index: position of the key in the store
+
+        :rtype: bytes
+        """
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("key store index out of range")
+        start = index * self.key_length
+        return bytes(self._data[start:start + self.key_length])
+
+    def __getitem__(self, index):
+        """
+        Return the key at given position as a VerifyingKey.
+
+        :param int index: position of the key in the store
+
+        :rtype: VerifyingKey
+        """
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("key store index out of range")
+        cache = self._cache
+        try:
+            key = cache.pop(index)
+        except KeyError:
+            key = VerifyingKey.from_string(self.get_encoding(index),
+                                           self.curve, self.default_hashfunc)
+            if cache and len(cache) >= self._cache_size:
+                cache.popitem(last=False)
+        if self._cache_size:
+            cache[index] = key
+        return key
+
+    def index(self, key_id):
+        """
+        Return the position of the key with given key id.
+
+        :raises KeyError: if there is no key with such id
+        """
+        return self._key_ids[bytes(key_id)]
+
+    def get(self, key_id, default=None):
+        """
+        Return the key with given key id as a VerifyingKey.
+
+        :param bytes key_id: identifier of the key
+        :param default: value returned if there's no key with such id
+
+        :rtype: VerifyingKey
+        """
+        try:
+            index = self._key_ids[bytes(key_id)]
+        except KeyError:
+            return default
+        return self[index]
+
+    def to_bytes(self):
+        """
+        Serialise the store, including the key ids.
+
+        :rtype: bytes
+        """
+        encoded_oid = self.curve.encoded_oid
+        ids = sorted((index, key_id) for key_id, index
+                     in self._key_ids.items())
+        parts = [_HEADER.pack(_MAGIC, _VERSION,
+                              _ENCODINGS.index(self.encoding),
+                              len(encoded_oid)),
+                 encoded_oid,
+                 _COUNTS.pack(self._count, len(ids)),
+                 bytes(self._data)]
+        for index, key_id in ids:
+            parts.append(_KEY_ID.pack(index, len(key_id)))
+            parts.append(key_id)
+        return b"".join(parts)
+
+    def save(self, path):
+        """Write the store to a file, see :meth:`load`."""
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def from_bytes(cls, data, hashfunc=sha1, cache_size=128):
+        """
+        Create the store from a string created by :meth:`to_bytes`.
+
+        The keys are not decoded or checked for validity until they are
+        accessed.
+
+        :raises MalformedKeyStoreError: if the data is not a valid
+            serialisation of a key store
+        :raises UnknownCurveError: if the curve of the keys is not known
+        """
+        self = cls._parse(normalise_bytes(data), hashfunc, cache_size)
+        self._data = bytearray(self._data)
+        return self
+
+    @classmethod
+    def _parse(cls, data, hashfunc, cache_size):
+        """Create the store with key data referencing the `data` buffer."""
+        if len(data) < _HEADER.size:
+            raise MalformedKeyStoreError("Truncated key store header")
+        magic, version, encoding, oid_len = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise MalformedKeyStoreError("Not a key store or unsupported "
+                                         "version")
+        if encoding >= len(_ENCODINGS):
+            raise MalformedKeyStoreError("Unknown key encoding")
+        offset = _HEADER.size
+        encoded_oid = bytes(data[offset:offset + oid_len])
+        curve = find_curve_by_encoded_oid(encoded_oid)
+        if curve is None:
+            raise UnknownCurveError("Unknown curve in key store")
+        offset += oid_len
+        if len(data) < offset + _COUNTS.size:
+            raise MalformedKeyStoreError("Truncated key store header")
+        count, id_count = _COUNTS.unpack_from(data, offset)
+        offset += _COUNTS.size
+
+        self = cls(curve, _ENCODINGS[encoding], hashfunc, cache_size)
+        end = offset + count * self.key_length
+        if len(data) < end:
+            raise MalformedKeyStoreError("Truncated key data")
+        self._data = data[offset:end]
+        self._count = count
+
+        offset = end
+        key_ids = self._key_ids
+        for _ in range(id_count):
+            if len(data) < offset + _KEY_ID.size:
+                raise MalformedKeyStoreError("Truncated key ids")
+            index, id_len = _KEY_ID.unpack_from(data, offset)
+            offset += _KEY_ID.size
+            if index >= count or len(data) < offset + id_len:
+                raise MalformedKeyStoreError("Malformed key id")
+            key_ids[bytes(data[offset:offset + id_len])] = index
+            offset += id_len
+        if offset != len(data):
+            raise MalformedKeyStoreError("Trailing data after key store")
+        return self
+
+    @classmethod
+    def load(cls, path, use_mmap=False, hashfunc=sha1, cache_size=128):
+        """
+        Read the store from a file created by :meth:`save`.
+
+        The file is read in a single call, or, if `use_mmap` is True,
+        memory-mapped. A memory-mapped store is read-only and the key data
+        is paged in by the operating system only when the keys are
+        accessed.
+
+        :param str path: the file to read
+        :param bool use_mmap: whether to memory-map the file instead of
+            reading it
+        """
+        with open(path, "rb") as f:
+            if not use_mmap:
+                return cls.from_bytes(f.read(), hashfunc, cache_size)
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self = cls._parse(normalise_bytes(mapped), hashfunc, cache_size)
+        self._mmap = mapped
+        return self
+
+    def close(self):
+        """Release the memory-mapped file, if any."""
+        if self._mmap is not None:
+            self._data = bytearray()
+            self._count = 0
+            self._key_ids = {}
+            self._cache.clear()
+            self._mmap.close()
+            self._mmap = None
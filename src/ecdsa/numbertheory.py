@@ -11,16 +11,21 @@
 
 from __future__ import division
 
-from six import integer_types, PY3
+from six import integer_types
 from six.moves import reduce
 try:
     xrange
 except NameError:
     xrange = range
 
+import bisect
 import math
+import sys
 import warnings
 
+from . import backend
+from . import instrument
+
 
 class Error(Exception):
   """Base class for exceptions in this module."""
@@ -128,7 +133,9 @@ def polynomial_exp_mod(base, exponent, polymod, p):
 def jacobi(a, n):
   """Jacobi symbol"""
 
-  # Based on the Handbook of Applied Cryptography (HAC), algorithm 2.149.
+  # Iterative, binary variant of the algorithm from the Handbook of Applied
+  # Cryptography (HAC), algorithm 2.149: factors of 2 are removed with
+  # shifts and the reciprocity law is applied without recursion.
 
   # This function has been tested by comparison with a small
   # table printed in HAC, and by extensive use in calculating
@@ -137,22 +144,64 @@ def jacobi(a, n):
   assert n >= 3
   assert n % 2 == 1
   a = a % n
-  if a == 0:
+  if backend.GMPY:
+    return int(backend.jacobi(a, n))
+  s = 1
+  while a:
+    # (2/n) is -1 for n = 3 or 5 mod 8
+    n_mod_8 = n & 7
+    while not a & 1:
+      a >>= 1
+      if n_mod_8 == 3 or n_mod_8 == 5:
+        s = -s
+    # quadratic reciprocity, a and n are both odd now
+    if a & 3 == 3 and n & 3 == 3:
+      s = -s
+    a, n = n % a, a
+  if n != 1:
     return 0
-  if a == 1:
-    return 1
-  a1, e = a, 0
-  while a1 % 2 == 0:
-    a1, e = a1 // 2, e + 1
-  if e % 2 == 0 or n % 8 == 1 or n % 8 == 7:
-    s = 1
-  else:
-    s = -1
-  if a1 == 1:
-    return s
-  if n % 4 == 3 and a1 % 4 == 3:
-    s = -s
-  return s * jacobi(n % a1, a1)
+  return s
+
+
+def quadratic_residues(values, p):
+  """Check quadratic residuosity of many integers modulo an odd prime p.
+
+  Returns a list of booleans, True for every value that has a square
+  root modulo p (that includes values divisible by p), False otherwise.
+
+  This is a convenience wrapper that calls jacobi() for every value; no
+  work is shared between the values. The Legendre symbol has no batch
+  algorithm comparable to batched inversion, and the binary jacobi()
+  is already faster than Euler's criterion (a single modular
+  exponentiation per value)."""
+
+  assert p >= 3
+  assert p % 2 == 1
+  return [jacobi(a, p) != -1 for a in values]
+
+
+def _tonelli_shanks_constants(p):
+  """Return (s, q, c) such that p - 1 = q * 2**s and c = z**q for
+  a quadratic non-residue z modulo p.
+
+  The values depend only on p, so they are computed once per prime."""
+  try:
+    return _tonelli_shanks_cache[p]
+  except KeyError:
+    pass
+
+  q, s = p - 1, 0
+  while q % 2 == 0:
+    q, s = q // 2, s + 1
+
+  z = 2
+  while jacobi(z, p) != -1:
+    z = z + 1
+
+  # store Python ints, also when called with gmpy2 values
+  ret = (s, int(q), int(pow(z, q, p)))
+  _tonelli_shanks_cache[int(p)] = ret
+  return ret
 
 
 def square_root_mod_prime(a, p):
@@ -164,20 +213,33 @@ def square_root_mod_prime(a, p):
   # every prime p from 3 to 1229.
 
   assert 0 <= a < p
+  if instrument.ENABLED:
+    instrument.record("square_root_mod_prime")
   assert 1 < p
 
   if a == 0:
     return 0
   if p == 2:
     return a
+  if backend.GMPY:
+    # pow() on mpz values uses the gmpy2 modular exponentiation, the rest
+    # of the algorithm is the same
+    return int(_square_root_mod_prime(backend.mpz(a), backend.mpz(p)))
+  return _square_root_mod_prime(a, p)
 
-  jac = jacobi(a, p)
-  if jac == -1:
-    raise SquareRootError("%d has no square root modulo %d" \
-                          % (a, p))
+
+def _square_root_mod_prime(a, p):
+  """Modular square root of non-zero a, mod odd prime p."""
+
+  # in the p % 4 == 3 and p % 8 == 5 cases checking the result
+  # is cheaper than calculating the Jacobi symbol upfront
 
   if p % 4 == 3:
-    return pow(a, (p + 1) // 4, p)
+    root = pow(a, (p + 1) // 4, p)
+    if root * root % p != a:
+      raise SquareRootError("%d has no square root modulo %d" \
+                            % (a, p))
+    return root
 
   if p % 8 == 5:
     d = pow(a, (p - 1) // 4, p)
@@ -185,28 +247,72 @@ def square_root_mod_prime(a, p):
       return pow(a, (p + 3) // 8, p)
     if d == p - 1:
       return (2 * a * pow(4 * a, (p - 5) // 8, p)) % p
-    raise RuntimeError("Shouldn't get here.")
+    raise SquareRootError("%d has no square root modulo %d" \
+                          % (a, p))
 
-  if PY3:
-    range_top = p
-  else:
-    # xrange on python2 can take integers representable as C long only
-    range_top = min(0x7fffffff, p)
-  for b in xrange(2, range_top):
-    if jacobi(b * b - 4 * a, p) == -1:
-      f = (a, -b, 1)
-      ff = polynomial_exp_mod((0, 1), (p + 1) // 2, f, p)
-      assert ff[1] == 0
-      return ff[0]
-  raise RuntimeError("No b found.")
+  # p % 8 == 1, use Tonelli-Shanks (HAC, algorithm 3.34)
+  m, q, c = _tonelli_shanks_constants(p)
+  t = pow(a, q, p)
+  root = pow(a, (q + 1) // 2, p)
+  while t != 1:
+    # find the least i such that t**(2**i) == 1
+    i = 0
+    t2 = t
+    while t2 != 1:
+      t2 = t2 * t2 % p
+      i = i + 1
+      if i == m:
+        raise SquareRootError("%d has no square root modulo %d" \
+                              % (a, p))
+    b = pow(c, 1 << (m - i - 1), p)
+    m = i
+    c = b * b % p
+    t = t * c % p
+    root = root * b % p
+  return root
+
+
+# pow() can calculate modular inverses since Python 3.8
+_POW_INVERSE = sys.version_info >= (3, 8)
 
 
 def inverse_mod(a, m):
-    """Inverse of a mod m."""
+    """
+    Inverse of a mod m.
 
+    Uses gmpy2 if it's the selected backend, the built-in pow() on
+    Python 3.8 and later, and the extended Euclidean algorithm otherwise.
+    All implementations return the same values, also for a == 0 (0) and
+    for `a` not coprime with `m`.
+    """
+
+    if instrument.ENABLED:
+        instrument.record("inverse_mod")
     if a == 0:
         return 0
 
+    if backend.GMPY:
+        try:
+            inv = backend.invert(a, m)
+        except ZeroDivisionError:
+            # not invertible, return the same value as the code below
+            pass
+        else:
+            if type(a) is backend.mpz_type:
+                return inv
+            return int(inv)
+    elif _POW_INVERSE:
+        try:
+            return pow(a, -1, m)
+        except ValueError:
+            # not invertible
+            pass
+
+    return _inverse_mod_euclid(a, m)
+
+
+def _inverse_mod_euclid(a, m):
+    """Inverse of a mod m using the extended Euclidean algorithm."""
     lm, hm = 1, 0
     low, high = a % m, m
     while low > 1:
@@ -216,6 +322,25 @@ def inverse_mod(a, m):
     return lm % m
 
 
+def inverse_mod_implementations():
+    """
+    Return the available implementations of modular inversion.
+
+    For benchmarking; unlike :func:`inverse_mod` the functions don't handle
+    the special cases and don't count the operations.
+
+    :return: list of pairs of the implementation name ("euclid", "pow" or
+        "gmpy2") and the function taking the value and the modulus
+    :rtype: list
+    """
+    impls = [("euclid", _inverse_mod_euclid)]
+    if _POW_INVERSE:
+        impls.append(("pow", lambda a, m: pow(a, -1, m)))
+    if "gmpy2" in backend.available_backends():
+        impls.append(("gmpy2", lambda a, m: int(backend.invert(a, m))))
+    return impls
+
+
 try:
     gcd2 = math.gcd
 except AttributeError:
@@ -260,6 +385,38 @@ def lcm(*a):
   return a[0]
 
 
+def _pollard_brent(n):
+    """Return a non-trivial factor of an odd composite n.
+
+    Uses Brent's variant of the Pollard rho algorithm."""
+    c = 1
+    while True:
+        y, r, q, g = 2, 1, 1, 1
+        m = 128
+        while g == 1:
+            x = y
+            for _ in xrange(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in xrange(min(m, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = gcd2(q, n)
+                k = k + m
+            r = r * 2
+        if g == n:
+            # the batched product hit a multiple of n, backtrack
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = gcd2(abs(x - ys), n)
+        if g != n:
+            return g
+        c = c + 1
+
+
 def factorization(n):
   """Decompose n into a list of (prime,exponent) pairs."""
 
@@ -268,8 +425,13 @@ def factorization(n):
   if n < 2:
     return []
 
+  try:
+    return list(_factorization_cache[n])
+  except KeyError:
+    pass
+  orig_n = n
+
   result = []
-  d = 2
 
   # Test the small primes:
 
@@ -291,28 +453,23 @@ def factorization(n):
   # it may require further work:
 
   if n > smallprimes[-1]:
-    if is_prime(n):   # If what's left is prime, it's easy:
-      result.append((n, 1))
-    else:               # Ugh. Search stupidly for a divisor:
-      d = smallprimes[-1]
-      while 1:
-        d = d + 2               # Try the next divisor.
-        q, r = divmod(n, d)
-        if q < d:               # n < d*d means we're done, n = 1 or prime.
-          break
-        if r == 0:              # d divides n. How many times?
-          count = 1
-          n = q
-          while d <= n:               # As long as d might still divide n,
-            q, r = divmod(n, d)       # see if it does.
-            if r != 0:
-              break
-            n = q                     # It does. Reduce n, increase count.
-            count = count + 1
-          result.append((d, count))
-      if n > 1:
-        result.append((n, 1))
-
+    # split the remainder with Pollard rho until only primes are left
+    factors = {}
+    to_split = [n]
+    while to_split:
+      n = to_split.pop()
+      if n <= smallprimes[-1] ** 2 or is_prime(n):
+        # all factors smaller than the last small prime were removed above
+        factors[n] = factors.get(n, 0) + 1
+        continue
+      d = _pollard_brent(n)
+      to_split.append(d)
+      to_split.append(n // d)
+    result.extend(sorted(factors.items()))
+
+  if len(_factorization_cache) >= _factorization_cache_size:
+    _factorization_cache.clear()
+  _factorization_cache[orig_n] = tuple(result)
   return result
 
 
@@ -352,7 +509,7 @@ def carmichael(n):  # pragma: no cover
                 "https://github.com/warner/python-ecdsa",
                 DeprecationWarning)
 
-  return carmichael_of_factorized(factorization(n))
+  return _carmichael_of_factorized(factorization(n))
 
 
 def carmichael_of_factorized(f_list):  # pragma: no cover
@@ -365,12 +522,17 @@ def carmichael_of_factorized(f_list):  # pragma: no cover
                 "https://github.com/warner/python-ecdsa",
                 DeprecationWarning)
 
+  return _carmichael_of_factorized(f_list)
+
+
+def _carmichael_of_factorized(f_list):
+  """Carmichael function of a list of (prime,exponent) pairs."""
   if len(f_list) < 1:
     return 1
 
-  result = carmichael_of_ppower(f_list[0])
+  result = _carmichael_of_ppower(f_list[0])
   for i in xrange(1, len(f_list)):
-    result = lcm(result, carmichael_of_ppower(f_list[i]))
+    result = lcm2(result, _carmichael_of_ppower(f_list[i]))
 
   return result
 
@@ -384,6 +546,11 @@ def carmichael_of_ppower(pp):  # pragma: no cover
                 "https://github.com/warner/python-ecdsa",
                 DeprecationWarning)
 
+  return _carmichael_of_ppower(pp)
+
+
+def _carmichael_of_ppower(pp):
+  """Carmichael function of a (prime,exponent) pair."""
   p, a = pp
   if p == 2 and a > 2:
     return 2**(a - 2)
@@ -400,19 +567,19 @@ def order_mod(x, m):  # pragma: no cover
                 "https://github.com/warner/python-ecdsa",
                 DeprecationWarning)
 
-  # Warning: this implementation is not very clever, and will
-  # take a long time if m is very large.
-
   if m <= 1:
     return 0
 
   assert gcd(x, m) == 1
 
-  z = x
-  result = 1
-  while z != 1:
-    z = (z * x) % m
-    result = result + 1
+  # the order divides the Carmichael function of m, remove from it
+  # all the prime factors that are not needed to reach 1
+  result = _carmichael_of_factorized(factorization(m))
+  for p, e in factorization(result):
+    for _ in xrange(e):
+      if pow(x, result // p, m) != 1:
+        break
+      result = result // p
   return result
 
 
@@ -451,26 +618,120 @@ def kinda_order_mod(x, m):  # pragma: no cover
   return order_mod(x, largest_factor_relatively_prime(m, x))
 
 
-def is_prime(n):
+# Sets of Miller-Rabin bases that are known to correctly classify all
+# numbers smaller than the bound (Jaeschke 1993, Jiang and Deng 2014)
+_miller_rabin_deterministic_bases = (
+    (2047, (2,)),
+    (1373653, (2, 3)),
+    (25326001, (2, 3, 5)),
+    (3215031751, (2, 3, 5, 7)),
+    (2152302898747, (2, 3, 5, 7, 11)),
+    (3474749660383, (2, 3, 5, 7, 11, 13)),
+    (341550071728321, (2, 3, 5, 7, 11, 13, 17)),
+    (3825123056546413051, (2, 3, 5, 7, 11, 13, 17, 19, 23)),
+    (318665857834031151167461, (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31,
+                                37)),
+    (3317044064679887385961981, (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31,
+                                 37, 41)),
+)
+
+
+def _miller_rabin(n, bases):
+    """Return False if any of the bases is a witness for compositeness of
+    odd n, True otherwise."""
+    s = 0
+    r = n - 1
+    while (r % 2) == 0:
+        s = s + 1
+        r = r // 2
+    for a in bases:
+        y = pow(a, r, n)
+        if y != 1 and y != n - 1:
+            j = 1
+            while j <= s - 1 and y != n - 1:
+                y = pow(y, 2, n)
+                if y == 1:
+                    return False
+                j = j + 1
+            if y != n - 1:
+                return False
+    return True
+
+
+def _isqrt(n):
+    """Integer square root of a non-negative integer n."""
+    if n < 2:
+        return n
+    x = 1 << ((len("%x" % n) * 4 + 1) // 2)
+    while True:
+        y = (x + n // x) // 2
+        if y >= x:
+            return x
+        x = y
+
+
+def _is_strong_lucas_prp(n):
+    """Strong Lucas probable prime test with the Selfridge parameters,
+    for odd n that is not a perfect square."""
+    d = 5
+    while True:
+        j = jacobi(d, n)
+        if j == -1:
+            break
+        if j == 0:
+            return False
+        d = -d - 2 if d > 0 else -d + 2
+    p = 1
+    q = (1 - d) // 4
+
+    k = n + 1
+    s = 0
+    while k % 2 == 0:
+        s = s + 1
+        k = k // 2
+
+    # compute U_k, V_k and Q**k with a binary ladder
+    u, v, qk = 0, 2, 1
+    for bit in bin(k)[2:]:
+        u = u * v % n
+        v = (v * v - 2 * qk) % n
+        qk = qk * qk % n
+        if bit == "1":
+            u, v = p * u + v, d * u + p * v
+            if u & 1:
+                u = u + n
+            u = (u >> 1) % n
+            if v & 1:
+                v = v + n
+            v = (v >> 1) % n
+            qk = qk * q % n
+
+    if u == 0 or v == 0:
+        return True
+    for _ in xrange(s - 1):
+        v = (v * v - 2 * qk) % n
+        qk = qk * qk % n
+        if v == 0:
+            return True
+    return False
+
+
+def is_prime(n, bpsw=False):
   """Return True if x is prime, False otherwise.
 
-  We use the Miller-Rabin test, as given in Menezes et al. p. 138.
-  This test is not exact: there are composite values n for which
-  it returns True.
-
-  In testing the odd numbers from 10000001 to 19999999,
-  about 66 composites got past the first test,
-  5 got past the second test, and none got past the third.
-  Since factors of 2, 3, 5, 7, and 11 were detected during
-  preliminary screening, the number of numbers tested by
-  Miller-Rabin was (19999999 - 10000001)*(2/3)*(4/5)*(6/7)
-  = 4.57 million.
-  """
+  For n < 3317044064679887385961981 we use the Miller-Rabin test with
+  a set of bases that is known to make the test deterministic.
 
-  # (This is used to study the risk of false positives:)
-  global miller_rabin_test_count
+  For larger n, we use the Miller-Rabin test, as given in Menezes et al.
+  p. 138, with the number of iterations selected to reduce the probability
+  of accepting a composite below 2**-80, or, if `bpsw` is True, the
+  Baillie-PSW test (a Miller-Rabin test to base 2 followed by a strong
+  Lucas test). Neither of those is exact: there may be composite values n
+  for which they return True, though no such number is known for
+  the Baillie-PSW test.
 
-  miller_rabin_test_count = 0
+  Results for large n are cached.
+  """
 
   if n <= smallprimes[-1]:
     if n in smallprimes:
@@ -478,65 +739,74 @@ def is_prime(n):
     else:
       return False
 
-  if gcd(n, 2 * 3 * 5 * 7 * 11) != 1:
+  if gcd2(n, _smallprimes_product) != 1:
     return False
 
-  # Choose a number of iterations sufficient to reduce the
-  # probability of accepting a composite below 2**-80
-  # (from Menezes et al. Table 4.4):
-
-  t = 40
-  n_bits = 1 + int(math.log(n, 2))
-  for k, tt in ((100, 27),
-                (150, 18),
-                (200, 15),
-                (250, 12),
-                (300, 9),
-                (350, 8),
-                (400, 7),
-                (450, 6),
-                (550, 5),
-                (650, 4),
-                (850, 3),
-                (1300, 2),
-                ):
-    if n_bits < k:
-      break
-    t = tt
-
-  # Run the test t times:
-
-  s = 0
-  r = n - 1
-  while (r % 2) == 0:
-    s = s + 1
-    r = r // 2
-  for i in xrange(t):
-    a = smallprimes[i]
-    y = pow(a, r, n)
-    if y != 1 and y != n - 1:
-      j = 1
-      while j <= s - 1 and y != n - 1:
-        y = pow(y, 2, n)
-        if y == 1:
-          miller_rabin_test_count = i + 1
-          return False
-        j = j + 1
-      if y != n - 1:
-        miller_rabin_test_count = i + 1
-        return False
-  return True
+  for bound, bases in _miller_rabin_deterministic_bases:
+    if n < bound:
+      return _miller_rabin(n, bases)
+
+  try:
+    return _is_prime_cache[(n, bpsw)]
+  except KeyError:
+    pass
+
+  if bpsw:
+    result = _miller_rabin(n, (2,)) and _isqrt(n) ** 2 != n and \
+        _is_strong_lucas_prp(n)
+  else:
+    # Choose a number of iterations sufficient to reduce the
+    # probability of accepting a composite below 2**-80
+    # (from Menezes et al. Table 4.4):
+
+    t = 40
+    n_bits = 1 + int(math.log(n, 2))
+    for k, tt in ((100, 27),
+                  (150, 18),
+                  (200, 15),
+                  (250, 12),
+                  (300, 9),
+                  (350, 8),
+                  (400, 7),
+                  (450, 6),
+                  (550, 5),
+                  (650, 4),
+                  (850, 3),
+                  (1300, 2),
+                  ):
+      if n_bits < k:
+        break
+      t = tt
+
+    result = _miller_rabin(n, smallprimes[:t])
+
+  if len(_is_prime_cache) >= _is_prime_cache_size:
+    _is_prime_cache.clear()
+  _is_prime_cache[(n, bpsw)] = result
+  return result
 
 
 def next_prime(starting_value):
   "Return the smallest prime larger than the starting value."
 
-  if starting_value < 2:
-    return 2
-  result = (starting_value + 1) | 1
-  while not is_prime(result):
-    result = result + 2
-  return result
+  if starting_value < smallprimes[-1]:
+    return smallprimes[bisect.bisect_right(smallprimes, starting_value)]
+
+  # check the odd candidates in segments, striking out the ones divisible
+  # by small primes first, so that only few of them need the full test
+  start = (starting_value + 1) | 1
+  size = _next_prime_segment_size
+  while True:
+    segment = bytearray(b"\x01") * size
+    for p in smallprimes[1:]:
+      # index of the first odd multiple of p in the segment
+      i = (-start * ((p + 1) // 2)) % p
+      if i < size:
+        segment[i::p] = bytearray((size - 1 - i) // p + 1)
+    for i in xrange(size):
+      if segment[i] and is_prime(start + 2 * i):
+        return start + 2 * i
+    start = start + 2 * size
 
 
 smallprimes = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41,
@@ -560,4 +830,17 @@ smallprimes = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41,
                1097, 1103, 1109, 1117, 1123, 1129, 1151, 1153, 1163,
                1171, 1181, 1187, 1193, 1201, 1213, 1217, 1223, 1229]
 
+_smallprimes_product = reduce(lambda x, y: x * y, smallprimes)
+
+_is_prime_cache = {}
+
+_factorization_cache = {}
+_factorization_cache_size = 1024
+_is_prime_cache_size = 1024
+
+_next_prime_segment_size = 512
+
+# no longer updated by is_prime(), kept for backwards compatibility
 miller_rabin_test_count = 0
+
+_tonelli_shanks_cache = {}
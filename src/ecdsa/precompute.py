@@ -0,0 +1,635 @@
+"""
+Precomputed tables for fast multiplication of fixed points.
+
+A :class:`PointTable` holds multiples of a single point (usually the
+generator of a curve, but public keys that verify many signatures can
+have their own tables). Registered tables are used automatically by every
+multiplication of that point, so key generation and signing (and
+verification, for the generator part and keys with a table) don't have
+to perform any point doublings::
+
+    from ecdsa import NIST256p
+    from ecdsa.precompute import PointTable, register
+
+    register(PointTable.build(NIST256p))
+
+The table is kept as a single buffer of fixed width coordinates, which
+can be saved to a file and memory-mapped, or placed in
+``multiprocessing.shared_memory``, so that all processes of a host use a
+single copy of it and don't need to compute it on start::
+
+    # in the parent process
+    table = PointTable.build(NIST256p)
+    shm = table.to_shared_memory("ecdsa-nist256p")
+
+    # in the workers
+    register(PointTable.from_shared_memory("ecdsa-nist256p"))
+
+Tables can also be built lazily, on the first multiplication that needs
+them, with :func:`precompute` (or :meth:`ecdsa.curves.Curve.precompute`,
+:meth:`ecdsa.keys.VerifyingKey.precompute` and
+:meth:`ecdsa.keys.SigningKey.precompute`). The table is then built by a
+single thread; other threads that need it at the same time either wait
+for it or use the multiplication without the table, as selected by
+:func:`set_lazy_policy`.
+
+The memory used by the tables can be limited with
+:func:`ecdsa.curves.set_table_budget`.
+"""
+
+import itertools
+import mmap
+import struct
+import threading
+
+from . import ellipticcurve
+from . import instrument
+from .curves import find_curve_by_encoded_oid, UnknownCurveError, \
+    choose_window, get_table_budget, table_size
+from .util import number_to_string, string_to_number, bit_length
+
+
+__all__ = ["PointTable", "LazyTable", "BuildOnce", "MalformedTableError",
+           "register", "unregister", "get_table", "precompute",
+           "set_lazy_policy", "get_lazy_policy", "enforce_budget",
+           "table_memory"]
+
+
+class MalformedTableError(ValueError):
+    """Raised when a saved table can't be parsed."""
+
+    pass
+
+
+_MAGIC = b"ECDSA-PT"
+_VERSION = 1
+
+# magic, version, window width, length of the encoded curve OID,
+# number of windows
+_HEADER = struct.Struct(">8sBBHI")
+
+# source of timestamps of the last use of tables, for the LRU eviction
+_clock = itertools.count()
+_budget_lock = threading.Lock()
+
+
+def _table_key(curve, x, y):
+    """
+    Return the key of the table of a point in the registry.
+
+    Includes all the parameters of the curve equation, so that curves
+    sharing the prime and the point coordinates don't share tables.
+    """
+    ctx = curve.ctx
+    return (ctx.p, ctx.a, ctx.b, x, y)
+
+
+def _attach_shared_memory(name):
+    """Attach to a block of shared memory created by another process."""
+    from multiprocessing.shared_memory import SharedMemory
+
+    try:
+        # Python 3.13 and later
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # In Python 3.8 to 3.12 every process that attaches to the block
+    # registers it with the resource tracker, which removes the block when
+    # the process exits, even though it belongs to the process that created
+    # it. Undo the registration with the private resource_tracker API
+    # these versions have.
+    shm = SharedMemory(name=name)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except (ImportError, AttributeError):  # pragma: no cover
+        # the private API is missing, the block may be removed too early
+        # when this process exits
+        pass
+    return shm
+
+
+class PointTable(object):
+    """
+    Multiples of a point for fixed-base windowed multiplication.
+
+    For window width `w`, the table holds points ``j * 2**(w*i) * P`` for
+    all ``1 <= j < 2**w`` and all windows `i` needed to cover scalars up
+    to the order of the curve. Multiplication by a scalar is then a sum of
+    one table entry per window.
+
+    The points are decoded from the buffer when they are used, so a table
+    loaded from a memory-mapped file or from shared memory doesn't use
+    any private memory of the process.
+
+    :ivar ecdsa.curves.Curve curve: the curve of the point
+    :ivar int window: the window width, in bits
+    :ivar int windows: number of windows
+    """
+
+    __slots__ = ("curve", "window", "windows", "_data", "_offset",
+                 "_coord_len", "_x", "_y", "_buffer", "_used")
+
+    def __init__(self, curve, window, windows, data, offset=0,
+                 buffer=None):
+        """
+        Create the table from already calculated data.
+
+        Use :meth:`build`, :meth:`from_bytes`, :meth:`load` or
+        :meth:`from_shared_memory` instead.
+        """
+        self.curve = curve
+        self.window = window
+        self.windows = windows
+        self._data = memoryview(data)
+        self._offset = offset
+        self._coord_len = curve.ctx.p_len
+        # keep the mmap or shared memory object alive
+        self._buffer = buffer
+        self._used = next(_clock)
+        self._x, self._y = self._decode(0)
+
+    @classmethod
+    def build(cls, curve, point=None, window=4):
+        """
+        Calculate the table.
+
+        :param curve: the curve of the point
+        :type curve: ecdsa.curves.Curve
+        :param point: the point to precompute, the generator of the curve
+            by default
+        :type point: ecdsa.ellipticcurve.Point
+        :param int window: the window width in bits; every increase by one
+            makes multiplications faster but almost doubles the size of
+            the table
+
+        :rtype: PointTable
+        """
+        if not 1 <= window <= 8:
+            raise ValueError("Window width must be between 1 and 8")
+        if point is None:
+            point = curve.generator
+        p = curve.ctx.p
+        windows = (bit_length(curve.order) + window - 1) // window
+        data = bytearray()
+        base = ellipticcurve.Point(point.curve(), point.x(), point.y())
+        for _ in range(windows):
+            multiple = base
+            for _ in range((1 << window) - 1):
+                data += number_to_string(multiple.x(), p)
+                data += number_to_string(multiple.y(), p)
+                multiple = multiple + base
+            # multiple is now 2**window * base
+            base = multiple
+        return cls(curve, window, windows, bytes(data))
+
+    def __len__(self):
+        """Return the number of points in the table."""
+        return self.windows * ((1 << self.window) - 1)
+
+    @property
+    def size(self):
+        """Size of the point data, in bytes."""
+        return table_size(self.curve, self.window, self.windows)
+
+    def point(self):
+        """Return the point the table is for."""
+        return ellipticcurve.Point(self.curve.curve, self._x, self._y,
+                                   self.curve.order)
+
+    def key(self):
+        """Return the key identifying the point of the table."""
+        return _table_key(self.curve, self._x, self._y)
+
+    def _decode(self, index):
+        """Return coordinates of the point at `index` in the table."""
+        coord_len = self._coord_len
+        start = self._offset + index * 2 * coord_len
+        data = self._data
+        return (string_to_number(data[start:start + coord_len]),
+                string_to_number(data[start + coord_len:
+                                      start + 2 * coord_len]))
+
+    def multiply(self, k):
+        """
+        Multiply the point of the table by `k`.
+
+        :rtype: ecdsa.ellipticcurve.Point
+        """
+        if instrument.ENABLED:
+            instrument.record("point_mul")
+        self._used = next(_clock)
+        k = k % self.curve.order
+        curve = self.curve.curve
+        result = ellipticcurve.INFINITY
+        mask = (1 << self.window) - 1
+        row = mask
+        index = -1
+        while k:
+            digit = k & mask
+            if digit:
+                x, y = self._decode(index + digit)
+                result = result + ellipticcurve.Point(curve, x, y)
+            k >>= self.window
+            index += row
+        return result
+
+    def to_bytes(self):
+        """
+        Serialise the table, see :meth:`from_bytes`.
+
+        :rtype: bytes
+        """
+        encoded_oid = self.curve.encoded_oid
+        start = self._offset
+        return b"".join([
+            _HEADER.pack(_MAGIC, _VERSION, self.window, len(encoded_oid),
+                         self.windows),
+            encoded_oid,
+            self._data[start:start + self.size].tobytes()])
+
+    @classmethod
+    def from_bytes(cls, data, buffer=None):
+        """
+        Create the table from a string created by :meth:`to_bytes`.
+
+        The points are not copied out of `data`, any object supporting
+        the buffer protocol can be used.
+
+        :param buffer: object to keep referenced while the table exists
+
+        Only the first point of the table is checked, load only tables
+        from trusted sources: wrong points in the table would make the
+        library calculate wrong keys and signatures.
+
+        :raises MalformedTableError: if the data is not a valid
+            serialisation of a table
+        :raises UnknownCurveError: if the curve of the table is not known
+        """
+        data = memoryview(data)
+        if len(data) < _HEADER.size:
+            raise MalformedTableError("Truncated table header")
+        magic, version, window, oid_len, windows = \
+            _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise MalformedTableError("Not a point table or unsupported "
+                                      "version")
+        if not 1 <= window <= 8:
+            raise MalformedTableError("Invalid window width")
+        offset = _HEADER.size + oid_len
+        curve = find_curve_by_encoded_oid(
+            data[_HEADER.size:offset].tobytes())
+        if curve is None:
+            raise UnknownCurveError("Unknown curve in point table")
+        if len(data) != offset + table_size(curve, window, windows):
+            raise MalformedTableError("Invalid length of point data")
+        self = cls(curve, window, windows, data, offset, buffer)
+        if not curve.curve.contains_point(self._x, self._y):
+            raise MalformedTableError("Point is not on the curve")
+        return self
+
+    def save(self, path):
+        """Write the table to a file, see :meth:`load`."""
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        """
+        Read the table from a file created by :meth:`save`.
+
+        With `use_mmap` the file is memory-mapped, so the pages of the
+        table are shared by all processes that load the same file. Where
+        memory maps can't be used as buffers (Python 2), the file is read
+        instead.
+        """
+        with open(path, "rb") as f:
+            mapped = None
+            if use_mmap:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    memoryview(mapped)
+                except TypeError:
+                    mapped.close()
+                    mapped = None
+            if mapped is None:
+                return cls.from_bytes(f.read())
+        try:
+            return cls.from_bytes(mapped, mapped)
+        except Exception:
+            mapped.close()
+            raise
+
+    def to_shared_memory(self, name=None):
+        """
+        Copy the serialised table to a new shared memory block.
+
+        Requires Python 3.8 or later. The caller is responsible for
+        keeping the returned object alive while other processes attach to
+        it, and for calling its ``unlink()`` method when the table is not
+        needed any more.
+
+        :param str name: name of the block, random if not specified
+        :rtype: multiprocessing.shared_memory.SharedMemory
+        """
+        from multiprocessing.shared_memory import SharedMemory
+
+        data = self.to_bytes()
+        shm = SharedMemory(name=name, create=True, size=len(data))
+        shm.buf[:len(data)] = data
+        return shm
+
+    @classmethod
+    def from_shared_memory(cls, name):
+        """
+        Use a table placed in shared memory by :meth:`to_shared_memory`.
+
+        The table references the shared memory, it's not copied. Requires
+        Python 3.8 or later.
+        """
+        shm = _attach_shared_memory(name)
+        # on some platforms the block is rounded up to whole pages
+        length = len(shm.buf)
+        if length >= _HEADER.size:
+            window, oid_len, windows = _HEADER.unpack_from(shm.buf, 0)[2:]
+            curve = find_curve_by_encoded_oid(
+                bytes(shm.buf[_HEADER.size:_HEADER.size + oid_len]))
+            if curve is not None:
+                size = table_size(curve, window, windows)
+                length = min(length, _HEADER.size + oid_len + size)
+        try:
+            return cls.from_bytes(shm.buf[:length], shm)
+        except Exception:
+            shm.close()
+            raise
+
+    def close(self):
+        """Release the memory-mapped file or shared memory, if any."""
+        if self._buffer is not None:
+            # the views of the buffer need to be released before closing it
+            self._data.release()
+            self._data = b""
+            self._buffer.close()
+            self._buffer = None
+
+
+BLOCK = "block"
+FALLBACK = "fallback"
+
+_lazy_policy = BLOCK
+
+
+def set_lazy_policy(policy):
+    """
+    Select what threads do when they need a lazy value that is being built.
+
+    :param str policy: "block" to wait for the value, or "fallback" to
+        continue without it (for tables, use the multiplication without
+        precomputation)
+    """
+    global _lazy_policy
+
+    if policy not in (BLOCK, FALLBACK):
+        raise ValueError("Unknown policy: {0!r}".format(policy))
+    _lazy_policy = policy
+
+
+def get_lazy_policy():
+    """Return the policy selected by :func:`set_lazy_policy`."""
+    return _lazy_policy
+
+
+class BuildOnce(object):
+    """
+    A value computed on first use, at most once, by a single thread.
+
+    The value becomes visible to other threads only after it was
+    completely built. If the building function raises an exception, the
+    value stays unset and the next call of :meth:`get` tries again.
+    """
+
+    __slots__ = ("_func", "_value", "_lock")
+
+    def __init__(self, func):
+        """
+        :param callable func: function without arguments returning the
+            value, must not return None
+        """
+        self._func = func
+        self._value = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        """True if the value is already built."""
+        return self._value is not None
+
+    def get(self, policy=None):
+        """
+        Return the value, building it if it's not built yet.
+
+        :param str policy: "block" or "fallback", see
+            :func:`set_lazy_policy`, the globally selected policy by default
+
+        :return: the value, or None if another thread is building it and
+            the policy is "fallback"
+        """
+        value = self._value
+        if value is not None:
+            return value
+        if not self._lock.acquire((policy or _lazy_policy) == BLOCK):
+            return None
+        try:
+            value = self._value
+            if value is None:
+                value = self._func()
+                self._value = value
+            return value
+        finally:
+            self._lock.release()
+
+
+class LazyTable(object):
+    """
+    A :class:`PointTable` built on the first multiplication.
+
+    Can be registered the same way as a :class:`PointTable`.
+    """
+
+    __slots__ = ("curve", "window", "_key", "_once", "_policy", "_used")
+
+    def __init__(self, curve, point=None, window=4, policy=None):
+        """
+        :param policy: "block" or "fallback", see :func:`set_lazy_policy`,
+            the globally selected policy by default
+        """
+        if point is None:
+            point = curve.generator
+        if not 1 <= window <= 8:
+            raise ValueError("Window width must be between 1 and 8")
+        self.curve = curve
+        self.window = window
+        self._key = _table_key(curve, point.x(), point.y())
+        self._policy = policy
+        self._used = next(_clock)
+        self._once = BuildOnce(
+            lambda: PointTable.build(curve, point, window))
+
+    @property
+    def ready(self):
+        """True if the table is already built."""
+        return self._once.ready
+
+    @property
+    def size(self):
+        """Size of the point data, in bytes, also before it's built."""
+        return table_size(self.curve, self.window)
+
+    def key(self):
+        """Return the key identifying the point of the table."""
+        return self._key
+
+    def table(self, policy=None):
+        """
+        Return the built table, building it if necessary.
+
+        :return: the table or None if it's being built by another thread
+            and the policy is "fallback"
+        :rtype: PointTable
+        """
+        return self._once.get(policy or self._policy)
+
+    def multiply(self, k):
+        """
+        Multiply the point of the table by `k`.
+
+        :return: the result or None if the table is being built by another
+            thread and the policy is "fallback"
+        :rtype: ecdsa.ellipticcurve.Point
+        """
+        self._used = next(_clock)
+        table = self._once.get(self._policy)
+        if table is None:
+            return None
+        return table.multiply(k)
+
+
+def precompute(curve, point=None, window=None, lazy=False):
+    """
+    Register a table for the point, if it doesn't have one already.
+
+    Safe to call from multiple threads, only one table is registered for
+    a point.
+
+    :param point: the point, the generator of the curve if not specified
+    :param int window: the window width, selected by
+        :func:`ecdsa.curves.choose_window` if not specified
+    :param bool lazy: if True, the table is built on the first
+        multiplication of the point, otherwise immediately
+
+    :return: the registered table, or None if no table of the point fits
+        in the memory budget
+    :rtype: PointTable or LazyTable
+    """
+    if point is None:
+        point = curve.generator
+    key = _table_key(curve, point.x(), point.y())
+    table = ellipticcurve._precomputed.get(key)
+    if table is None:
+        if window is None:
+            window = choose_window(curve, not _is_generator(curve, key))
+            if window is None:
+                return None
+        # dict.setdefault() is atomic, so concurrent callers can create
+        # different LazyTable objects, but they all get the same one back
+        table = ellipticcurve._precomputed.setdefault(
+            key, LazyTable(curve, point, window))
+        enforce_budget()
+        if ellipticcurve._precomputed.get(key) is not table:
+            return None
+    if not lazy and isinstance(table, LazyTable):
+        table.table(BLOCK)
+    return table
+
+
+def _is_generator(curve, key):
+    """Check if the table key is for the generator of the curve."""
+    generator = curve.generator
+    return key == _table_key(curve, generator.x(), generator.y())
+
+
+def table_memory(curve=None):
+    """
+    Return the memory used by registered tables, in bytes.
+
+    See :func:`ecdsa.curves.table_memory_usage`.
+    """
+    return sum(table.size for table
+               in list(ellipticcurve._precomputed.values())
+               if curve is None or table.curve is curve)
+
+
+def enforce_budget():
+    """
+    Remove the least recently used tables of public keys over the budget.
+
+    Called automatically when tables are registered and when the budget
+    changes, see :func:`ecdsa.curves.set_table_budget`.
+    """
+    registry = ellipticcurve._precomputed
+    with _budget_lock:
+        total = 0
+        usage = {}
+        candidates = []
+        for key, table in list(registry.items()):
+            size = table.size
+            total += size
+            usage[table.curve] = usage.get(table.curve, 0) + size
+            if not _is_generator(table.curve, key):
+                candidates.append((table._used, key, table))
+        global_budget = get_table_budget()
+        candidates.sort(key=lambda i: i[0])
+        for _, key, table in candidates:
+            curve = table.curve
+            over_global = global_budget is not None and total > global_budget
+            over_curve = curve.table_budget is not None and \
+                usage[curve] > curve.table_budget
+            if not over_global and not over_curve:
+                continue
+            if registry.get(key) is table:
+                del registry[key]
+                total -= table.size
+                usage[curve] -= table.size
+
+
+def register(table):
+    """
+    Use the table for all multiplications of its point.
+
+    Replaces a table for the same point registered before. Tables of
+    public keys may be removed right away if they don't fit in the memory
+    budget, see :func:`ecdsa.curves.set_table_budget`.
+    """
+    ellipticcurve._precomputed[table.key()] = table
+    enforce_budget()
+
+
+def unregister(table):
+    """Stop using the table, if it's registered."""
+    key = table.key()
+    if ellipticcurve._precomputed.get(key) is table:
+        del ellipticcurve._precomputed[key]
+
+
+def get_table(curve, point=None):
+    """
+    Return the registered table for a point.
+
+    :param point: the point, the generator of the curve if not specified
+    :return: the table or None if there isn't a registered table
+    :rtype: PointTable or LazyTable
+    """
+    if point is None:
+        point = curve.generator
+    return ellipticcurve._precomputed.get(
+        _table_key(curve, point.x(), point.y()))
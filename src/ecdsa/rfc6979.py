@@ -29,8 +29,10 @@ def bits2int(data, qlen):
     return x
 
 
-def bits2octets(data, order):
-    z1 = bits2int(data, bit_length(order))
+def bits2octets(data, order, qlen=None):
+    if qlen is None:
+        qlen = bit_length(order)
+    z1 = bits2int(data, qlen)
     z2 = z1 - order
 
     if z2 < 0:
@@ -40,7 +42,8 @@ def bits2octets(data, order):
 
 
 # https://tools.ietf.org/html/rfc6979#section-3.2
-def generate_k(order, secexp, hash_func, data, retry_gen=0, extra_entropy=b''):
+def generate_k(order, secexp, hash_func, data, retry_gen=0, extra_entropy=b'',
+               secexp_octets=None, qlen=None):
     '''
         order - order of the DSA generator used in the signature
         secexp - secure exponent (private key) in numeric form
@@ -49,15 +52,25 @@ def generate_k(order, secexp, hash_func, data, retry_gen=0, extra_entropy=b''):
         retry_gen - int - how many good 'k' values to skip before returning
         extra_entropy - extra added data in binary form as per section-3.6 of
             rfc6979
+        secexp_octets - the int2octets(secexp) value, i.e. secexp encoded as
+            a big-endian string of the same length as the order, computed
+            from secexp if not provided
+        qlen - bit length of the order, computed from order if not provided
     '''
 
-    qlen = bit_length(order)
+    if qlen is None:
+        qlen = bit_length(order)
     holen = hash_func().digest_size
     rolen = (qlen + 7) / 8
-    bx = (hmac_compat(number_to_string(secexp, order)),
-          hmac_compat(bits2octets(data, order)),
+    if secexp_octets is None:
+        secexp_octets = number_to_string(secexp, order)
+    bx = (hmac_compat(secexp_octets),
+          hmac_compat(bits2octets(data, order, qlen)),
           hmac_compat(extra_entropy))
 
+    # The HMAC objects are keyed once for every new value of K and then
+    # copied for every computation with that key
+
     # Step B
     v = b'\x01' * holen
 
@@ -66,24 +79,28 @@ def generate_k(order, secexp, hash_func, data, retry_gen=0, extra_entropy=b''):
 
     # Step D
 
-    k = hmac.new(k, digestmod=hash_func)
-    k.update(v + b'\x00')
+    mac = hmac.new(k, digestmod=hash_func)
+    mac.update(v + b'\x00')
     for i in bx:
-        k.update(i)
-    k = k.digest()
+        mac.update(i)
+    k = hmac.new(mac.digest(), digestmod=hash_func)
 
     # Step E
-    v = hmac.new(k, v, hash_func).digest()
+    mac = k.copy()
+    mac.update(v)
+    v = mac.digest()
 
     # Step F
-    k = hmac.new(k, digestmod=hash_func)
-    k.update(v + b'\x01')
+    mac = k.copy()
+    mac.update(v + b'\x01')
     for i in bx:
-        k.update(i)
-    k = k.digest()
+        mac.update(i)
+    k = hmac.new(mac.digest(), digestmod=hash_func)
 
     # Step G
-    v = hmac.new(k, v, hash_func).digest()
+    mac = k.copy()
+    mac.update(v)
+    v = mac.digest()
 
     # Step H
     while True:
@@ -92,7 +109,9 @@ def generate_k(order, secexp, hash_func, data, retry_gen=0, extra_entropy=b''):
 
         # Step H2
         while len(t) < rolen:
-            v = hmac.new(k, v, hash_func).digest()
+            mac = k.copy()
+            mac.update(v)
+            v = mac.digest()
             t += v
 
         # Step H3
@@ -103,5 +122,9 @@ def generate_k(order, secexp, hash_func, data, retry_gen=0, extra_entropy=b''):
                 return secret
             retry_gen -= 1
 
-        k = hmac.new(k, v + b'\x00', hash_func).digest()
-        v = hmac.new(k, v, hash_func).digest()
+        mac = k.copy()
+        mac.update(v + b'\x00')
+        k = hmac.new(mac.digest(), digestmod=hash_func)
+        mac = k.copy()
+        mac.update(v)
+        v = mac.digest()
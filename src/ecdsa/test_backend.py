@@ -0,0 +1,86 @@
+import pytest
+
+from . import backend
+from .backend import available_backends, get_backend, set_backend
+from .numbertheory import inverse_mod, jacobi, square_root_mod_prime
+from .curves import curves
+from .keys import SigningKey
+
+
+@pytest.fixture(params=available_backends())
+def each_backend(request):
+    old = get_backend()
+    set_backend(request.param)
+    try:
+        yield request.param
+    finally:
+        set_backend(old)
+
+
+def test_set_backend(each_backend):
+    assert get_backend() == each_backend
+    assert backend.GMPY == (each_backend == "gmpy2")
+
+
+def test_set_unknown_backend():
+    with pytest.raises(ValueError):
+        set_backend("fortran")
+
+
+def test_auto_backend():
+    old = get_backend()
+    try:
+        set_backend("auto")
+        assert get_backend() == available_backends()[-1]
+    finally:
+        set_backend(old)
+
+
+# values calculated with the Python backend
+@pytest.mark.parametrize("args, result", [
+    ((0, 23), 0),
+    ((5, 23), 14),
+    ((-5, 23), 9),
+    ((6, 9), 3),  # not invertible
+    ((2**255 - 20, 2**255 - 19), 2**255 - 20)])
+def test_inverse_mod(each_backend, args, result):
+    inv = inverse_mod(*args)
+
+    assert inv == result
+    assert type(inv) is int
+
+
+@pytest.mark.parametrize("args, result", [
+    ((0, 7), 0), ((1, 7), 1), ((3, 7), -1), ((2, 7), 1), ((5, 15), 0)])
+def test_jacobi(each_backend, args, result):
+    assert jacobi(*args) == result
+
+
+@pytest.mark.parametrize("p", [7, 13, 17, 2**255 - 19, 2**521 - 1])
+def test_square_root_mod_prime(each_backend, p):
+    root = square_root_mod_prime(4, p)
+
+    assert root in (2, p - 2)
+    assert type(root) is int
+
+
+@pytest.mark.parametrize("curve", curves, ids=[i.name for i in curves])
+def test_results_match_python_backend(curve):
+    old = get_backend()
+    outputs = []
+    try:
+        for name in available_backends():
+            set_backend(name)
+            sk = SigningKey.from_secret_exponent(123456789, curve)
+            vk = sk.verifying_key
+            sig = sk.sign_deterministic(b"data")
+            assert vk.verify(sig, b"data")
+            point = vk.pubkey.point
+            assert type(point.x()) is int and type(point.y()) is int
+            outputs.append((vk.to_string(), sig,
+                            vk.from_string(vk.to_string("compressed"),
+                                           curve).to_string()))
+    finally:
+        set_backend(old)
+
+    assert all(i == outputs[0] for i in outputs)
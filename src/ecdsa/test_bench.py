@@ -0,0 +1,200 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+from .bench import operations, measure, memory_usage, cold_start, \
+    inverse_mod_speed, run, compare, compare_memory, compare_cold_start, \
+    main, _parse_importtime
+from .curves import NIST192p
+
+
+def test_operations_cover_encodings():
+    names = [name for name, _ in operations(NIST192p)]
+
+    for name in ["keygen", "sign", "sign_deterministic", "verify",
+                 "recover", "vk_from_string_compressed",
+                 "vk_to_string_hybrid", "vk_from_der", "sk_to_pem"]:
+        assert name in names
+    assert len(names) == len(set(names))
+
+
+def test_operations_run():
+    for name, func in operations(NIST192p):
+        func()
+
+
+def test_measure():
+    result = measure(lambda: None, repeat=3, min_time=0.001)
+
+    assert result["repeat"] == 3
+    assert result["number"] >= 1
+    assert result["ci_low"] <= result["ops_per_sec"] <= result["ci_high"]
+
+
+def test_compare():
+    baseline = {"results": [
+        {"curve": "c", "operation": "a", "ops_per_sec": 100.0,
+         "ci_low": 99.0, "ci_high": 101.0},
+        {"curve": "c", "operation": "b", "ops_per_sec": 100.0,
+         "ci_low": 99.0, "ci_high": 101.0}]}
+    results = {"results": [
+        {"curve": "c", "operation": "a", "ops_per_sec": 50.0,
+         "ci_low": 49.0, "ci_high": 51.0},
+        {"curve": "c", "operation": "b", "ops_per_sec": 98.0,
+         "ci_low": 90.0, "ci_high": 106.0},
+        {"curve": "c", "operation": "new", "ops_per_sec": 98.0,
+         "ci_low": 90.0, "ci_high": 106.0}]}
+
+    assert compare(results, baseline) == [("c", "a", 0.5, -1),
+                                          ("c", "b", 0.98, 0)]
+    assert compare(baseline, results)[0] == ("c", "a", 2.0, 1)
+
+
+def test_memory_usage():
+    pytest.importorskip("tracemalloc")
+    results = memory_usage(NIST192p, count=2)
+
+    names = [i["operation"] for i in results]
+    for name in ["sk_generate", "vk_from_string", "vk_from_der",
+                 "vk_from_pem", "sk_from_string", "sk_from_der",
+                 "sk_from_pem", "keystore", "point_table"]:
+        assert name in names
+    for i in results:
+        assert i["curve"] == "NIST192p"
+        assert i["count"] == (1 if i["operation"] == "point_table" else 2)
+        assert 0 < i["retained_bytes"] <= i["peak_bytes"]
+
+
+def test_compare_memory():
+    baseline = {"memory": [
+        {"curve": "c", "operation": "a", "retained_bytes": 100,
+         "peak_bytes": 200},
+        {"curve": "c", "operation": "b", "retained_bytes": 100,
+         "peak_bytes": 200}]}
+    results = {"memory": [
+        {"curve": "c", "operation": "a", "retained_bytes": 100,
+         "peak_bytes": 300},
+        {"curve": "c", "operation": "b", "retained_bytes": 101,
+         "peak_bytes": 200}]}
+
+    assert compare_memory(results, baseline) == [
+        ("c", "a", 1.0, 1.5, True), ("c", "b", 1.01, 1.0, False)]
+    assert compare_memory(results, {"results": []}) == []
+
+
+def test_main_memory_only():
+    pytest.importorskip("argparse")
+    pytest.importorskip("tracemalloc")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        output = os.path.join(tmp_dir, "out.json")
+
+        status = main(["--curves", "NIST192p", "--memory-only",
+                       "--memory-keys", "2", "--json", output])
+
+        assert status == 0
+        with open(output) as f:
+            saved = json.load(f)
+        assert saved["results"] == []
+        assert len(saved["memory"]) == 9
+
+        status = main(["--curves", "NIST192p", "--memory-only",
+                       "--memory-keys", "2", "--baseline", output,
+                       "--threshold", "1"])
+        assert status == 0
+
+        status = main(["--curves", "NIST192p", "--no-speed",
+                       "--cold-start", "--cold-start-runs", "1",
+                       "--json", output])
+        assert status == 0
+        with open(output) as f:
+            saved = json.load(f)
+        assert saved["cold_start"]["curves"][0]["curve"] == "NIST192p"
+        assert "memory" not in saved
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_inverse_mod_speed():
+    results = inverse_mod_speed(["NIST192p"], repeat=2, min_time=0.001,
+                                values=4)
+
+    names = set(i["implementation"] for i in results)
+    assert "euclid" in names
+    assert len(results) == 2 * len(names)
+    for i in results:
+        assert i["curve"] == "NIST192p"
+        assert i["bits"] == 192
+        assert i["modulus"] in ("p", "order")
+        assert i["ops_per_sec"] > 0
+
+
+def test_parse_importtime():
+    output = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 | site",
+        "import time:        10 |         10 |     binascii",
+        "import time:        20 |         30 |   ecdsa.der",
+        "import time:        40 |         70 | ecdsa",
+        "import time:         5 |          5 | json"])
+
+    assert _parse_importtime(output) == {"binascii": (10, 10),
+                                         "ecdsa.der": (20, 30),
+                                         "ecdsa": (40, 70)}
+    assert _parse_importtime("") == {}
+
+
+def test_cold_start():
+    results = cold_start(["NIST192p"], runs=1)
+
+    assert results["runs"] == 1
+    assert 0 < results["import_s"] < results["process_s"]
+    assert [i["curve"] for i in results["curves"]] == ["NIST192p"]
+    assert results["curves"][0]["first_sign_s"] > 0
+    if sys.version_info >= (3, 7):
+        assert "ecdsa.keys" in [i["module"] for i in results["modules"]]
+
+
+def test_compare_cold_start():
+    baseline = {"cold_start": {"import_s": 0.1, "curves": [
+        {"curve": "c", "first_sign_s": 0.2, "first_verify_s": 0.2}]}}
+    results = {"cold_start": {"import_s": 0.05, "curves": [
+        {"curve": "c", "first_sign_s": 0.2, "first_verify_s": 0.4},
+        {"curve": "d", "first_sign_s": 0.2, "first_verify_s": 0.4}]}}
+
+    assert compare_cold_start(results, baseline) == [
+        ("import", 0.5), ("c first_sign", 1.0), ("c first_verify", 2.0)]
+    assert compare_cold_start(results, {}) == []
+
+
+def test_run_and_main():
+    # argparse is not available on Python 2.6
+    pytest.importorskip("argparse")
+    results = run(["NIST192p"], ["sign", "verify"], repeat=2,
+                  min_time=0.001)
+
+    assert [(i["curve"], i["operation"]) for i in results["results"]] == \
+        [("NIST192p", "sign"), ("NIST192p", "verify")]
+    assert "version" in results
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        baseline = os.path.join(tmp_dir, "baseline.json")
+        with open(baseline, "w") as f:
+            json.dump(results, f)
+        output = os.path.join(tmp_dir, "out.json")
+
+        status = main(["--curves", "NIST192p", "--ops", "sign",
+                       "--repeat", "2", "--min-time", "0.001",
+                       "--json", output, "--baseline", baseline])
+
+        assert status in (0, 1)
+        with open(output) as f:
+            saved = json.load(f)
+        assert saved["results"][0]["operation"] == "sign"
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,105 @@
+import pytest
+
+from .curves import Curve, NIST256p, SECP256k1, UnknownCurveError, curves, \
+    find_curve, find_curve_by_encoded_oid, find_curve_by_name, \
+    register_curve, unregister_curve
+from .keys import SigningKey, VerifyingKey
+from . import ecdsa
+
+
+@pytest.mark.parametrize("curve", curves, ids=[i.name for i in curves])
+def test_find_curve(curve):
+    assert find_curve(curve.oid) is curve
+    assert find_curve(list(curve.oid)) is curve
+    assert find_curve_by_encoded_oid(curve.encoded_oid) is curve
+    assert find_curve_by_name(curve.name) is curve
+    assert find_curve_by_name(curve.openssl_name) is curve
+
+
+def test_find_curve_with_unknown_values():
+    with pytest.raises(UnknownCurveError):
+        find_curve((1, 2, 3, 4, 5, 6))
+    with pytest.raises(UnknownCurveError):
+        find_curve_by_name("unknown")
+    assert find_curve_by_encoded_oid(b'\x06\x01\x00') is None
+
+
+def test_register_curve_twice():
+    count = len(curves)
+
+    register_curve(NIST256p)
+
+    assert len(curves) == count
+
+
+def test_register_conflicting_curve():
+    curve = Curve("NIST256p", ecdsa.curve_256, ecdsa.generator_256,
+                  (1, 2, 3, 4, 5, 7))
+
+    with pytest.raises(ValueError):
+        register_curve(curve)
+
+    with pytest.raises(UnknownCurveError):
+        find_curve(curve.oid)
+
+
+def test_register_custom_curve():
+    # same parameters as secp256k1, different identifiers
+    curve = Curve("custom256k1", ecdsa.curve_secp256k1,
+                  ecdsa.generator_secp256k1, (1, 3, 6, 1, 4, 1, 99999, 1))
+    sk = SigningKey.generate(curve)
+    with pytest.raises(UnknownCurveError):
+        VerifyingKey.from_der(sk.verifying_key.to_der())
+
+    register_curve(curve)
+    try:
+        assert find_curve_by_name("custom256k1") is curve
+
+        vk = VerifyingKey.from_der(sk.verifying_key.to_der())
+        assert vk.curve is curve
+        assert vk.pubkey.point == sk.verifying_key.pubkey.point
+        sk2 = SigningKey.from_der(sk.to_der())
+        assert sk2.curve is curve
+        assert VerifyingKey.from_der(
+            SigningKey.generate(SECP256k1).verifying_key.to_der()).curve \
+            is SECP256k1
+    finally:
+        # remove the curve so it doesn't leak to other tests
+        unregister_curve(curve)
+
+
+def test_unregister_curve():
+    curve = Curve("custom256k1", ecdsa.curve_secp256k1,
+                  ecdsa.generator_secp256k1, (1, 3, 6, 1, 4, 1, 99999, 2),
+                  "custom256k1-openssl")
+    count = len(curves)
+    register_curve(curve)
+    assert find_curve_by_name("custom256k1-openssl") is curve
+
+    unregister_curve(curve)
+
+    assert len(curves) == count
+    assert curve not in curves
+    with pytest.raises(UnknownCurveError):
+        find_curve(curve.oid)
+    assert find_curve_by_encoded_oid(curve.encoded_oid) is None
+    with pytest.raises(UnknownCurveError):
+        find_curve_by_name("custom256k1")
+    with pytest.raises(UnknownCurveError):
+        find_curve_by_name("custom256k1-openssl")
+    # the curve can be registered again
+    register_curve(curve)
+    unregister_curve(curve)
+    assert len(curves) == count
+
+
+def test_unregister_not_registered_curve():
+    count = len(curves)
+    # a different object than the registered curve with the same OID
+    curve = Curve("NIST256p", ecdsa.curve_256, ecdsa.generator_256,
+                  NIST256p.oid)
+
+    unregister_curve(curve)
+
+    assert len(curves) == count
+    assert find_curve(NIST256p.oid) is NIST256p
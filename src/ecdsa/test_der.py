@@ -14,7 +14,7 @@ import pytest
 from ._compat import str_idx_as_int
 from .curves import NIST256p, NIST224p
 from .der import remove_integer, UnexpectedDER, read_length, encode_bitstring,\
-        remove_bitstring, remove_object, encode_oid
+        remove_bitstring, remove_object, encode_oid, remove_encoded_object
 
 
 class TestRemoveInteger(unittest.TestCase):
@@ -382,3 +382,19 @@ def test_oids(ids):
     decoded_oid, rest = remove_object(encoded_oid)
     assert rest == b''
     assert decoded_oid == ids
+
+
+@given(st_oid(), st.binary(max_size=16))
+def test_encoded_oids(ids, extra):
+    encoded_oid = encode_oid(*ids)
+    raw_oid, rest = remove_encoded_object(encoded_oid + extra)
+    assert raw_oid == encoded_oid
+    assert rest == extra
+
+
+@pytest.mark.parametrize("data", [b'', b'\x05\x00', b'\x06\x00',
+                                  b'\x06\x03\x2a\x86'],
+                         ids=["empty", "null", "empty oid", "truncated"])
+def test_remove_encoded_object_with_malformed_data(data):
+    with pytest.raises(UnexpectedDER):
+        remove_encoded_object(data)
@@ -1,5 +1,7 @@
 from __future__ import print_function
 import sys
+import pickle
+import weakref
 import hypothesis.strategies as st
 from hypothesis import given, settings, note
 try:
@@ -386,3 +388,13 @@ def test_sig_verify(args):
     assert pubkey.verifies(msg, signature)
 
     assert not pubkey.verifies(msg - 1, signature)
+
+
+@pytest.mark.parametrize("protocol", range(pickle.HIGHEST_PROTOCOL + 1))
+def test_pickle_signature(protocol):
+    sig = Signature(123, 456)
+
+    sig2 = pickle.loads(pickle.dumps(sig, protocol))
+
+    assert (sig2.r, sig2.s) == (123, 456)
+    assert weakref.ref(sig)() is sig
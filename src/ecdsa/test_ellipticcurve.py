@@ -1,3 +1,5 @@
+import pickle
+import weakref
 import pytest
 from six import print_
 try:
@@ -126,3 +128,17 @@ def test_multiply(c, x1, y1, m, x3, y3):
     ids=["g_23 test with mult {0}".format(i) for i in range(9)])
 def test_add_and_mult_equivalence(p, m, check):
     assert p * m == check
+
+
+@pytest.mark.parametrize("protocol", range(pickle.HIGHEST_PROTOCOL + 1))
+def test_pickle_point(protocol):
+    point = Point(c192, Gx, Gy, r)
+
+    point2 = pickle.loads(pickle.dumps(point, protocol))
+
+    assert (point2.x(), point2.y(), point2.order()) == (Gx, Gy, r)
+    assert point2.curve().p() == c192.p()
+    point3 = point2 * 3
+    assert (point3.x(), point3.y()) == ((point * 3).x(), (point * 3).y())
+    assert weakref.ref(point)() is point
+    assert weakref.ref(c192)() is c192
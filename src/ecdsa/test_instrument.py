@@ -0,0 +1,72 @@
+import threading
+
+from . import instrument
+from .curves import NIST256p, BRAINPOOLP256r1
+from .keys import SigningKey, VerifyingKey
+
+
+def test_count_verify():
+    sk = SigningKey.from_secret_exponent(123, NIST256p)
+    vk = sk.verifying_key
+    sig = sk.sign_deterministic(b"data")
+
+    assert not instrument.ENABLED
+    with instrument.count() as counters:
+        assert instrument.ENABLED
+        vk.verify(sig, b"data")
+    assert not instrument.ENABLED
+
+    assert counters["verifies"] == 1
+    assert counters["point_mul"] == 2
+    assert counters["point_double"] > 200
+    assert counters["point_add"] > 0
+    assert counters["inverse_mod"] == 1 + counters["point_add"] + \
+        counters["point_double"]
+    assert counters["field_mul"] == 3 * counters["point_add"] + \
+        4 * counters["point_double"]
+    assert counters["square_root_mod_prime"] == 0
+    assert "verifies" in repr(counters)
+
+
+def test_count_compressed_decode():
+    for curve in (NIST256p, BRAINPOOLP256r1):
+        encoded = SigningKey.from_secret_exponent(5, curve).verifying_key \
+            .to_string("compressed")
+        with instrument.count() as counters:
+            VerifyingKey.from_string(encoded, curve)
+        assert counters["square_root_mod_prime"] == 1
+
+
+def test_nested_counters():
+    sk = SigningKey.from_secret_exponent(123, NIST256p)
+    with instrument.count() as outer:
+        sk.sign_deterministic(b"data")
+        with instrument.count() as inner:
+            sk.sign_deterministic(b"data")
+
+    assert inner["point_mul"] == 1
+    assert outer["point_mul"] == 2
+    assert outer["inverse_mod"] == 2 * inner["inverse_mod"]
+
+
+def test_other_threads_are_not_counted():
+    sk = SigningKey.from_secret_exponent(123, NIST256p)
+    started = threading.Event()
+    finish = threading.Event()
+
+    def count_nothing():
+        with instrument.count() as counters:
+            started.set()
+            finish.wait()
+        results.append(counters)
+
+    results = []
+    thread = threading.Thread(target=count_nothing)
+    thread.start()
+    started.wait()
+    sk.sign_deterministic(b"data")
+    finish.set()
+    thread.join()
+
+    assert results[0].counts == {}
+    assert not instrument.ENABLED
@@ -13,9 +13,15 @@ import six
 import sys
 import pytest
 import hashlib
+import threading
+import pickle
+import weakref
 
-from .keys import VerifyingKey, SigningKey
+from .keys import VerifyingKey, SigningKey, KeyIndex, serialise_keys, \
+    VerificationCache, BadSignatureError, add_hook, remove_hook, \
+    LatencyHistogram
 from .der import unpem
+from .curves import curves
 from .util import sigencode_string, sigencode_der, sigencode_strings, \
     sigdecode_string, sigdecode_der, sigdecode_strings
 
@@ -308,3 +314,405 @@ def test_SigningKey_sign_digest(convert):
     sig = sk.sign_digest(convert(data_hash))
 
     vk.verify(sig, data)
+
+
+@pytest.mark.parametrize("curve", curves, ids=[i.name for i in curves])
+def test_curve_context(curve):
+    ctx = curve.ctx
+
+    assert ctx.order == curve.order
+    assert ctx.baselen == curve.baselen
+    assert ctx.p == curve.curve.p()
+    assert ctx.order_bits == len(bin(ctx.order)) - 2
+
+
+@pytest.mark.parametrize("curve", curves, ids=[i.name for i in curves])
+def test_VerifyingKey_from_compressed_string(curve):
+    sk = SigningKey.generate(curve)
+    vk = sk.verifying_key
+
+    vk2 = VerifyingKey.from_string(vk.to_string("compressed"), curve)
+
+    assert vk2.pubkey.point == vk.pubkey.point
+
+
+def test_KeyIndex():
+    sks = [SigningKey.from_secret_exponent(i + 2, curve)
+           for i, curve in enumerate(curves[:4])]
+    index = KeyIndex(["spki_sha256", "rfc7093_sha256", "compressed_point"])
+
+    keys = index.update([sks[0].verifying_key, sks[1].verifying_key.to_der()])
+    keys += index.add_pem(
+        sks[2].verifying_key.to_pem() + sks[0].to_pem() +
+        sks[3].verifying_key.to_pem("compressed") +
+        sks[1].verifying_key.to_pem())
+
+    assert len(keys) == 5
+    assert len(index) == 4
+    assert keys[0] is sks[0].verifying_key
+    # identical keys share the object
+    assert keys[4] is keys[1]
+    for sk, vk in zip(sks, keys):
+        assert vk.to_string() == sk.verifying_key.to_string()
+        spki = sk.verifying_key.to_der()
+        point = sk.verifying_key.to_string("uncompressed")
+        ids = index.key_ids(vk)
+        assert ids["spki_sha256"] == hashlib.sha256(spki).digest()
+        assert ids["rfc7093_sha256"] == hashlib.sha256(point).digest()[:20]
+        assert index[ids["spki_sha256"]] is vk
+        assert index.get(ids["rfc7093_sha256"]) is vk
+        assert sk.verifying_key.to_string("compressed") in index
+    assert index.get(b"\x00" * 32) is None
+    with pytest.raises(KeyError):
+        index[b"\x00" * 32]
+
+
+def test_KeyIndex_add_der_skips_parsing_of_known_keys():
+    sk = SigningKey.from_secret_exponent(3, curves[0])
+    index = KeyIndex(["rfc7093_sha512", "spki_sha256"], "compressed")
+    vk = index.add(sk.verifying_key)
+
+    # the compressed encoding is used for ids, the uncompressed DER
+    # needs to be parsed
+    assert index.add_der(sk.verifying_key.to_der()) is vk
+    assert index.add_der(sk.verifying_key.to_der("compressed")) is vk
+    assert set(index.key_ids(vk)) == set(["rfc7093_sha512", "spki_sha256"])
+    assert len(index.key_ids(vk)["rfc7093_sha512"]) == 20
+
+
+def test_KeyIndex_with_unknown_id_type():
+    with pytest.raises(ValueError):
+        KeyIndex(["sha1"])
+    with pytest.raises(ValueError):
+        KeyIndex(point_encoding="raw")
+
+
+def test_encodings_are_memoised():
+    sk = SigningKey.from_secret_exponent(7, curves[2])
+    vk = sk.verifying_key
+
+    assert vk.to_string() is vk.to_string()
+    assert vk.to_string("compressed") is vk.to_string("compressed")
+    assert vk.to_der() is vk.to_der()
+    assert vk.to_pem("compressed") is vk.to_pem("compressed")
+    assert vk.to_der() != vk.to_der("compressed")
+    assert sk.to_der() is sk.to_der()
+    assert sk.to_pem() is sk.to_pem()
+    assert SigningKey.from_pem(sk.to_pem("compressed")).to_string() == \
+        sk.to_string()
+
+
+def test_memoised_encodings_share_entries_for_equivalent_calls():
+    sk = SigningKey.from_secret_exponent(7, curves[2])
+    vk = sk.verifying_key
+
+    raw = vk.to_string()
+    assert vk.to_string("raw") is raw
+    assert vk.to_string(encoding="raw") is raw
+    der = vk.to_der()
+    assert vk.to_der("uncompressed") is der
+    assert vk.to_der(point_encoding="uncompressed") is der
+    assert sk.to_pem(point_encoding="uncompressed") is sk.to_pem()
+    assert [i for i in vk._encodings if i[0] == "to_der"] == \
+        [("to_der", "uncompressed")]
+    assert [i for i in sk._encodings if i[0] == "to_pem"] == \
+        [("to_pem", "uncompressed")]
+    cached = dict(vk._encodings)
+
+    with pytest.raises(ValueError):
+        vk.to_der("raw")
+    with pytest.raises(TypeError):
+        vk.to_string(encoding="raw", extra=1)
+    assert vk._encodings == cached
+
+
+@pytest.fixture
+def frequent_thread_switches():
+    if not hasattr(sys, "setswitchinterval"):  # pragma: no cover
+        yield
+        return
+    interval = sys.getswitchinterval()
+    # make the threads interleave as often as possible
+    sys.setswitchinterval(1e-6)
+    try:
+        yield
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def test_encodings_are_memoised_with_many_threads(frequent_thread_switches):
+    vk = SigningKey.from_secret_exponent(7, curves[2]).verifying_key
+    # the cache is created by the first encoding, not with the key
+    assert vk._encodings is None
+    encodings = ["raw", "uncompressed", "compressed", "hybrid"]
+    start = threading.Event()
+    results = []
+    errors = []
+
+    def encode(encoding):
+        start.wait()
+        try:
+            results.append((encoding, vk.to_string(encoding), vk.to_der()))
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [threading.Thread(target=encode, args=(encodings[i % 4],))
+               for i in range(32)]
+    for t in threads:
+        t.start()
+    start.set()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert len(results) == 32
+    # no thread replaced the cache with a new one, all the encodings
+    # calculated by the threads are kept
+    for encoding in encodings:
+        cached = vk.to_string(encoding)
+        assert all(i[1] == cached for i in results if i[0] == encoding)
+        assert vk.to_string(encoding) is cached
+    assert len(vk._encodings) == 5
+
+
+def test_serialise_keys():
+    sks = [SigningKey.from_secret_exponent(i + 2, curve)
+           for i, curve in enumerate(curves[:3])]
+    vks = [sk.verifying_key for sk in sks]
+
+    assert serialise_keys(vks) == b"".join(vk.to_pem() for vk in vks)
+    assert serialise_keys(sks, "der", "compressed") == \
+        b"".join(sk.to_der("compressed") for sk in sks)
+
+    out = bytearray(b"header")
+    assert serialise_keys(vks[:1], "der", out=out) is out
+    assert out == b"header" + vks[0].to_der()
+
+    index = KeyIndex()
+    assert [i.to_string() for i in index.add_pem(bytes(serialise_keys(vks)))] \
+        == [i.to_string() for i in vks]
+
+    with pytest.raises(ValueError):
+        serialise_keys(vks, "raw")
+
+
+def test_VerificationCache():
+    sk = SigningKey.from_secret_exponent(11, curves[2])
+    vk = sk.verifying_key
+    cache = VerificationCache(max_size=2)
+    sigs = [sk.sign(i) for i in (b"a", b"b", b"c")]
+
+    assert cache.hit_rate == 0.0
+    assert vk.verify(sigs[0], b"a", cache=cache)
+    assert len(cache) == 1
+    assert cache.misses == 1
+    assert vk.verify(sigs[0], b"a", cache=cache)
+    assert cache.hits == 1
+    assert cache.hit_rate == 0.5
+
+    # failures are not cached
+    with pytest.raises(BadSignatureError):
+        vk.verify(sigs[1], b"a", cache=cache)
+    with pytest.raises(BadSignatureError):
+        vk.verify(sigs[1], b"a", cache=cache)
+    assert len(cache) == 1
+    assert cache.hits == 1
+
+    assert vk.verify(sigs[1], b"b", cache=cache)
+    assert vk.verify_digest(sigs[0], hashlib.sha1(b"a").digest(),
+                            cache=cache)
+    assert cache.hits == 2
+    # evicts the least recently used entry, "b"
+    assert vk.verify(sigs[2], b"c", cache=cache)
+    assert len(cache) == 2
+    assert vk.verify(sigs[1], b"b", cache=cache)
+    assert cache.hits == 2
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.hits == cache.misses == 0
+
+
+def test_VerificationCache_separates_keys():
+    sk1 = SigningKey.from_secret_exponent(11, curves[2])
+    sk2 = SigningKey.from_secret_exponent(12, curves[2])
+    cache = VerificationCache()
+    sig = sk1.sign(b"a")
+
+    assert sk1.verifying_key.verify(sig, b"a", cache=cache)
+    with pytest.raises(BadSignatureError):
+        sk2.verifying_key.verify(sig, b"a", cache=cache)
+    assert VerificationCache.cache_key(
+        sk1.verifying_key, 0, 1, b"digest") is None
+
+
+def test_VerificationCache_with_threads():
+    sk = SigningKey.from_secret_exponent(13, curves[0])
+    vk = sk.verifying_key
+    sigs = [(sk.sign(six.int2byte(i)), six.int2byte(i)) for i in range(8)]
+    cache = VerificationCache(max_size=4)
+    errors = []
+
+    def verify_all():
+        try:
+            for _ in range(10):
+                for sig, data in sigs:
+                    assert vk.verify(sig, data, cache=cache)
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [threading.Thread(target=verify_all) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert len(cache) == 4
+    assert cache.hits + cache.misses == 4 * 10 * 8
+
+
+@pytest.fixture
+def recorded_hooks():
+    calls = []
+
+    def before(curve, operation, encoding):
+        calls.append(("before", curve, operation, encoding))
+
+    def after(curve, operation, encoding, elapsed, error):
+        assert elapsed >= 0
+        calls.append(("after", curve, operation, encoding, error))
+
+    add_hook("before", before)
+    add_hook("after", after)
+    try:
+        yield calls
+    finally:
+        remove_hook("before", before)
+        remove_hook("after", after)
+
+
+def test_hooks_called_once_for_nested_operations(recorded_hooks):
+    curve = curves[0]
+    sk = SigningKey.from_secret_exponent(13, curve)
+    del recorded_hooks[:]
+
+    sig = sk.sign_deterministic(b"data", sigencode=sigencode_der)
+    sk.verifying_key.verify(sig, b"data", sigdecode=sigdecode_der)
+
+    assert recorded_hooks == [
+        ("before", curve, "sign", "der"),
+        ("after", curve, "sign", "der", None),
+        ("before", curve, "verify", "der"),
+        ("after", curve, "verify", "der", None)]
+
+
+def test_hooks_for_key_encodings(recorded_hooks):
+    curve = curves[0]
+    sk = SigningKey.from_secret_exponent(13, curve)
+    vk = sk.verifying_key
+    del recorded_hooks[:]
+
+    pem = vk.to_pem()
+    VerifyingKey.from_pem(pem)
+    VerifyingKey.from_string(vk.to_string("compressed"), curve)
+
+    assert recorded_hooks == [
+        ("before", curve, "serialise", "pem"),
+        ("after", curve, "serialise", "pem", None),
+        ("before", None, "parse", "pem"),
+        ("after", curve, "parse", "pem", None),
+        ("before", curve, "serialise", "compressed"),
+        ("after", curve, "serialise", "compressed", None),
+        ("before", curve, "parse", "string"),
+        ("after", curve, "parse", "string", None)]
+
+
+def test_hooks_called_on_failure(recorded_hooks):
+    sk = SigningKey.from_secret_exponent(13, curves[0])
+    sig = sk.sign(b"data")
+    del recorded_hooks[:]
+
+    with pytest.raises(BadSignatureError):
+        sk.verifying_key.verify(sig, b"other data")
+
+    assert len(recorded_hooks) == 2
+    assert isinstance(recorded_hooks[1][-1], BadSignatureError)
+
+
+def test_hooks_not_called_after_removal():
+    calls = []
+    hook = lambda *args: calls.append(args)
+    add_hook("after", hook)
+    remove_hook("after", hook)
+
+    SigningKey.from_secret_exponent(13, curves[0]).sign(b"data")
+
+    assert not calls
+    with pytest.raises(ValueError):
+        add_hook("during", hook)
+
+
+def test_LatencyHistogram():
+    curve = curves[0]
+    histogram = LatencyHistogram([0.001, 0.01])
+    histogram(curve, "verify", "der", 0.0005, None)
+    histogram(curve, "verify", "der", 0.005, None)
+    histogram(curve, "verify", "der", 0.005, None)
+    histogram(curve, "verify", "der", 1.0, None)
+    histogram(curve, "verify", "der", 0.0001, BadSignatureError())
+
+    data = histogram.snapshot()[(curve.name, "verify", "der")]
+    assert data["count"] == 4
+    assert data["buckets"] == [1, 2, 1]
+    assert histogram.percentile(curve.name, "verify", "der", 0.25) == 0.001
+    assert histogram.percentile(curve.name, "verify", "der", 0.5) == 0.01
+    assert histogram.percentile(curve.name, "verify", "der", 1) == \
+        float("inf")
+    assert histogram.percentile(curve.name, "sign", "der", 0.5) is None
+
+    histogram.clear()
+    assert histogram.snapshot() == {}
+
+
+def test_LatencyHistogram_as_hook():
+    histogram = LatencyHistogram()
+    add_hook("after", histogram)
+    try:
+        sk = SigningKey.from_secret_exponent(13, curves[0])
+        sk.sign(b"data")
+        sk.sign(b"data")
+    finally:
+        remove_hook("after", histogram)
+
+    data = histogram.snapshot()
+    assert data[(curves[0].name, "sign", "string")]["count"] == 2
+
+
+@pytest.mark.parametrize("protocol", range(pickle.HIGHEST_PROTOCOL + 1))
+def test_pickle_keys(protocol):
+    sk = SigningKey.from_secret_exponent(1234, curves[1])
+    vk = sk.verifying_key
+    # memoised encodings are not pickled
+    vk.to_der()
+
+    sk2 = pickle.loads(pickle.dumps(sk, protocol))
+    vk2 = pickle.loads(pickle.dumps(vk, protocol))
+
+    assert vk2._encodings is None
+    assert vk2.to_string() == vk.to_string()
+    assert sk2.to_string() == sk.to_string()
+    assert sk2.privkey.order == sk.privkey.order
+    sig = sk2.sign_deterministic(b"data")
+    assert sig == sk.sign_deterministic(b"data")
+    assert vk2.verify(sig, b"data")
+    assert sk2.verifying_key.verify(sig, b"data")
+
+
+def test_weakref_keys():
+    sk = SigningKey.from_secret_exponent(1234, curves[1])
+    vk = sk.verifying_key
+
+    for obj in (sk, vk, sk.privkey, vk.pubkey, vk.pubkey.point,
+                vk.pubkey.point.curve()):
+        assert weakref.ref(obj)() is obj
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import pytest
+
+from .curves import NIST256p, NIST192p, UnknownCurveError
+from .keys import SigningKey
+from .keystore import PublicKeyStore, MalformedKeyStoreError
+
+
+SIGNING_KEYS = [SigningKey.from_secret_exponent(i + 1, NIST256p)
+                for i in range(8)]
+
+
+@pytest.fixture
+def tmp_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+
+@pytest.mark.parametrize("encoding",
+                         ["raw", "uncompressed", "compressed", "hybrid"])
+def test_append_and_get(encoding):
+    store = PublicKeyStore(NIST256p, encoding, cache_size=2)
+    for i, sk in enumerate(SIGNING_KEYS):
+        assert store.append(sk.verifying_key, "key-{0}".format(i).encode()) \
+            == i
+
+    assert len(store) == len(SIGNING_KEYS)
+    for i, sk in enumerate(SIGNING_KEYS):
+        vk = store[i]
+        assert vk.pubkey.point == sk.verifying_key.pubkey.point
+        assert store.get("key-{0}".format(i).encode()).pubkey.point \
+            == vk.pubkey.point
+        assert store.get_encoding(i) == vk.to_string(encoding)
+    assert store[-1].pubkey.point == SIGNING_KEYS[-1].verifying_key.pubkey.point
+    assert len(store._cache) == 2
+
+
+@pytest.mark.parametrize("cache_size", [0, 2])
+def test_out_of_range_indexes(cache_size):
+    store = PublicKeyStore(NIST256p, cache_size=cache_size)
+    for sk in SIGNING_KEYS[:3]:
+        store.append(sk.verifying_key)
+
+    assert store[-3].pubkey.point == \
+        SIGNING_KEYS[0].verifying_key.pubkey.point
+    for index in (3, 5, -4, -6, -7):
+        with pytest.raises(IndexError):
+            store[index]
+        with pytest.raises(IndexError):
+            store.get_encoding(index)
+
+
+def test_lru_cache():
+    store = PublicKeyStore(NIST256p, cache_size=2)
+    store.extend(sk.verifying_key for sk in SIGNING_KEYS[:3])
+
+    first = store[0]
+    store[1]
+    assert store[0] is first
+    store[2]
+    # key 1 was least recently used
+    assert list(store._cache) == [0, 2]
+    assert store[0] is first
+
+
+def test_encoded_keys_and_lookup():
+    store = PublicKeyStore(NIST256p, "raw", cache_size=0)
+    store.extend((sk.verifying_key.to_string(), bytearray([i]))
+                 for i, sk in enumerate(SIGNING_KEYS))
+
+    assert bytearray([3]) in store
+    assert b'\xff' not in store
+    assert store.index(b'\x03') == 3
+    assert store.get(b'\xff') is None
+    assert store[3].to_string() == SIGNING_KEYS[3].verifying_key.to_string()
+    assert not store._cache
+
+
+def test_append_invalid_keys():
+    store = PublicKeyStore(NIST256p)
+    store.append(SIGNING_KEYS[0].verifying_key, b'id')
+
+    with pytest.raises(ValueError):
+        store.append(SIGNING_KEYS[1].verifying_key, b'id')
+    with pytest.raises(ValueError):
+        store.append(SigningKey.generate(NIST192p).verifying_key)
+    with pytest.raises(ValueError):
+        store.append(SIGNING_KEYS[1].verifying_key.to_string("raw"))
+    with pytest.raises(IndexError):
+        store[1]
+    with pytest.raises(ValueError):
+        PublicKeyStore(NIST256p, "unknown")
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_save_and_load(tmp_dir, use_mmap):
+    store = PublicKeyStore(NIST256p)
+    for i, sk in enumerate(SIGNING_KEYS):
+        store.append(sk.verifying_key, key_id=b"id" * i if i % 2 else None)
+    path = os.path.join(tmp_dir, "keys.bin")
+    store.save(path)
+
+    loaded = PublicKeyStore.load(path, use_mmap=use_mmap)
+    try:
+        assert loaded.curve is NIST256p
+        assert loaded.encoding == "compressed"
+        assert len(loaded) == len(store)
+        assert loaded.to_bytes() == store.to_bytes()
+        assert loaded.get(b"id" * 3).to_string() == \
+            SIGNING_KEYS[3].verifying_key.to_string()
+        assert [vk.to_string() for vk in loaded] == \
+            [sk.verifying_key.to_string() for sk in SIGNING_KEYS]
+        if use_mmap:
+            with pytest.raises(ValueError):
+                loaded.append(SIGNING_KEYS[0].verifying_key)
+        else:
+            loaded.append(SIGNING_KEYS[0].verifying_key)
+    finally:
+        loaded.close()
+
+
+def test_from_bytes_with_malformed_data():
+    store = PublicKeyStore(NIST256p)
+    store.extend([(SIGNING_KEYS[0].verifying_key, b'a'),
+                  (SIGNING_KEYS[1].verifying_key, b'b')])
+    data = store.to_bytes()
+
+    assert len(PublicKeyStore.from_bytes(data)) == 2
+    for malformed in [data[:-1], data + b'\x00', data[:10],
+                      b'x' + data[1:]]:
+        with pytest.raises(MalformedKeyStoreError):
+            PublicKeyStore.from_bytes(malformed)
+    with pytest.raises(UnknownCurveError):
+        PublicKeyStore.from_bytes(data[:12] + b'\x06\x01\x01' + data[15:])
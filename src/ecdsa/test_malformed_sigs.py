@@ -17,7 +17,10 @@ from .keys import SigningKey
 from .keys import BadSignatureError
 from .util import sigencode_der, sigencode_string
 from .util import sigdecode_der, sigdecode_string
+from .util import sigdecode_der_many, sigdecode_string_many, \
+    MalformedSignature
 from .curves import curves, NIST256p
+from .der import UnexpectedDER
 from .der import encode_integer, encode_bitstring, encode_octet_string, \
     encode_oid, encode_sequence, encode_constructed
 
@@ -301,3 +304,71 @@ def test_fuzzed_string_signatures(params):
 
     with pytest.raises(BadSignatureError):
         verifying_key.verify(sig, example_data, sigdecode=sigdecode_string)
+
+
+def test_sigdecode_string_many_from_list():
+    name, verifying_key, sig = keys_and_string_sigs[0]
+    order = verifying_key.curve.order
+
+    r_values, s_values, valid = sigdecode_string_many(
+        [sig, sig[:-1], bytearray(sig)], order)
+
+    r, s = sigdecode_string(sig, order)
+    assert r_values == [r, 0, r]
+    assert s_values == [s, 0, s]
+    assert valid == [True, False, True]
+
+
+def test_sigdecode_string_many_from_buffer():
+    name, verifying_key, sig = keys_and_string_sigs[0]
+    order = verifying_key.curve.order
+
+    r_values, s_values, valid = sigdecode_string_many(
+        memoryview(sig * 3), order)
+
+    r, s = sigdecode_string(sig, order)
+    assert r_values == [r] * 3
+    assert s_values == [s] * 3
+    assert valid == [True] * 3
+
+
+def test_sigdecode_string_many_with_truncated_buffer():
+    name, verifying_key, sig = keys_and_string_sigs[0]
+
+    with pytest.raises(MalformedSignature):
+        sigdecode_string_many(sig * 2 + b'\x00', verifying_key.curve.order)
+
+
+def test_sigdecode_der_many_from_list():
+    name, verifying_key, sig = keys_and_sigs[0]
+    order = verifying_key.curve.order
+    malformed = encode_sequence(*[encode_integer(1)] * 3)
+
+    r_values, s_values, valid = sigdecode_der_many(
+        [sig, malformed, sig + b'\x00', sig], order)
+
+    r, s = sigdecode_der(sig, order)
+    assert r_values == [r, 0, 0, r]
+    assert s_values == [s, 0, 0, s]
+    assert valid == [True, False, False, True]
+
+
+def test_sigdecode_der_many_from_buffer():
+    name, verifying_key, sig = keys_and_sigs[0]
+    order = verifying_key.curve.order
+    malformed = encode_sequence(encode_integer(1), encode_octet_string(b''))
+
+    r_values, s_values, valid = sigdecode_der_many(
+        sig + malformed + sig, order)
+
+    r, s = sigdecode_der(sig, order)
+    assert r_values == [r, 0, r]
+    assert s_values == [s, 0, s]
+    assert valid == [True, False, True]
+
+
+def test_sigdecode_der_many_with_broken_framing():
+    name, verifying_key, sig = keys_and_sigs[0]
+
+    with pytest.raises(UnexpectedDER):
+        sigdecode_der_many(sig + sig[:-1], verifying_key.curve.order)
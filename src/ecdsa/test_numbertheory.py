@@ -8,16 +8,18 @@ except ImportError:
     import unittest
 import hypothesis.strategies as st
 import pytest
-from hypothesis import given, settings, example
+from hypothesis import given, settings, example, assume
 try:
     from hypothesis import HealthCheck
     HC_PRESENT=True
 except ImportError:
     HC_PRESENT=False
 from .numbertheory import (SquareRootError, factorization, gcd, lcm,
-                           jacobi, inverse_mod,
+                           order_mod, carmichael,
+                           jacobi, quadratic_residues, inverse_mod,
                            is_prime, next_prime, smallprimes,
-                           square_root_mod_prime)
+                           square_root_mod_prime,
+                           inverse_mod_implementations)
 
 
 BIGPRIMES = (999671,
@@ -56,6 +58,34 @@ def test_next_prime_with_nums_less_2(val):
     assert next_prime(val) == 2
 
 
+def test_next_prime_around_smallprimes_limit():
+    assert next_prime(smallprimes[-2]) == smallprimes[-1]
+    assert next_prime(smallprimes[-1]) == 1231
+    assert next_prime(1231) == 1237
+
+
+@pytest.mark.parametrize("composite", [
+    # strong pseudoprimes to bases 2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31
+    # and 37
+    3825123056546413051,
+    318665857834031151167461,
+    3317044064679887385961981,
+    # product of primes bigger than the deterministic test limit
+    1000003 * 1000033 * 1000037 * 1000039 * 1000081,
+    # product of two Mersenne primes
+    (2**521 - 1) * (2**127 - 1)])
+@pytest.mark.parametrize("bpsw", [False, True])
+def test_is_prime_with_pseudoprimes(composite, bpsw):
+    assert not is_prime(composite, bpsw=bpsw)
+
+
+@pytest.mark.parametrize("prime", [2**61 - 1, 2**89 - 1, 2**127 - 1,
+                                   2**255 - 19, 2**521 - 1])
+@pytest.mark.parametrize("bpsw", [False, True])
+def test_is_prime_with_large_primes(prime, bpsw):
+    assert is_prime(prime, bpsw=bpsw)
+
+
 @pytest.mark.parametrize("prime", smallprimes)
 def test_square_root_mod_prime_for_small_primes(prime):
     squares = set()
@@ -73,6 +103,61 @@ def test_square_root_mod_prime_for_small_primes(prime):
             square_root_mod_prime(nonsquare, prime)
 
 
+@pytest.mark.parametrize("prime", [
+    # NIST P-224 prime, p % 8 == 1
+    2**224 - 2**96 + 1,
+    # p - 1 has a large power of 2 as a factor
+    15 * 2**27 + 1,
+    # p % 8 == 1, small
+    7681])
+def test_square_root_mod_prime_with_tonelli_shanks(prime):
+    assert prime % 8 == 1
+    for num in (1, 2, 3, 5, 2**20 + 7, prime // 3, prime - 1):
+        sq = num * num % prime
+        root = square_root_mod_prime(sq, prime)
+        assert root * root % prime == sq
+
+    nonsquare = next(i for i in range(2, prime) if jacobi(i, prime) == -1)
+    with pytest.raises(SquareRootError):
+        square_root_mod_prime(nonsquare, prime)
+
+
+@pytest.mark.parametrize("prime", [2**224 - 2**96 + 1, 2**255 - 19,
+                                   2**521 - 1])
+def test_jacobi_with_euler_criterion(prime):
+    for num in (0, 1, 2, 3, 2**64 + 13, prime // 7, prime - 1, prime + 2):
+        euler = pow(num, (prime - 1) // 2, prime)
+        if euler == prime - 1:
+            euler = -1
+        assert jacobi(num, prime) == euler
+
+
+def test_quadratic_residues():
+    prime = 1229
+    squares = set(i * i % prime for i in range(prime))
+
+    values = list(range(-5, prime + 5))
+    assert quadratic_residues(values, prime) == \
+        [i % prime in squares for i in values]
+
+
+def test_factorization_with_big_factors():
+    assert factorization(2**7 * 1000003**2 * 1000033 * (2**61 - 1)) == \
+        [(2, 7), (1000003, 2), (1000033, 1), (2**61 - 1, 1)]
+    assert factorization(1099511627791 * 1099511627831) == \
+        [(1099511627791, 1), (1099511627831, 1)]
+
+
+def test_order_mod_and_carmichael():
+    with pytest.warns(DeprecationWarning):
+        assert carmichael(1000003 * 1000033) == lcm(1000002, 1000032)
+    with pytest.warns(DeprecationWarning):
+        order = order_mod(2, 1000003 * 1000033)
+    assert pow(2, order, 1000003 * 1000033) == 1
+    for p, _ in factorization(order):
+        assert pow(2, order // p, 1000003 * 1000033) != 1
+
+
 @st.composite
 def st_two_nums_rel_prime(draw):
     # 521-bit is the biggest curve we operate on, use 1024 for a bit
@@ -269,3 +354,17 @@ class TestNumbertheory(unittest.TestCase):
 
     def test_inverse_mod_with_zero(self):
         assert 0 == inverse_mod(0, 11)
+
+    @given(st.integers(min_value=-2**521, max_value=2**521),
+           st.integers(min_value=2, max_value=2**521))
+    def test_inverse_mod_implementations_agree(self, num, mod):
+        assume(num != 0)
+        expected = inverse_mod(num, mod)
+        for name, impl in inverse_mod_implementations():
+            try:
+                inv = impl(num, mod)
+            except (ValueError, ZeroDivisionError):
+                # not invertible, inverse_mod() uses the fallback
+                assert gcd(num, mod) != 1
+                continue
+            assert inv == expected, name
@@ -0,0 +1,465 @@
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+from . import ellipticcurve
+from . import instrument
+from .curves import curves, NIST192p, NIST256p, SECP256k1
+from .keys import SigningKey
+from .precompute import PointTable, MalformedTableError, register, \
+    unregister, get_table, BuildOnce, set_lazy_policy, get_lazy_policy
+from .curves import UnknownCurveError, set_table_budget, get_table_budget, \
+    choose_window, table_size, table_memory_usage
+
+
+@pytest.mark.parametrize("curve", curves, ids=[i.name for i in curves])
+def test_multiply(curve):
+    table = PointTable.build(curve)
+    gen = curve.generator
+
+    for k in [1, 2, 15, 16, 17, 2**100 + 3, curve.order - 1, curve.order,
+              curve.order + 5, -7]:
+        assert table.multiply(k) == gen * k
+
+
+@pytest.mark.parametrize("window", [1, 2, 3, 5, 8])
+def test_window_widths(window):
+    table = PointTable.build(NIST192p, window=window)
+
+    assert len(table) == table.windows * (2 ** window - 1)
+    assert table.multiply(123456789) == NIST192p.generator * 123456789
+
+
+def test_invalid_window():
+    with pytest.raises(ValueError):
+        PointTable.build(NIST192p, window=0)
+
+
+def test_table_of_public_key():
+    point = SigningKey.from_secret_exponent(1234, NIST192p) \
+        .verifying_key.pubkey.point
+    table = PointTable.build(NIST192p, point)
+
+    assert table.point() == point
+    assert table.multiply(99) == point * 99
+
+
+def test_registered_table_is_used():
+    table = PointTable.build(SECP256k1)
+    sk = SigningKey.from_secret_exponent(1234, SECP256k1)
+    sig = sk.sign_deterministic(b"data")
+
+    register(table)
+    try:
+        assert get_table(SECP256k1) is table
+        sk2 = SigningKey.from_secret_exponent(1234, SECP256k1)
+        assert sk2.verifying_key.to_string() == sk.verifying_key.to_string()
+        with instrument.count() as counters:
+            assert sk2.sign_deterministic(b"data") == sig
+        assert sk2.verifying_key.verify(sig, b"data")
+    finally:
+        unregister(table)
+
+    assert counters["point_mul"] == 1
+    assert counters["point_double"] == 0
+    assert get_table(SECP256k1) is None
+
+
+def test_table_not_used_for_other_curve_with_same_prime(clean_registry):
+    gen = NIST192p.generator
+    curve = NIST192p.curve
+    p = curve.p()
+    # a different curve with the same prime that contains the generator
+    other_curve = ellipticcurve.CurveFp(p, (curve.a() + 1) % p,
+                                        (curve.b() - gen.x()) % p)
+    point = ellipticcurve.Point(other_curve, gen.x(), gen.y())
+    expected = point * 12345
+
+    register(PointTable.build(NIST192p))
+
+    assert gen * 12345 == PointTable.build(NIST192p).multiply(12345)
+    assert point * 12345 == expected
+    assert (point * 12345).curve() is other_curve
+
+
+def test_to_bytes_and_from_bytes():
+    table = PointTable.build(NIST256p, window=3)
+    data = table.to_bytes()
+
+    loaded = PointTable.from_bytes(data)
+
+    assert loaded.curve is NIST256p
+    assert loaded.window == 3
+    assert loaded.key() == table.key()
+    assert loaded.to_bytes() == data
+    assert loaded.multiply(2**200 + 1) == table.multiply(2**200 + 1)
+
+
+def test_from_bytes_with_malformed_data():
+    data = PointTable.build(NIST192p, window=2).to_bytes()
+
+    with pytest.raises(MalformedTableError):
+        PointTable.from_bytes(data[:10])
+    with pytest.raises(MalformedTableError):
+        PointTable.from_bytes(b"X" + data[1:])
+    with pytest.raises(MalformedTableError):
+        PointTable.from_bytes(data[:-1])
+    with pytest.raises(MalformedTableError):
+        # first point not on the curve
+        PointTable.from_bytes(data[:-len(data) + 30] + b"\x01" +
+                              data[31:])
+    with pytest.raises(UnknownCurveError):
+        PointTable.from_bytes(data[:20] + b"\x00" + data[21:])
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_save_and_load(use_mmap):
+    table = PointTable.build(NIST192p)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, "table.bin")
+        table.save(path)
+
+        loaded = PointTable.load(path, use_mmap=use_mmap)
+
+        assert loaded.multiply(12345) == table.multiply(12345)
+        loaded.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_load_with_default_arguments():
+    table = PointTable.build(NIST192p, window=2)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, "table.bin")
+        table.save(path)
+
+        loaded = PointTable.load(path)
+
+        assert loaded.to_bytes() == table.to_bytes()
+        assert loaded.multiply(12345) == table.multiply(12345)
+        loaded.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_load_without_buffer_support_in_mmap(monkeypatch):
+    # mmap objects on Python 2 can't be wrapped in memoryview
+    maps = []
+
+    class NoBufferMmap(object):
+        def __init__(self, *args, **kwargs):
+            self.closed = False
+            maps.append(self)
+
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(mmap, "mmap", NoBufferMmap)
+    table = PointTable.build(NIST192p, window=2)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, "table.bin")
+        table.save(path)
+
+        loaded = PointTable.load(path)
+
+        assert loaded.to_bytes() == table.to_bytes()
+        assert len(maps) == 1 and maps[0].closed
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def _worker(name, queue):
+    table = PointTable.from_shared_memory(name)
+    register(table)
+    sk = SigningKey.from_secret_exponent(1234, NIST192p)
+    queue.put(sk.verifying_key.to_string())
+    unregister(table)
+    table.close()
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8),
+                    reason="shared memory requires Python 3.8")
+def test_shared_memory_with_spawned_worker():
+    import multiprocessing
+
+    table = PointTable.build(NIST192p)
+    shm = table.to_shared_memory()
+    try:
+        attached = PointTable.from_shared_memory(shm.name)
+        assert attached.to_bytes() == table.to_bytes()
+        attached.close()
+
+        ctx = multiprocessing.get_context("spawn")
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_worker, args=(shm.name, queue))
+        proc.start()
+        result = queue.get(timeout=60)
+        proc.join()
+
+        assert proc.exitcode == 0
+        assert result == SigningKey.from_secret_exponent(
+            1234, NIST192p).verifying_key.to_string()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+@pytest.fixture
+def clean_registry():
+    saved = dict(ellipticcurve._precomputed)
+    policy = get_lazy_policy()
+    ellipticcurve._precomputed.clear()
+    try:
+        yield ellipticcurve._precomputed
+    finally:
+        set_table_budget(None)
+        for curve in curves:
+            set_table_budget(None, curve)
+        ellipticcurve._precomputed.clear()
+        ellipticcurve._precomputed.update(saved)
+        set_lazy_policy(policy)
+
+
+def _run_threads(func, count=32):
+    start = threading.Event()
+    results = []
+    errors = []
+
+    def run():
+        start.wait()
+        try:
+            results.append(func())
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for t in threads:
+        t.start()
+    start.set()
+    for t in threads:
+        t.join()
+    assert not errors
+    return results
+
+
+def test_BuildOnce_builds_once_with_many_threads():
+    calls = []
+
+    def build():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+    once = BuildOnce(build)
+
+    results = _run_threads(once.get)
+
+    assert len(calls) == 1
+    assert len(results) == 32
+    assert all(i is results[0] for i in results)
+    assert once.ready
+
+
+def test_BuildOnce_fallback_while_building():
+    started = threading.Event()
+    finish = threading.Event()
+
+    def build():
+        started.set()
+        finish.wait()
+        return "value"
+    once = BuildOnce(build)
+    builder = threading.Thread(target=once.get)
+    builder.start()
+    started.wait()
+
+    results = _run_threads(lambda: once.get("fallback"), 8)
+    finish.set()
+    builder.join()
+
+    assert results == [None] * 8
+    assert once.get("fallback") == "value"
+
+
+def test_BuildOnce_retries_after_error():
+    calls = []
+
+    def build():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ValueError("first build fails")
+        return "value"
+    once = BuildOnce(build)
+
+    with pytest.raises(ValueError):
+        once.get()
+    assert not once.ready
+    assert once.get() == "value"
+    assert len(calls) == 2
+
+
+def test_set_lazy_policy(clean_registry):
+    set_lazy_policy("fallback")
+    assert get_lazy_policy() == "fallback"
+    with pytest.raises(ValueError):
+        set_lazy_policy("spin")
+
+
+@pytest.mark.parametrize("policy", ["block", "fallback"])
+def test_lazy_table_with_many_threads(clean_registry, monkeypatch, policy):
+    builds = []
+    original = PointTable.build
+
+    def counting_build(*args, **kwargs):
+        builds.append(1)
+        time.sleep(0.05)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(PointTable, "build", counting_build)
+    set_lazy_policy(policy)
+    sk = SigningKey.from_secret_exponent(1234, NIST192p)
+    expected = sk.sign_deterministic(b"data")
+
+    tables = _run_threads(lambda: NIST192p.precompute(lazy=True), 16)
+    assert all(i is tables[0] for i in tables)
+    assert not tables[0].ready
+
+    sigs = _run_threads(lambda: sk.sign_deterministic(b"data"))
+
+    assert sigs == [expected] * 32
+    assert len(builds) == 1
+    assert tables[0].ready
+    assert get_table(NIST192p) is tables[0]
+
+
+def test_precompute_of_keys(clean_registry):
+    sk = SigningKey.from_secret_exponent(1234, NIST192p)
+    vk = sk.verifying_key
+    sig = sk.sign_deterministic(b"data")
+
+    tables = _run_threads(vk.precompute, 8)
+    assert all(i is tables[0] for i in tables)
+    assert tables[0].ready
+    assert sk.precompute() is get_table(NIST192p)
+    assert get_table(NIST192p, vk.pubkey.point) is tables[0]
+
+    with instrument.count() as counters:
+        assert vk.verify(sig, b"data")
+    assert counters["point_double"] == 0
+
+
+def test_table_size():
+    for window in (1, 4, 8):
+        assert table_size(NIST192p, window) == \
+            PointTable.build(NIST192p, window=window).size
+
+
+def test_choose_window(clean_registry):
+    assert choose_window(NIST256p) == 4
+    assert choose_window(NIST256p, per_key=True) == 4
+
+    set_table_budget(2 * table_size(NIST256p, 5))
+    assert choose_window(NIST256p) == 5
+    # even the smallest table doesn't fit in 1/16 of the budget
+    assert choose_window(NIST256p, per_key=True) is None
+
+    set_table_budget(16 * table_size(NIST256p, 3))
+    assert choose_window(NIST256p) == 7
+    assert choose_window(NIST256p, per_key=True) == 3
+
+    set_table_budget(10 ** 9)
+    assert choose_window(NIST256p) == 8
+
+    set_table_budget(100)
+    assert choose_window(NIST256p) is None
+    assert NIST256p.precompute() is None
+    assert table_memory_usage() == 0
+
+
+def test_get_table_budget(clean_registry):
+    assert get_table_budget() is None
+    assert get_table_budget(NIST192p) is None
+
+    set_table_budget(1000, NIST192p)
+    assert get_table_budget() is None
+    assert get_table_budget(NIST192p) == 1000
+    assert get_table_budget(NIST256p) is None
+
+    set_table_budget(500)
+    assert get_table_budget(NIST192p) == 500
+    assert get_table_budget(NIST256p) == 500
+
+    with pytest.raises(ValueError):
+        set_table_budget(-1)
+
+
+def _verifying_keys(count):
+    keys = []
+    for i in range(count):
+        sk = SigningKey.from_secret_exponent(1000 + i, NIST192p)
+        keys.append((sk.verifying_key, sk.sign_deterministic(b"data")))
+    return keys
+
+
+def test_key_tables_evicted_in_lru_order(clean_registry):
+    budget = 16 * table_size(NIST192p, 2)
+    set_table_budget(budget, NIST192p)
+    generator_table = NIST192p.precompute(lazy=True)
+    key_size = table_size(NIST192p, 2)
+    fitting = (budget - generator_table.size) // key_size
+    keys = _verifying_keys(fitting + 3)
+
+    tables = [vk.precompute(lazy=True) for vk, _ in keys[:fitting]]
+    assert all(i.window == 2 for i in tables)
+    assert table_memory_usage(NIST192p) == \
+        generator_table.size + fitting * key_size
+    # use the first key so that the second one is the least recently used
+    vk, sig = keys[0]
+    assert vk.verify(sig, b"data")
+
+    for vk, sig in keys[fitting:]:
+        assert vk.precompute(lazy=True) is not None
+        assert table_memory_usage(NIST192p) <= budget
+
+    registered = [get_table(NIST192p, vk.pubkey.point) is not None
+                  for vk, _ in keys]
+    assert registered == [True, False, False, False] + [True] * (fitting - 1)
+    assert get_table(NIST192p) is generator_table
+    # evicted tables only stop being used, verification still works
+    for vk, sig in keys:
+        assert vk.verify(sig, b"data")
+
+
+def test_lower_budget_evicts_key_tables(clean_registry):
+    generator_table = NIST192p.precompute(lazy=True)
+    keys = _verifying_keys(3)
+    for vk, _ in keys:
+        vk.precompute(lazy=True)
+    assert table_memory_usage(NIST192p) == 4 * generator_table.size
+    assert table_memory_usage() >= table_memory_usage(NIST192p)
+
+    set_table_budget(generator_table.size + 100, NIST192p)
+
+    assert table_memory_usage(NIST192p) == generator_table.size
+    assert get_table(NIST192p) is generator_table
+
+
+def test_global_budget_covers_all_curves(clean_registry):
+    set_table_budget(2 * table_size(NIST192p, 4) + 1000)
+    vk192 = _verifying_keys(1)[0][0]
+    sk256 = SigningKey.from_secret_exponent(1234, NIST256p)
+
+    assert vk192.precompute(window=4) is not None
+    assert sk256.verifying_key.precompute(window=4) is not None
+    assert NIST192p.precompute(window=4) is not None
+
+    assert table_memory_usage() <= get_table_budget()
+    assert get_table(NIST192p) is not None
+    assert get_table(NIST192p, vk192.pubkey.point) is None
@@ -7,6 +7,7 @@ except ImportError:
 import os
 import time
 import shutil
+import threading
 import subprocess
 import pytest
 from binascii import hexlify, unhexlify
@@ -1025,6 +1026,16 @@ class Util(unittest.TestCase):
         self.assertEqual(("%x" % (tta("seed", NIST224p.order))).encode(),
                          b("6fa59d73bf0446ae8743cf748fc5ac11d5585a90356417e97155c3bc"))
 
+    def test_prng_stream(self):
+        # PRNG output is used for deriving keys, it must not change
+        expected = unhexlify(b("206fa59d73bf0446ae8743cf748fc5ac11d5585a90"
+                               "356417e97155c3bba527d43c4feff4a3b6e11f"))
+        self.assertEqual(util.PRNG("seed")(40), expected)
+
+        prng = util.PRNG("seed")
+        chunks = [prng(i) for i in (1, 0, 31, 1, 7)]
+        self.assertEqual(b("").join(chunks), expected)
+
     def test_randrange(self):
         # util.randrange does not provide long-term stability: we might
         # change the algorithm in the future.
@@ -1037,6 +1048,80 @@ class Util(unittest.TestCase):
                 n = util.randrange(order, entropy=entropy)
                 self.assertTrue(1 <= n < order, (1, n, order))
 
+    def test_randrange_number_of_tries(self):
+        # worst case for the byte-wise generation of candidates
+        order = 2**16 + 1
+        calls = []
+
+        def entropy(numbytes):
+            calls.append(numbytes)
+            return os.urandom(numbytes)
+
+        for i in range(1000):
+            n = util.randrange(order, entropy=entropy)
+            self.assertTrue(1 <= n < order, (1, n, order))
+        self.assertTrue(len(calls) < 2 * 1000 + 200, len(calls))
+
+    def test_randrange_with_order_2(self):
+        self.assertEqual(util.randrange(2), 1)
+
+    def test_entropy_pool(self):
+        reads = []
+
+        def source(numbytes):
+            reads.append(numbytes)
+            return os.urandom(numbytes)
+
+        pool = util.EntropyPool(block_size=64, source=source)
+        data = [pool(10) for _ in range(20)]
+
+        self.assertEqual([len(i) for i in data], [10] * 20)
+        self.assertEqual(len(set(data)), 20)
+        # 6 requests fit in a single block
+        self.assertEqual(reads, [64] * 4)
+        self.assertEqual(len(pool(100)), 100)
+        self.assertEqual(reads[-1], 100)
+
+    def test_entropy_pool_with_threads(self):
+        pool = util.EntropyPool(block_size=256)
+        results = []
+
+        def worker():
+            results.extend(pool(16) for _ in range(200))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(results), 8 * 200)
+        self.assertEqual(len(set(results)), 8 * 200)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires os.fork()")
+    def test_entropy_pool_after_fork(self):
+        pool = util.EntropyPool()
+        pool(16)
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            os.close(read_end)
+            os.write(write_end, pool(16))
+            os._exit(0)
+        os.close(write_end)
+        child_data = os.read(read_end, 16)
+        os.close(read_end)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(len(child_data), 16)
+        self.assertNotEqual(child_data, pool(16))
+
+    def test_generate_with_entropy_pool(self):
+        pool = util.EntropyPool()
+        sk = SigningKey.generate(entropy=pool)
+        sig = sk.sign(b("data"), entropy=pool)
+        self.assertTrue(sk.verifying_key.verify(sig, b("data")))
+
     def OFF_test_prove_uniformity(self):
         order = 2**8 - 2
         counts = dict([(i, 0) for i in range(1, order)])
@@ -1189,6 +1274,27 @@ class RFC6979(unittest.TestCase):
             hash_func=sha512,
             expected=int("16200813020EC986863BEDFC1B121F605C1215645018AEA1A7B215A564DE9EB1B38A67AA1128B80CE391C4FB71187654AAA3431027BFC7F395766CA988C964DC56D", 16))
 
+    def test_with_precomputed_secexp_octets(self):
+        secexp = int("0FAD06DAA62BA3B25D2FB40133DA757205DE67F5BB0018FEE8C86E1B68C7E75CAA896EB32F1F47C70855836A6D16FCC1466F6D8FBEC67DB89EC0C08B0E996B83538", 16)
+        order = NIST521p.order
+        hsh = sha1(b("sample")).digest()
+
+        k = rfc6979.generate_k(
+            order, secexp, sha1, hsh,
+            secexp_octets=util.number_to_string(secexp, order))
+
+        self.assertEqual(k, int("089C071B419E1C2820962321787258469511958E80582E95D8378E0C2CCDB3CB42BEDE42F50E3FA3C71F5A76724281D31D9C89F0F91FC1BE4918DB1C03A5838D0F9", 16))
+
+    def test_with_precomputed_qlen(self):
+        secexp = int("0FAD06DAA62BA3B25D2FB40133DA757205DE67F5BB0018FEE8C86E1B68C7E75CAA896EB32F1F47C70855836A6D16FCC1466F6D8FBEC67DB89EC0C08B0E996B83538", 16)
+        hsh = sha1(b("sample")).digest()
+
+        k = rfc6979.generate_k(
+            NIST521p.order, secexp, sha1, hsh,
+            qlen=NIST521p.ctx.order_bits)
+
+        self.assertEqual(k, int("089C071B419E1C2820962321787258469511958E80582E95D8378E0C2CCDB3CB42BEDE42F50E3FA3C71F5A76724281D31D9C89F0F91FC1BE4918DB1C03A5838D0F9", 16))
+
 class ECDH(unittest.TestCase):
     def _do(self, curve, generator, dA, x_qA, y_qA, dB, x_qB, y_qB, x_Z, y_Z):
         qA = dA * generator
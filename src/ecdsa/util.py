@@ -3,8 +3,10 @@ from __future__ import division
 import os
 import math
 import binascii
+import threading
+import weakref
 from hashlib import sha256
-from six import PY3, int2byte, b, next
+from six import int2byte, b
 from . import der
 from ._compat import normalise_bytes
 
@@ -17,50 +19,52 @@ oid_ecPublicKey = (1, 2, 840, 10045, 2, 1)
 encoded_oid_ecPublicKey = der.encode_oid(*oid_ecPublicKey)
 
 
-def bit_length(num):
-    # http://docs.python.org/dev/library/stdtypes.html#int.bit_length
-    s = bin(num)  # binary representation:  bin(-37) --> '-0b100101'
-    s = s.lstrip('-0b')  # remove leading zeros and minus sign
-    return len(s)  # len('100101') --> 6
+try:
+    (0).bit_length()
+
+    def bit_length(num):
+        # http://docs.python.org/dev/library/stdtypes.html#int.bit_length
+        return num.bit_length()
+except AttributeError:  # pragma: no cover
+    # Python 2.6 integers don't have bit_length()
+    def bit_length(num):
+        s = bin(num)  # binary representation:  bin(-37) --> '-0b100101'
+        s = s.lstrip('-0b')  # remove leading zeros and minus sign
+        return len(s)  # len('100101') --> 6
 
 
 def orderlen(order):
-    return (1+len("%x" % order))//2  # bytes
+    return (bit_length(order) + 7) // 8 or 1  # bytes
 
 
 def randrange(order, entropy=None):
     """Return a random integer k such that 1 <= k < order, uniformly
-    distributed across that range. For simplicity, this only behaves well if
-    'order' is fairly close (but below) a power of 256. The try-try-again
-    algorithm we use takes longer and longer time (on average) to complete as
-    'order' falls, rising to a maximum of avg=512 loops for the worst-case
-    (256**k)+1 . All of the standard curves behave well. There is a cutoff at
-    10k loops (which raises RuntimeError) to prevent an infinite loop when
-    something is really broken like the entropy function not working.
+    distributed across that range. The candidates are generated bit-wise:
+    the random bytes are masked to the bit length of the largest acceptable
+    value, so the try-try-again algorithm we use needs, on average, less
+    than 2 loops for any order. There is a cutoff at 10k loops (which raises
+    RuntimeError) to prevent an infinite loop when something is really
+    broken like the entropy function not working.
 
     Note that this function is not declared to be forwards-compatible: we may
     change the behavior in future releases. The entropy= argument (which
     should get a callable that behaves like os.urandom) can be used to
     achieve stability within a given release (for repeatable unit tests), but
     should not be used as a long-term-compatible key generation algorithm.
+    An :class:`EntropyPool` can be used as the entropy= argument to avoid
+    a system call for every generated number.
     """
-    # we could handle arbitrary orders (even 256**k+1) better if we created
-    # candidates bit-wise instead of byte-wise, which would reduce the
-    # worst-case behavior to avg=2 loops, but that would be more complex. The
-    # change would be to round the order up to a power of 256, subtract one
-    # (to get 0xffff..), use that to get a byte-long mask for the top byte,
-    # generate the len-1 entropy bytes, generate one extra byte and mask off
-    # the top bits, then combine it with the rest. Requires jumping back and
-    # forth between strings and integers a lot.
-
     if entropy is None:
         entropy = os.urandom
     assert order > 1
-    bytes = orderlen(order)
-    dont_try_forever = 10000  # gives about 2**-60 failures for worst case
+    # candidate - 1 needs to be in the range [0, order - 2]
+    bits = bit_length(order - 2)
+    bytes = max(1, (bits + 7) // 8)
+    mask = lsb_of_ones(bits)
+    dont_try_forever = 10000  # gives about 2**-10000 failures for worst case
     while dont_try_forever > 0:
         dont_try_forever -= 1
-        candidate = string_to_number(entropy(bytes)) + 1
+        candidate = (string_to_number(entropy(bytes)) & mask) + 1
         if 1 <= candidate < order:
             return candidate
         continue
@@ -69,6 +73,74 @@ def randrange(order, entropy=None):
                        " %x" % order)
 
 
+class EntropyPool(object):
+    """
+    Buffered source of random bytes from the operating system.
+
+    The pool reads blocks of `block_size` bytes from `source` and hands
+    out slices of them, so that generating many keys or signatures doesn't
+    require a system call for every one of them. Bytes are never handed out
+    twice and they are overwritten in the buffer as soon as they are used.
+
+    The object can be called like :func:`os.urandom`, so it can be used as
+    the `entropy=` argument of :func:`randrange`,
+    :func:`ecdsa.keys.SigningKey.generate` and
+    :func:`ecdsa.keys.SigningKey.sign`.
+
+    It's safe to use from multiple threads, and after a :func:`os.fork` the
+    child process discards the buffer inherited from the parent, so the
+    two processes never use the same random bytes.
+
+    :param int block_size: number of bytes read from `source` at a time,
+        requests for more bytes than that are passed to `source` directly
+    :param callable source: function returning the requested number of
+        random bytes, os.urandom by default
+    """
+
+    def __init__(self, block_size=4096, source=None):
+        self._block_size = block_size
+        self._source = source or os.urandom
+        self._reset()
+        _entropy_pools[id(self)] = self
+
+    def _reset(self):
+        """Drop the buffered bytes (and any lock held by other threads)."""
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._offset = 0
+        self._pid = os.getpid()
+
+    def __call__(self, numbytes):
+        """Return `numbytes` random bytes."""
+        if numbytes > self._block_size:
+            return self._source(numbytes)
+        if self._pid != os.getpid():
+            # fallback for platforms without os.register_at_fork()
+            self._reset()
+        with self._lock:
+            end = self._offset + numbytes
+            if end > len(self._buffer):
+                self._buffer[:] = self._source(self._block_size)
+                self._offset = 0
+                end = numbytes
+            ret = bytes(self._buffer[self._offset:end])
+            self._buffer[self._offset:end] = bytearray(numbytes)
+            self._offset = end
+        return ret
+
+
+_entropy_pools = weakref.WeakValueDictionary()
+
+
+def _reset_entropy_pools():
+    for pool in list(_entropy_pools.values()):
+        pool._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_entropy_pools)
+
+
 class PRNG:
     # this returns a callable which, when invoked with an integer N, will
     # return N pseudorandom bytes. Note: this is a short-term PRNG, meant
@@ -76,17 +148,30 @@ class PRNG:
     # only needs to run it a few times per seed. It does not provide
     # protection against state compromise (forward security).
     def __init__(self, seed):
-        self.generator = self.block_generator(seed)
+        # the blocks are hashes of "prng-<counter>-<seed>", so everything
+        # after the counter is the same for all of them
+        self._seed_suffix = ("-%s" % (seed,)).encode()
+        self._counter = 0
+        self._buffer = b""
 
     def __call__(self, numbytes):
-        a = [next(self.generator) for i in range(numbytes)]
-
-        if PY3:
-            return bytes(a)
-        else:
-            return "".join(a)
+        buf = self._buffer
+        if len(buf) < numbytes:
+            blocks = [buf]
+            counter = self._counter
+            suffix = self._seed_suffix
+            # sha256 digests are 32 bytes long
+            end = counter + (numbytes - len(buf) + 31) // 32
+            for counter in range(counter, end):
+                prefix = ("prng-%d" % counter).encode()
+                blocks.append(sha256(prefix + suffix).digest())
+            self._counter = counter + 1
+            buf = b"".join(blocks)
+        self._buffer = buf[numbytes:]
+        return buf[:numbytes]
 
     def block_generator(self, seed):
+        # not used by __call__() any more, kept for backwards compatibility
         counter = 0
         while True:
             for byte in sha256(("prng-%d-%s" % (counter, seed)).encode()).digest():
@@ -205,6 +290,9 @@ def string_to_number_fixedlen(string, order):
 # these methods are useful for the sigencode= argument to SK.sign() and the
 # sigdecode= argument to VK.verify(), and control how the signature is packed
 # or unpacked.
+# They get the order of the curve, not the curve, as that's the interface of
+# the sigencode= and sigdecode= callbacks, so they can't use the constants
+# cached in Curve.ctx; orderlen() is a single int.bit_length() call though.
 
 def sigencode_strings(r, s, order):
     r_str = number_to_string(r, order)
@@ -404,3 +492,116 @@ def sigdecode_der(sig_der, order):
         raise der.UnexpectedDER("trailing junk after DER numbers: %s" %
                                 binascii.hexlify(empty))
     return r, s
+
+
+def _split_signatures(signatures, length):
+    """
+    Return a list of signatures from a buffer or an iterable of signatures.
+
+    If `signatures` is a single bytes-like object, it's treated as
+    a concatenation of `length` long signatures.
+    """
+    try:
+        buf = normalise_bytes(signatures)
+    except TypeError:
+        return [normalise_bytes(i) for i in signatures]
+    if len(buf) % length:
+        raise MalformedSignature(
+            "Invalid length of signature buffer, expected a multiple of "
+            "{0} bytes, provided buffer is {1} bytes long"
+            .format(length, len(buf)))
+    return [buf[i:i + length] for i in range(0, len(buf), length)]
+
+
+def sigdecode_string_many(signatures, order):
+    """
+    Decoder for multiple :term:`raw encoding` ECDSA signatures.
+
+    Equivalent to calling :func:`sigdecode_string` for every signature,
+    but with the length checks done once and without raising exceptions
+    for the individual malformed signatures, so that the output can be fed
+    directly to batch verification.
+
+    :param signatures: either a single bytes-like object with concatenated
+        raw encodings of signatures or an iterable of bytes-like objects,
+        each with a single encoded signature
+    :param order: order of the curve over which the signatures were computed
+    :type order: int
+
+    :raises MalformedSignature: when the length of concatenated signatures
+        is not a multiple of the raw signature length
+
+    :return: list of 'r' values, list of 's' values and list of booleans
+        that indicate if the signature at a given position was well formed,
+        'r' and 's' of malformed signatures are set to 0
+    :rtype: tuple of three lists
+    """
+    length = orderlen(order)
+    sig_len = 2 * length
+    hexlify = binascii.hexlify
+    r_values = []
+    s_values = []
+    valid = []
+    for sig in _split_signatures(signatures, sig_len):
+        if len(sig) != sig_len:
+            r_values.append(0)
+            s_values.append(0)
+            valid.append(False)
+            continue
+        r_values.append(int(hexlify(sig[:length]), 16))
+        s_values.append(int(hexlify(sig[length:]), 16))
+        valid.append(True)
+    return r_values, s_values, valid
+
+
+def sigdecode_der_many(signatures, order):
+    """
+    Decoder for multiple DER encoded ECDSA signatures.
+
+    Equivalent to calling :func:`sigdecode_der` for every signature,
+    but without raising exceptions for the individual malformed
+    signatures, so that the output can be fed directly to batch
+    verification.
+
+    :param signatures: either a single bytes-like object with concatenated
+        DER encodings of signatures or an iterable of bytes-like objects,
+        each with a single encoded signature
+    :param order: order of the curve over which the signatures were computed
+    :type order: int
+
+    :raises UnexpectedDER: when the concatenated signatures can't be split
+        into separate DER SEQUENCE objects
+
+    :return: list of 'r' values, list of 's' values and list of booleans
+        that indicate if the signature at a given position was well formed,
+        'r' and 's' of malformed signatures are set to 0
+    :rtype: tuple of three lists
+    """
+    try:
+        buf = normalise_bytes(signatures)
+    except TypeError:
+        sig_list = [normalise_bytes(i) for i in signatures]
+    else:
+        # we need to find the boundaries of the SEQUENCE objects, errors in
+        # the contents of them will be handled below
+        sig_list = []
+        while buf:
+            body, rest = der.remove_sequence(buf)
+            sig_list.append(buf[:len(buf) - len(rest)])
+            buf = rest
+
+    r_values = []
+    s_values = []
+    valid = []
+    for sig in sig_list:
+        try:
+            r, s = sigdecode_der(sig, order)
+        except der.UnexpectedDER:
+            r_values.append(0)
+            s_values.append(0)
+            valid.append(False)
+        else:
+            r_values.append(r)
+            s_values.append(s)
+            valid.append(True)
+    return r_values, s_values, valid